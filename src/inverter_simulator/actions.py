@@ -0,0 +1,100 @@
+from enum import IntEnum
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+
+class Action(IntEnum):
+    AUTO = 0
+    CHARGE = 1
+    DISCHARGE = 2
+    STOPPED = 3
+    FULLSTOP = 4
+    EXPORT0 = 5
+    EXPORT200 = 6
+    EXPORT = 7
+    EXPORT100 = 8
+    IMPORT = 9
+    IMPORT_NO_SOLAR = 10
+    IMPORT_AT_MAX = 11
+
+
+# auto_api_curtail runs as auto; its feed-in limit only applies through the params
+ACTION_NAMES = {action.name.lower(): action for action in Action}
+ACTION_NAMES['auto_api_curtail'] = Action.AUTO
+
+# Actions that curtail all solar, matched on the action exactly as returned by the control function
+SOLAR_CURTAILING_ACTIONS = ('import_no_solar', 'fullstop')
+
+
+class ParsedAction(NamedTuple):
+    action: Action
+    # The normalised name when it is not a known action and auto is run instead, otherwise None
+    invalid: Any
+    curtails_solar: bool
+
+
+def _parse_action(action: Any) -> ParsedAction:
+    curtails_solar = action in SOLAR_CURTAILING_ACTIONS
+    if action is None:
+        return ParsedAction(Action.AUTO, None, curtails_solar)
+    name = str(action).lower()
+    if '-' in name:
+        name = name.split('-')[0]
+    if name in ACTION_NAMES:
+        return ParsedAction(ACTION_NAMES[name], None, curtails_solar)
+    return ParsedAction(Action.AUTO, name, curtails_solar)
+
+
+_parse_cached = lru_cache(maxsize=1024)(_parse_action)
+
+
+def parse_action(action: Any) -> ParsedAction:
+    """Parse an action as returned by a control function (case and any '-reason' suffix ignored).
+
+    Parsed once per distinct action; unhashable actions are parsed every time.
+    """
+    try:
+        return _parse_cached(action)
+    except TypeError:
+        return _parse_action(action)
+
+
+def _is_missing(action: Any) -> bool:
+    return action is pd.NA or action is pd.NaT or (isinstance(action, (float, np.floating)) and np.isnan(action))
+
+
+class ActionCategories:
+    """Actions of a run stored as small integer codes into the distinct actions seen, in first-seen order.
+
+    The output column is a pandas Categorical of the actions exactly as returned; None, NaN and
+    pd.NA are missing.
+    """
+
+    def __init__(self, categories: List[str] = ()) -> None:
+        self.categories: List[str] = []
+        self._codes: Dict[Any, int] = {None: -1}
+        for category in categories:
+            self.code(category)
+
+    def code(self, action: Any) -> int:
+        try:
+            code = self._codes.get(action)
+        except TypeError:
+            # Unhashable, e.g. a list from a buggy control function: stored by its text, run as auto
+            return self.code(str(action))
+        if code is None:
+            if _is_missing(action):
+                # Never a category: pandas rejects null categories, and each NaN is a key of its own
+                return -1
+            code = self._codes[action] = len(self.categories)
+            self.categories.append(action)
+        return code
+
+    def encode(self, actions: Any) -> np.ndarray:
+        return np.fromiter((self.code(action) for action in actions), dtype=np.int16, count=len(actions))
+
+    def to_categorical(self, codes: np.ndarray) -> pd.Categorical:
+        return pd.Categorical.from_codes(codes, categories=pd.Index(self.categories, dtype=object))
@@ -1,4 +1,15 @@
+from typing import Any, Optional, Sequence
+
+import numpy as np
+
+
 class Battery:
+    """A battery charged and discharged in watts for one interval at a time.
+
+    Energy is power times the interval's hours, so interval is the data's resolution in minutes:
+    5 for 5 minute data, 30 for half hourly. The methods take an interval to override it.
+    """
+
     def __init__(self, capacity: float = 5000, charge_rate: float = 5000, initial_charge: float = None,
                  loss_rate: float = 5, min_soc: int = 10, interval: int = 5) -> None:
         self.capacity = capacity
@@ -16,23 +27,24 @@ class Battery:
     def soc(self) -> float:
         return (self.charge / self.capacity) * 100
 
-    def charge_battery(self, amount: float, interval: int = 5) -> float:
-        per_hour = 60 / interval
+    def charge_battery(self, amount: float, interval: Optional[int] = None) -> float:
+        per_hour = 60 / (interval or self.interval)
         charge_ability = min(self.charge_rate, max(0, self.capacity - self.charge) * per_hour)
         actual_charge = max(0, min(amount, charge_ability))
         charge_minus_loss = actual_charge * ((100 - self.loss_rate) / 100)
-        self.charge = min(self.capacity, self.charge + (charge_minus_loss / 12))
+        self.charge = min(self.capacity, self.charge + (charge_minus_loss / per_hour))
         # print(f'Charging battery: {actual_charge}W, new charge: {self.charge}Wh')
         return actual_charge
 
-    def discharge_ability(self, interval: int = 5) -> float:
-        per_hour = 60 / interval
+    def discharge_ability(self, interval: Optional[int] = None) -> float:
+        per_hour = 60 / (interval or self.interval)
         return min(self.discharge_rate, max(0, self.charge - self.min_charge) * per_hour)
 
-    def discharge_battery(self, amount: float, interval: int = 5, feed_in_power_limitation=None) -> float:
+    def discharge_battery(self, amount: float, interval: Optional[int] = None, feed_in_power_limitation=None) -> float:
         if self.discharge_rate is None or self.charge is None:
             print(self.discharge_rate, self.charge)
             raise ValueError("Charge rate and charge must be set to discharge")
+        per_hour = 60 / (interval or self.interval)
         discharge_ability = self.discharge_ability(interval)
         if feed_in_power_limitation is not None and feed_in_power_limitation < amount:
             discharge_ability = min(self.discharge_ability(interval), feed_in_power_limitation)
@@ -40,7 +52,76 @@ class Battery:
         actual_discharge = max(0, min(amount, discharge_ability))
         # print('actual_discharge:', actual_discharge, 'discharge_ability:', discharge_ability, 'amount:', amount, 'feed_in_power_limitation', feed_in_power_limitation)
         discharge_plus_loss = actual_discharge * ((100 + self.loss_rate) / 100)
-        self.charge = max(0, self.charge - (discharge_plus_loss / 12))
+        self.charge = max(0, self.charge - (discharge_plus_loss / per_hour))
+        return actual_discharge
+
+    def reset(self) -> None:
+        self.charge = self.capacity / 2
+
+
+class BatteryBank:
+    """N battery configurations held as arrays and advanced together.
+
+    Mirrors Battery: capacity, charge_rate, initial_charge, loss_rate and min_soc accept a scalar
+    or an array of length N, and charge/discharge return the actual power per configuration.
+    """
+
+    def __init__(self, capacity: Any = 5000, charge_rate: Any = 5000, initial_charge: Any = None,
+                 loss_rate: Any = 5, min_soc: Any = 10, interval: int = 5) -> None:
+        capacity, charge_rate, loss_rate, min_soc = np.broadcast_arrays(
+            *(np.asarray(value, dtype=float) for value in (capacity, charge_rate, loss_rate, min_soc)))
+        self.capacity = np.atleast_1d(capacity).copy()
+        self.charge_rate = np.atleast_1d(charge_rate).copy()
+        self.discharge_rate = self.charge_rate.copy()
+        self.max_charge_rate = self.charge_rate.copy()
+        self.max_discharge_rate = self.charge_rate.copy()
+        self.loss_rate = np.atleast_1d(loss_rate).copy()
+        self.min_soc = np.atleast_1d(min_soc).copy()
+        self.min_charge = (self.min_soc / 100) * self.capacity
+        if initial_charge is None:
+            self.charge = self.capacity / 2
+        else:
+            self.charge = np.broadcast_to(np.asarray(initial_charge, dtype=float), self.capacity.shape).copy()
+        self.interval = interval
+
+    @classmethod
+    def from_configs(cls, configs: Sequence[dict], interval: int = 5) -> 'BatteryBank':
+        """Build a bank from Battery keyword dicts, e.g. the rows of a sizing grid."""
+        defaults = {'capacity': 5000, 'charge_rate': 5000, 'loss_rate': 5, 'min_soc': 10}
+        columns = {key: [config.get(key, default) for config in configs] for key, default in defaults.items()}
+        initial = [config.get('initial_charge') for config in configs]
+        initial_charge = None if all(value is None for value in initial) else \
+            [value if value is not None else capacity / 2 for value, capacity in zip(initial, columns['capacity'])]
+        return cls(initial_charge=initial_charge, interval=interval, **columns)
+
+    def __len__(self) -> int:
+        return len(self.capacity)
+
+    @property
+    def soc(self) -> np.ndarray:
+        return (self.charge / self.capacity) * 100
+
+    def charge_battery(self, amount: Any, interval: Optional[int] = None) -> np.ndarray:
+        per_hour = 60 / (interval or self.interval)
+        charge_ability = np.minimum(self.charge_rate, np.maximum(0, self.capacity - self.charge) * per_hour)
+        actual_charge = np.maximum(0, np.minimum(amount, charge_ability))
+        charge_minus_loss = actual_charge * ((100 - self.loss_rate) / 100)
+        self.charge = np.minimum(self.capacity, self.charge + (charge_minus_loss / per_hour))
+        return actual_charge
+
+    def discharge_ability(self, interval: Optional[int] = None) -> np.ndarray:
+        per_hour = 60 / (interval or self.interval)
+        return np.minimum(self.discharge_rate, np.maximum(0, self.charge - self.min_charge) * per_hour)
+
+    def discharge_battery(self, amount: Any, interval: Optional[int] = None, feed_in_power_limitation: Any = None) -> np.ndarray:
+        per_hour = 60 / (interval or self.interval)
+        discharge_ability = self.discharge_ability(interval)
+        if feed_in_power_limitation is not None:
+            discharge_ability = np.where(feed_in_power_limitation < amount,
+                                         np.minimum(discharge_ability, feed_in_power_limitation), discharge_ability)
+        actual_discharge = np.maximum(0, np.minimum(amount, discharge_ability))
+        discharge_plus_loss = actual_discharge * ((100 + self.loss_rate) / 100)
+        self.charge = np.maximum(0, self.charge - (discharge_plus_loss / per_hour))
         return actual_discharge
 
     def reset(self) -> None:
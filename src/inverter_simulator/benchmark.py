@@ -0,0 +1,214 @@
+"""Benchmarks for the simulator hot paths.
+
+Run with e.g. ``python -m inverter_simulator.benchmark --days 365 --output bench.json`` and compare
+two saved runs with ``--compare old.json``. The report also has the cold-start import time of utils
+against IMPORT_BUDGET_SECONDS.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from inverter_simulator.battery import Battery
+from inverter_simulator.simulator import InverterSimulator, sim_inverter
+
+BENCHMARK_SCRIPT = '''
+CHEAP = 15
+EXPENSIVE = 40
+if buy_price < CHEAP and battery_soc < 90:
+    action = 'import'
+    reason = 'cheap power'
+elif sell_price > EXPENSIVE and battery_soc > 20:
+    action = 'export'
+    reason = 'expensive power'
+elif 17 <= hour < 21:
+    action = 'discharge'
+    reason = 'evening peak'
+'''
+
+# Importing utils for a scripted run, as every process pool worker does, must stay under this budget
+# and must not import the plotting or permutation model dependencies
+UTILS_IMPORT = 'from inverter_simulator.utils import run_scripted_simulation'
+IMPORT_BUDGET_SECONDS = 1.5
+HEAVY_MODULES = ('matplotlib', 'pytrader')
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+try:
+    exec(sys.argv[1])
+except ImportError as e:
+    print(json.dumps({'error': str(e)}))
+    sys.exit()
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'modules': sorted(m for m in sys.modules if m.split('.')[0] in sys.argv[2:])}))
+"""
+
+
+def synthetic_system(days: float = 1, interval: int = 5, seed: int = 0, forecast_length: int = 48) -> pd.DataFrame:
+    """Synthetic meter and price data: a daily solar bell, an evening house peak and noisy prices."""
+    rng = np.random.default_rng(seed)
+    periods = int(days * 24 * 60 / interval)
+    index = pd.date_range('2024-01-01', periods=periods, freq=f'{interval}min', tz='Australia/Brisbane')
+    hours = index.hour.to_numpy() + index.minute.to_numpy() / 60
+    solar = np.clip(np.sin((hours - 6) / 12 * np.pi), 0, None) * 6000 * rng.uniform(0.6, 1, periods)
+    house = 400 + 1500 * np.exp(-((hours - 19) ** 2) / 4) + rng.uniform(0, 600, periods)
+    rrp = np.clip(80 + 60 * np.sin((hours - 13) / 24 * 2 * np.pi) + rng.normal(0, 40, periods), -50, None)
+    forecast = [list(rrp[i:i + forecast_length]) for i in range(periods)]
+    return pd.DataFrame({
+        'house_power': house.round(),
+        'solar_power': solar.round(),
+        'rrp': rrp,
+        'buy_price': rrp / 10 + 20,
+        'sell_price': rrp / 10,
+        'forecast': forecast,
+    }, index=index)
+
+
+def trivial_control(interval_time: pd.Timestamp, **params: Any) -> Tuple[str, str]:
+    return 'auto', 'benchmark'
+
+
+def measure(name: str, intervals: int, fn: Callable[[], Any]) -> Dict[str, Any]:
+    """Time fn and record its peak traced memory."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'name': name,
+        'intervals': intervals,
+        'seconds': seconds,
+        'intervals_per_sec': intervals / seconds if seconds else float('inf'),
+        'peak_memory_mb': peak / 1024 / 1024,
+    }
+
+
+def bench_sim_inverter(system: pd.DataFrame, engine: str) -> Dict[str, Any]:
+    return measure(f'sim_inverter[{engine}]', len(system),
+                   lambda: sim_inverter(system.copy(), trivial_control, engine=engine))
+
+
+def bench_final_metrics(system: pd.DataFrame) -> Dict[str, Any]:
+    sim = InverterSimulator(system.copy(), trivial_control)
+    sim.run_simulation()
+    sim.system = system.copy()
+    return measure('_calculate_final_metrics', len(system), sim._calculate_final_metrics)
+
+
+def bench_battery(intervals: int) -> Dict[str, Any]:
+    battery = Battery(capacity=10000, charge_rate=5000)
+
+    def cycle() -> None:
+        for i in range(intervals):
+            if i % 2:
+                battery.charge_battery(3000)
+            else:
+                battery.discharge_battery(2500, feed_in_power_limitation=2000)
+    return measure('Battery.charge/discharge', intervals, cycle)
+
+
+def bench_scripted(system: pd.DataFrame, script: str = BENCHMARK_SCRIPT) -> Optional[Dict[str, Any]]:
+    try:
+        from inverter_simulator.utils import run_scripted_simulation
+    except ImportError:
+        return None
+    return measure('run_scripted_simulation', len(system), lambda: run_scripted_simulation(
+        system.copy(), script, 'benchmark.py', interval=5, battery_capacity=10000, tariff='6900', network='energex',
+        charge_rate=5000, max_ppv_power=6000, daily_fee=1, spot_to_tariff=lambda *args: args[-1] / 10, state='QLD',
+        latitude=-27.4698, longitude=153.0251, timezone_str='Australia/Brisbane'))
+
+
+def bench_import(statement: str = UTILS_IMPORT, repeat: int = 3) -> Optional[Dict[str, Any]]:
+    """Cold-start time of statement, the fastest of `repeat` fresh interpreters, and the heavy modules it imports.
+
+    None when the statement cannot be imported here (e.g. the private dependencies of utils are missing).
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT, statement, *HEAVY_MODULES],
+                                capture_output=True, text=True, check=True).stdout
+        run = json.loads(output.strip().splitlines()[-1])
+        if 'error' in run:
+            return None
+        runs.append(run)
+    return {
+        'statement': statement,
+        'seconds': min(run['seconds'] for run in runs),
+        'budget_seconds': IMPORT_BUDGET_SECONDS,
+        'heavy_modules': runs[0]['modules'],
+    }
+
+
+def run_benchmarks(days: float = 1, seed: int = 0) -> Dict[str, Any]:
+    system = synthetic_system(days=days, seed=seed)
+    results: List[Dict[str, Any]] = [
+        bench_sim_inverter(system, 'pandas'),
+        bench_sim_inverter(system, 'numpy'),
+        bench_final_metrics(system),
+        bench_battery(len(system)),
+    ]
+    scripted = bench_scripted(system)
+    if scripted is not None:
+        results.append(scripted)
+    return {
+        'created': datetime.now().isoformat(),
+        'days': days,
+        'intervals': len(system),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'results': results,
+        'import': bench_import(),
+    }
+
+
+def save_results(report: Dict[str, Any], path: str) -> None:
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, float]:
+    """Throughput of current relative to baseline per benchmark; below 1 is a regression."""
+    before = {result['name']: result['intervals_per_sec'] for result in baseline['results']}
+    return {result['name']: result['intervals_per_sec'] / before[result['name']]
+            for result in current['results'] if before.get(result['name'])}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the inverter simulator hot paths')
+    parser.add_argument('--days', type=float, default=1, help='Days of synthetic 5 minute data (1 to 1826)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Save the results to this JSON file')
+    parser.add_argument('--compare', help='Compare against results saved from an earlier version')
+    args = parser.parse_args(argv)
+    report = run_benchmarks(days=args.days, seed=args.seed)
+    for result in report['results']:
+        print(f"{result['name']:<28} {result['intervals_per_sec']:>12.0f} intervals/s "
+              f"{result['seconds']:>8.2f}s {result['peak_memory_mb']:>8.1f}MB")
+    imported = report['import']
+    if imported is not None:
+        status = 'ok' if imported['seconds'] <= imported['budget_seconds'] and not imported['heavy_modules'] else 'OVER BUDGET'
+        print(f"{'import utils':<28} {imported['seconds']:>8.2f}s of {imported['budget_seconds']:.2f}s {status} "
+              f"{' '.join(imported['heavy_modules'])}")
+    if args.output:
+        save_results(report, args.output)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for name, ratio in compare(baseline, report).items():
+            print(f'{name:<28} {ratio:>6.2f}x')
+
+
+if __name__ == '__main__':
+    main()
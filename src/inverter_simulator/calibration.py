@@ -0,0 +1,189 @@
+import contextlib
+import itertools
+import logging
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from inverter_simulator.script_errors import script_errors
+from inverter_simulator.simulator import sim_inverter
+from inverter_simulator.sweep import SWEEP_PARAMETERS, _WORKER, _init_worker, share_frame
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BOUNDS = {'battery_loss': (0, 40), 'min_soc': (0, 50)}
+
+
+def billed_costs(system: pd.DataFrame) -> pd.Series:
+    """The billed cost of each interval, the target calibration fits the simulated sim_cost to."""
+    if 'billed_costs' not in system.columns or 'billed_earnings' not in system.columns:
+        raise ValueError('Calibrating needs billed_costs and billed_earnings columns, or an explicit target')
+    return system['billed_costs'] - system['billed_earnings']
+
+
+def _run_candidate(params: dict) -> dict:
+    cost, result = sim_inverter(_WORKER['system'], _WORKER['control_function'], **_WORKER['kwargs'], **params)
+    run = {'cost': cost, 'daily': result['sim_cost'].resample('D').sum().to_numpy()}
+    errors = script_errors(_WORKER['control_function'])
+    if errors is not None:
+        run['script_errors'] = errors.report()
+    return run
+
+
+def _picklable(control_function: Callable, kwargs: dict) -> bool:
+    try:
+        pickle.dumps((control_function, kwargs))
+    except Exception as e:
+        logger.warning(f'Calibrating in process, the control function or kwargs do not pickle: {e}')
+        return False
+    return True
+
+
+class _Candidates:
+    """Runs batches of candidate parameters, in parallel when a pool is given, and keeps the trace.
+
+    Script failures the workers report are merged into errors, the ScriptErrors of the control function.
+    """
+
+    def __init__(self, run: Callable[[List[dict]], List[dict]], target: pd.Series, errors: Any = None) -> None:
+        self.run = run
+        self.errors = errors
+        self.total = float(target.sum())
+        self.daily = target.resample('D').sum().to_numpy()
+        self.trace: List[dict] = []
+
+    def evaluate(self, round_: int, candidates: List[dict]) -> List[dict]:
+        rows = []
+        for params, result in zip(candidates, self.run(candidates)):
+            if self.errors is not None and 'script_errors' in result:
+                self.errors.merge(result['script_errors'])
+            rows.append({'round': round_, **params, 'cost': result['cost'], 'difference': result['cost'] - self.total,
+                         'error': float(((result['daily'] - self.daily) ** 2).sum())})
+        self.trace.extend(rows)
+        return rows
+
+    def best(self, key: str) -> dict:
+        return min(self.trace, key=lambda row: abs(row[key]))
+
+
+def _search_root(candidates: _Candidates, name: str, bounds: Tuple[float, float], points: int,
+                 tolerance: float, resolution: float, max_rounds: int) -> None:
+    """Parallel bisection on the bill difference, which is monotone in a single parameter.
+
+    Each round evaluates `points` evenly spaced values inside the bracket at once and keeps the
+    sub-interval where the difference changes sign, shrinking the bracket by points + 1.
+    """
+    low, high = bounds
+    ends = candidates.evaluate(0, [{name: low}, {name: high}])
+    low_difference, high_difference = ends[0]['difference'], ends[1]['difference']
+    if np.sign(low_difference) == np.sign(high_difference):
+        logger.warning(f'The bill difference does not change sign for {name} in {bounds}, using the closer bound')
+        return
+    for round_ in range(1, max_rounds + 1):
+        if min(abs(low_difference), abs(high_difference)) <= tolerance or high - low <= resolution:
+            return
+        values = np.linspace(low, high, points + 2)
+        rows = candidates.evaluate(round_, [{name: float(value)} for value in values[1:-1]])
+        differences = [low_difference] + [row['difference'] for row in rows] + [high_difference]
+        for j in range(len(values) - 1):
+            if np.sign(differences[j]) != np.sign(differences[j + 1]):
+                low, high = float(values[j]), float(values[j + 1])
+                low_difference, high_difference = differences[j], differences[j + 1]
+                break
+
+
+def _search_joint(candidates: _Candidates, bounds: Dict[str, Tuple[float, float]], points: int,
+                  resolution: float, max_rounds: int) -> None:
+    """Grid refinement on the squared error of the daily bills.
+
+    A single bill total cannot separate two parameters, so the daily bills are fitted instead.
+    Each round evaluates a grid of `points` values per parameter in parallel and narrows every
+    bracket to the neighbours of the best grid point, a parallel form of golden-section search.
+    Like golden-section search it assumes one minimum inside the bounds.
+    """
+    brackets = dict(bounds)
+    for round_ in range(1, max_rounds + 1):
+        if all(high - low <= resolution for low, high in brackets.values()):
+            return
+        values = {name: np.linspace(low, high, points + 2) for name, (low, high) in brackets.items()}
+        grid = list(itertools.product(*(range(1, points + 1) for _ in brackets)))
+        rows = candidates.evaluate(round_, [{name: float(values[name][j]) for name, j in zip(brackets, cell)}
+                                            for cell in grid])
+        best = grid[int(np.argmin([row['error'] for row in rows]))]
+        brackets = {name: (float(values[name][j - 1]), float(values[name][j + 1])) for name, j in zip(brackets, best)}
+
+
+def calibrate(system: pd.DataFrame, control_function: Callable, bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+              target: Optional[pd.Series] = None, rel_tolerance: float = 0.001, resolution: float = 0.1,
+              points: Optional[int] = None, max_rounds: int = 12, max_workers: Optional[int] = None,
+              **kwargs: Any) -> dict:
+    """Fit simulator parameters so the simulated bill matches the billed one.
+
+    With one parameter in bounds (battery_loss by default) the total bill difference is solved
+    to rel_tolerance of the bill with a parallel bisection. With several, e.g. battery_loss and
+    min_soc, the squared error of the daily bills is minimised by grid refinement. Each round
+    runs `points` candidates (per parameter when there are several) over a process pool of
+    max_workers, by default one per CPU and as many candidates as workers. max_workers=1, or a
+    control function that does not pickle, runs them in process.
+    target defaults to billed_costs - billed_earnings from the system frame. The script failures
+    of a ScriptedControl's copies in the workers are merged into its own errors, so closing them
+    summarises every run.
+    Returns the fitted params, their cost, difference and error, and the trace of every run.
+    """
+    bounds = dict(bounds or {'battery_loss': DEFAULT_BOUNDS['battery_loss']})
+    unknown = set(bounds) - set(SWEEP_PARAMETERS)
+    if unknown:
+        raise ValueError(f'Cannot calibrate {sorted(unknown)}, expected some of {SWEEP_PARAMETERS}')
+    if target is None:
+        target = billed_costs(system)
+    for name in bounds:
+        kwargs.pop(name, None)
+    if max_workers != 1 and not _picklable(control_function, kwargs):
+        max_workers = 1
+    if points is None:
+        points = max_workers or os.cpu_count() or 1
+        if len(bounds) > 1:
+            points = round(points ** (1 / len(bounds)))
+    if len(bounds) > 1:
+        points = max(points, 2)
+
+    with contextlib.ExitStack() as stack:
+        directory = stack.enter_context(tempfile.TemporaryDirectory(prefix='inverter_calibrate_'))
+        spec = share_frame(system, directory)
+        if max_workers == 1:
+            _init_worker(spec, control_function, kwargs)
+            stack.callback(_WORKER.clear)
+
+            def run(batch: List[dict]) -> List[dict]:
+                return [_run_candidate(params) for params in batch]
+        else:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                                               initargs=(spec, control_function, kwargs)))
+
+            def run(batch: List[dict]) -> List[dict]:
+                return list(executor.map(_run_candidate, batch))
+
+        candidates = _Candidates(run, target, script_errors(control_function))
+        if len(bounds) == 1:
+            (name, limits), = bounds.items()
+            tolerance = abs(candidates.total) * rel_tolerance
+            _search_root(candidates, name, limits, points, tolerance, resolution, max_rounds)
+            best = candidates.best('difference')
+        else:
+            _search_joint(candidates, bounds, points, resolution, max_rounds)
+            best = candidates.best('error')
+
+    trace = pd.DataFrame(candidates.trace, columns=['round'] + list(bounds) + ['cost', 'difference', 'error'])
+    return {
+        'params': {name: best[name] for name in bounds},
+        'cost': best['cost'],
+        'difference': best['difference'],
+        'error': best['error'],
+        'runs': len(trace),
+        'trace': trace,
+    }
@@ -0,0 +1,74 @@
+import json
+import logging
+import os
+import numbers
+import pickle
+from datetime import date, datetime, time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 2
+
+
+def _is_data(value: Any) -> bool:
+    """Plain values and containers of them; not functions or other objects tied to the module layout."""
+    if value is None or isinstance(value, (str, bool, numbers.Number, np.generic, date, datetime, time)):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(_is_data(item) for item in value)
+    if isinstance(value, dict):
+        return all(isinstance(key, str) and _is_data(item) for key, item in value.items())
+    return False
+
+
+def _pack(name: str, values: np.ndarray) -> Optional[np.ndarray]:
+    """Store string columns as fixed-width unicode and keep other object columns only if they hold plain data."""
+    if values.dtype != object:
+        return values
+    if all(isinstance(value, str) for value in values):
+        return values.astype(str)
+    if not all(_is_data(value) for value in values):
+        logger.debug(f'Not checkpointing column {name}: it holds values other than plain data')
+        return None
+    try:
+        pickle.dumps(values)
+    except Exception as e:
+        logger.warning(f'Not checkpointing column {name}: {e}')
+        return None
+    return values
+
+
+def save_checkpoint(path: str, state: dict, core: Dict[str, np.ndarray], params: Dict[str, np.ndarray],
+                    history: np.ndarray) -> None:
+    """Write simulator state to a compressed .npz, replacing any earlier checkpoint atomically."""
+    arrays = {'state': np.array(json.dumps({'version': CHECKPOINT_VERSION, **state})), 'history': history}
+    for prefix, columns in (('core', core), ('params', params)):
+        for name, values in columns.items():
+            packed = _pack(name, values)
+            if packed is not None:
+                arrays[f'{prefix}:{name}'] = packed
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: str) -> Tuple[dict, Dict[str, np.ndarray], Dict[str, np.ndarray], np.ndarray]:
+    """Read a checkpoint written by save_checkpoint. Only load checkpoints you wrote: object columns are pickled."""
+    with np.load(path, allow_pickle=True) as data:
+        state = json.loads(str(data['state']))
+        if state.get('version') != CHECKPOINT_VERSION:
+            raise ValueError(f'Unsupported checkpoint version {state.get("version")} in {path}')
+        core = {}
+        params = {}
+        for key in data.files:
+            prefix, _, name = key.partition(':')
+            if prefix == 'core':
+                core[name] = data[key]
+            elif prefix == 'params':
+                params[name] = data[key]
+        history = data['history']
+    return state, core, params, history
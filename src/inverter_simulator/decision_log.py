@@ -0,0 +1,107 @@
+import json
+from array import array
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from inverter_simulator.actions import ActionCategories
+
+RETENTIONS = ('all', 'sampled', 'changes')
+
+
+class _Interned:
+    """Distinct values in first-seen order and the code of each, so repeats cost one small int."""
+
+    def __init__(self) -> None:
+        self.values: List[Any] = []
+        self._codes: Dict[Any, int] = {}
+
+    def code(self, value: Any) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class DecisionLog:
+    """Append-only log of the action, reason and decisions of each interval of a scripted run.
+
+    Kept apart from the result frame: actions, reasons and decisions are stored as integer codes
+    into their distinct values, with decisions (the DecisionLogger dict of an interval) compared
+    by their JSON, so a year of near-identical intervals costs a few bytes each.
+    retention is 'all', 'sampled' (every sample_every-th interval) or 'changes' (intervals whose
+    action differs from the previous interval's). to_frame builds the DataFrame on request.
+    """
+
+    def __init__(self, retention: str = 'all', sample_every: int = 12) -> None:
+        if retention not in RETENTIONS:
+            raise ValueError(f'Unknown retention {retention}, expected one of {RETENTIONS}')
+        self.retention = retention
+        self.sample_every = sample_every
+        self.seen = 0
+        self.tz = None
+        self._times = array('q')
+        self._actions = array('h')
+        self._reasons = array('i')
+        self._decisions = array('i')
+        self._action_categories = ActionCategories()
+        self._reason_values = _Interned()
+        self._decision_values = _Interned()
+        self._last_action: Any = None
+
+    def __len__(self) -> int:
+        return len(self._times)
+
+    def _keep(self, action: Any) -> bool:
+        if self.retention == 'sampled':
+            return self.seen % self.sample_every == 0
+        if self.retention == 'changes':
+            return self.seen == 0 or action != self._last_action
+        return True
+
+    def append(self, interval_time: pd.Timestamp, action: Any, reason: Any, decisions: Optional[dict] = None) -> bool:
+        """Log one interval, returning whether the retention kept it."""
+        keep = self._keep(action)
+        self.seen += 1
+        self._last_action = action
+        if not keep:
+            return False
+        if self.tz is None:
+            self.tz = interval_time.tz
+        self._times.append(interval_time.value)
+        self._actions.append(self._action_categories.code(action))
+        self._reasons.append(-1 if reason is None else self._reason_values.code(reason if isinstance(reason, str) else str(reason)))
+        if decisions is None:
+            self._decisions.append(-1)
+        else:
+            self._decisions.append(self._decision_values.code(json.dumps(decisions, sort_keys=True, default=str)))
+        return True
+
+    def to_frame(self, expand: bool = False) -> pd.DataFrame:
+        """The retained intervals: action and reason as Categoricals and the decisions dict of each.
+
+        expand=True flattens the decisions into one column per key (see pandas.json_normalize).
+        """
+        index = pd.DatetimeIndex(np.frombuffer(self._times, dtype=np.int64).view('datetime64[ns]'))
+        if self.tz is not None:
+            index = index.tz_localize('UTC').tz_convert(self.tz)
+        # Decoded once per distinct value, so intervals with the same decisions share one dict
+        distinct = [json.loads(value) for value in self._decision_values.values]
+        decisions = [distinct[code] if code >= 0 else None for code in self._decisions]
+        frame = pd.DataFrame({
+            'action': self._action_categories.to_categorical(np.frombuffer(self._actions, dtype=np.int16)),
+            'reason': pd.Categorical.from_codes(np.frombuffer(self._reasons, dtype=np.int32),
+                                                categories=pd.Index(self._reason_values.values, dtype=object)),
+            'decisions': decisions,
+        }, index=index)
+        if expand and len(frame):
+            flat = pd.json_normalize([value if isinstance(value, dict) else {} for value in decisions]).set_axis(index)
+            frame = pd.concat([frame.drop(columns='decisions'), flat.add_prefix('decisions.')], axis=1)
+        return frame
+
+    def memory_bytes(self) -> int:
+        """Bytes held by the codes and the distinct reasons and decisions (approximate)."""
+        arrays = sum(values.itemsize * len(values) for values in (self._times, self._actions, self._reasons, self._decisions))
+        return arrays + sum(len(value) for value in self._reason_values.values + self._decision_values.values)
@@ -0,0 +1,36 @@
+from typing import Iterable
+
+import numpy as np
+
+
+def minmax_indices(values: np.ndarray, buckets: int) -> np.ndarray:
+    """Positions of the minimum and maximum of each of `buckets` equal runs of values, plus the ends.
+
+    Plotted in order these trace the same envelope as every point, which is what a line chart a
+    few thousand pixels wide can show anyway. NaNs are never picked unless a whole bucket is NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n <= 2 * buckets or buckets < 1:
+        return np.arange(n)
+    size = -(-n // buckets)
+    rows = -(-n // size)
+    low = np.full(rows * size, np.inf)
+    high = np.full(rows * size, -np.inf)
+    low[:n] = np.where(np.isnan(values), np.inf, values)
+    high[:n] = np.where(np.isnan(values), -np.inf, values)
+    offsets = np.arange(rows) * size
+    minima = low.reshape(rows, size).argmin(axis=1) + offsets
+    maxima = high.reshape(rows, size).argmax(axis=1) + offsets
+    return np.unique(np.concatenate([[0, n - 1], minima, maxima]).clip(0, n - 1))
+
+
+def downsample_indices(series: Iterable[np.ndarray], max_points: int) -> np.ndarray:
+    """Positions that keep the min/max envelope of every series in about max_points points each.
+
+    The union is taken so series drawn against each other (e.g. fill_between) share their x values.
+    """
+    keep = [minmax_indices(values, max_points // 2) for values in series]
+    if not keep:
+        return np.arange(0)
+    return np.unique(np.concatenate(keep))
@@ -0,0 +1,121 @@
+from collections.abc import Sequence
+from typing import Any, Optional
+
+import numpy as np
+
+
+class GridHistory:
+    """Power drawn from the grid per interval, handed to control functions without copying.
+
+    past() follows the old past_power_from_grid list semantics: every value except the
+    most recent `lag` ones (or all of them while there are no more than `lag`), trimmed to
+    the last `depth` values when a depth is set. It returns a read-only view into the buffer.
+
+    The buffer grows by doubling. With ring=True and a depth, only depth + lag values are
+    kept, written twice into a mirrored ring so any window of them is contiguous.
+    """
+
+    def __init__(self, lag: int = 12, depth: Optional[int] = None, capacity: int = 288, ring: bool = False) -> None:
+        if ring and depth is None:
+            raise ValueError('A ring buffer needs a depth')
+        self.lag = lag
+        self.depth = depth
+        self.ring = ring
+        self.length = 0
+        if ring:
+            self._window = depth + lag
+            self._buffer = np.zeros(2 * self._window)
+        else:
+            self._window = 0
+            self._buffer = np.zeros(max(1, capacity))
+
+    def __len__(self) -> int:
+        return self.length
+
+    def append(self, value: float) -> None:
+        if self.ring:
+            pos = self.length % self._window
+            self._buffer[pos] = value
+            self._buffer[pos + self._window] = value
+        else:
+            if self.length == len(self._buffer):
+                grown = np.zeros(2 * len(self._buffer))
+                grown[:self.length] = self._buffer
+                self._buffer = grown
+            self._buffer[self.length] = value
+        self.length += 1
+
+    def _view(self, start: int, stop: int) -> np.ndarray:
+        if self.ring:
+            offset = start % self._window
+            view = self._buffer[offset:offset + stop - start]
+        else:
+            view = self._buffer[start:stop]
+        view.flags.writeable = False
+        return view
+
+    def values(self) -> np.ndarray:
+        """Every value still held, oldest first."""
+        start = max(0, self.length - self._window) if self.ring else 0
+        return self._view(start, self.length)
+
+    def past(self) -> np.ndarray:
+        stop = self.length - self.lag if self.length > self.lag else self.length
+        start = 0 if self.depth is None else max(0, stop - self.depth)
+        return self._view(start, stop)
+
+
+class PastPower(Sequence):
+    """A read-only list of grid history values that shares the history's buffer instead of copying it.
+
+    Indexing, slicing, len, iteration, truth, comparison with lists and + behave as they did for
+    the copied past_power_from_grid list; numpy takes it as an array without a copy. Iterating
+    it copies the values then, so only the control functions that read the whole history pay for it.
+    """
+
+    __slots__ = ('_values',)
+
+    def __init__(self, values: np.ndarray) -> None:
+        self._values = values
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return self._values[index].tolist()
+        return float(self._values[index])
+
+    def __iter__(self) -> Any:
+        return iter(self._values.tolist())
+
+    def __reversed__(self) -> Any:
+        return reversed(self._values.tolist())
+
+    def __array__(self, dtype: Any = None, copy: Any = None) -> np.ndarray:
+        values = self._values if dtype is None else self._values.astype(dtype)
+        return values.copy() if copy else values
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (list, PastPower)):
+            return self.tolist() == list(other)
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __add__(self, other: Any) -> list:
+        return self.tolist() + list(other)
+
+    def __radd__(self, other: Any) -> list:
+        return list(other) + self.tolist()
+
+    def __repr__(self) -> str:
+        return repr(self.tolist())
+
+    def __reduce__(self) -> Any:
+        return PastPower, (np.array(self._values),)
+
+    def tolist(self) -> list:
+        return self._values.tolist()
+
+    copy = tolist
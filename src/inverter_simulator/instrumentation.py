@@ -0,0 +1,62 @@
+from collections import Counter
+from time import perf_counter
+from typing import Any, Dict, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Phases timed for every interval, in the order they run
+INTERVAL_PHASES = ('state', 'control', 'step')
+
+
+class Instrumentation:
+    """Per-phase timings for one simulation run, enabled with instrument=True.
+
+    Each interval records how long it took to build the control function's state, to run the
+    control function and to step the battery and grid, in preallocated arrays. The
+    final metrics phase is timed once. Action counts are taken from the results at the end,
+    so the loop only pays for the timer calls.
+    """
+
+    def __init__(self, length: int) -> None:
+        self.length = length
+        self.timings = np.full((length, len(INTERVAL_PHASES)), np.nan)
+        self.final_metrics = 0.0
+        self.started = perf_counter()
+        self.seconds = 0.0
+
+    def record(self, position: int, start: float, state_done: float, control_done: float, step_done: float) -> None:
+        timings = self.timings[position]
+        timings[0] = state_done - start
+        timings[1] = control_done - state_done
+        timings[2] = step_done - control_done
+
+    def finish(self, final_metrics: float) -> None:
+        self.final_metrics = final_metrics
+        self.seconds = perf_counter() - self.started
+
+    def to_frame(self, index: pd.Index) -> pd.DataFrame:
+        """Per-interval latencies in seconds, one column per phase."""
+        return pd.DataFrame(self.timings, index=index, columns=list(INTERVAL_PHASES))
+
+    def report(self, actions: Sequence[Any], fallbacks: Counter) -> Dict[str, Any]:
+        timed = self.timings[~np.isnan(self.timings).any(axis=1)]
+        phases = {}
+        for column, phase in enumerate(INTERVAL_PHASES):
+            values = timed[:, column]
+            phases[phase] = {
+                'total': float(values.sum()),
+                'mean': float(values.mean()) if len(values) else 0.0,
+                'p95': float(np.percentile(values, 95)) if len(values) else 0.0,
+                'max': float(values.max()) if len(values) else 0.0,
+            }
+        phases['final_metrics'] = {'total': self.final_metrics, 'mean': self.final_metrics,
+                                   'p95': self.final_metrics, 'max': self.final_metrics}
+        action_counts = pd.Series(actions, dtype=object).fillna('None').astype(str).value_counts()
+        return {
+            'intervals': len(timed),
+            'seconds': self.seconds,
+            'phases': phases,
+            'actions': {action: int(count) for action, count in action_counts.items()},
+            'fallbacks': dict(fallbacks),
+        }
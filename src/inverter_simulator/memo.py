@@ -0,0 +1,213 @@
+import ast
+import re
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Hashable, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from inverter_simulator.policy import is_vector_policy
+
+# A script declares itself pure with a header comment such as
+#   # pure: interval_time, buy_price, sell_price; soc_step=5
+PURE_HEADER = re.compile(r'#\s*pure\s*:(.*)$', re.IGNORECASE)
+
+MEMO_STATS = ('hits', 'misses', 'bypassed', 'evictions')
+
+
+class MemoKey(NamedTuple):
+    """What a pure control function's decision depends on: state keys and, with soc_step, the SoC bucket."""
+    keys: Tuple[str, ...]
+    soc_step: Optional[float] = None
+
+
+def _memo_key(keys: Any, soc_step: Optional[float]) -> MemoKey:
+    keys = (keys,) if isinstance(keys, str) else tuple(keys)
+    if not keys and soc_step is None:
+        raise ValueError('A pure control function needs at least one key or a soc_step')
+    if soc_step is not None and soc_step <= 0:
+        raise ValueError(f'soc_step must be positive, got {soc_step}')
+    return MemoKey(keys, soc_step)
+
+
+def pure_policy(key: Any = (), soc_step: Optional[float] = None) -> Callable[[Callable], Callable]:
+    """Declare that a control function decides only from the state keys in `key` and the SoC.
+
+    interval_time may be one of the keys. With soc_step the decision may also depend on
+    battery_soc, but only on which soc_step wide bucket it is in. MemoizedControl then reuses
+    a decision for any interval with the same key, so the declaration must hold: anything
+    else the function reads is assumed to be the same whenever the key is.
+    """
+    memo_key = _memo_key(key, soc_step)
+
+    def mark(fn: Callable) -> Callable:
+        fn.memo_key = memo_key  # type: ignore[attr-defined]
+        return fn
+    return mark
+
+
+def script_memo_key(script_content: str) -> Optional[MemoKey]:
+    """The MemoKey a script declares in its header comments, or None if it does not declare itself pure.
+
+    The header is the comment and blank lines before the first line of code, e.g.
+        # pure: interval_time, buy_price, sell_price; soc_step=5
+    """
+    for line in script_content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if not line.startswith('#'):
+            return None
+        match = PURE_HEADER.match(line)
+        if match is None:
+            continue
+        keys, *options = match.group(1).split(';')
+        settings = dict(option.split('=', 1) for option in options if '=' in option)
+        unknown = {name.strip() for name in settings} - {'soc_step'}
+        if unknown:
+            raise ValueError(f'Unknown pure header options {sorted(unknown)}, expected soc_step')
+        soc_step = next((float(value) for name, value in settings.items() if name.strip() == 'soc_step'), None)
+        return _memo_key([key.strip() for key in keys.split(',') if key.strip()], soc_step)
+    return None
+
+
+def script_assigned_names(script_content: str) -> FrozenSet[str]:
+    """Every name a script assigns, binds or imports anywhere in its code (none if it does not parse)."""
+    try:
+        tree = ast.parse(script_content)
+    except SyntaxError:
+        # The script fails when it runs, and its errors are reported there
+        return frozenset()
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+    return frozenset(names)
+
+
+def memo_key(control_function: Callable) -> Optional[MemoKey]:
+    memo = getattr(control_function, 'memo_key', None)
+    return memo if isinstance(memo, MemoKey) else None
+
+
+def assigned_names(control_function: Callable) -> FrozenSet[str]:
+    """The params a control function declares it sets (e.g. a ScriptedControl's assignments), if any."""
+    return frozenset(getattr(control_function, 'assigned_names', None) or ())
+
+
+def _hashable(value: Any) -> Hashable:
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_hashable(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _hashable(item)) for key, item in value.items()))
+    return value
+
+
+_MISSING = object()
+
+
+def _echoes(inputs: dict, name: str, value: Any, assigned: FrozenSet[str]) -> bool:
+    """Whether a returned param is the input of the same name passed back untouched.
+
+    Anything the function assigns is an output, even when it equals the input; otherwise only
+    the input object itself counts as an echo, never an equal value.
+    """
+    return name not in assigned and inputs.get(name, _MISSING) is value
+
+
+class MemoizedControl:
+    """A control function that reuses its decisions for intervals with the same declared key.
+
+    Only control functions declared pure (with pure_policy, or a ScriptedControl whose script
+    has a pure header) are memoized; any other is called for every interval and counted as
+    bypassed. The cache is an LRU of at most maxsize decisions, shared by every run that uses
+    this object, e.g. the configurations of a sweep with max_workers=1, or those each worker
+    of a process pool runs (a pickled copy starts with an empty cache). Params the function
+    returns that only echo the state (the input objects themselves, and not among the names the
+    function declares it assigns, see assigned_names) are refreshed from the current state on a
+    hit, so only its actual outputs are reused. A hit does not run the function, so side effects such as a
+    ScriptedControl's decision_log only see the intervals it evaluated.
+    """
+
+    def __init__(self, control_function: Callable, maxsize: int = 100000) -> None:
+        if is_vector_policy(control_function):
+            raise ValueError('A vector policy decides every interval in one call and cannot be memoized')
+        self.control_function = control_function
+        self.maxsize = maxsize
+        self.memo_key = memo_key(control_function)
+        self.assigned = assigned_names(control_function) if self.memo_key is not None else frozenset()
+        self._cache: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    def __getstate__(self) -> dict:
+        return {'control_function': self.control_function, 'maxsize': self.maxsize}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def _key(self, interval_time: Any, params: dict) -> Optional[Hashable]:
+        keys, soc_step = self.memo_key
+        try:
+            key = tuple(_hashable(interval_time if name == 'interval_time' else params[name]) for name in keys)
+            if soc_step is not None:
+                key += (int(params['battery_soc'] // soc_step),)
+            hash(key)
+        except (KeyError, TypeError, ValueError):
+            # A declared key missing from the state, an unhashable value or a NaN SoC
+            return None
+        return key
+
+    def __call__(self, interval_time: Any, **params: Any) -> tuple:
+        key = None if self.memo_key is None else self._key(interval_time, params)
+        if key is None:
+            self.bypassed += 1
+            return self.control_function(interval_time, **params)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            action, reason, outputs, returned = cached
+            if returned is None:
+                return action, reason
+            params['interval_time'] = interval_time
+            return action, reason, {name: outputs[name] if name in outputs else params.get(name) for name in returned}
+        self.misses += 1
+        decision = self.control_function(interval_time, **params)
+        action, reason, *rest = decision
+        if rest:
+            params['interval_time'] = interval_time
+            outputs = {name: value for name, value in rest[0].items() if not _echoes(params, name, value, self.assigned)}
+            self._cache[key] = (action, reason, outputs, tuple(rest[0]))
+        else:
+            self._cache[key] = (action, reason, None, None)
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+            self.evictions += 1
+        return decision
+
+    def stats(self) -> Dict[str, Any]:
+        """Counts of hits, misses, bypassed calls and evictions, the hit rate of memoized calls and the cache size."""
+        stats: Dict[str, Any] = {name: getattr(self, name) for name in MEMO_STATS}
+        stats['hit_rate'] = hit_rate(stats)
+        stats['size'] = len(self._cache)
+        return stats
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+def hit_rate(stats: Dict[str, Any]) -> float:
+    """The share of memoized calls (hits and misses, not bypassed calls) answered from the cache."""
+    looked_up = stats['hits'] + stats['misses']
+    return stats['hits'] / looked_up if looked_up else 0.0
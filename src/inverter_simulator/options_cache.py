@@ -0,0 +1,130 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bump when the on-disk layout changes; older entries are then ignored and rebuilt
+OPTIONS_CACHE_VERSION = 1
+
+
+def default_cache_directory() -> Optional[str]:
+    """INVERTER_SIMULATOR_CACHE_DIR when it is set, otherwise None: the cache stays in memory unless asked to write to disk."""
+    return os.environ.get('INVERTER_SIMULATOR_CACHE_DIR') or None
+
+
+class OptionsCache:
+    """Two-tier cache for option tables that are expensive to build and depend only on their inputs.
+
+    Tables are kept in an in-memory LRU of `maxsize` entries, backed by a directory per entry on
+    disk: numeric arrays as .npy files loaded memory-mapped (copy-on-write), anything else pickled. A process
+    pool's workers therefore build each table once between them rather than once each.
+    Entries are keyed by a hash of the inputs, `version` (e.g. the model package version) and
+    OPTIONS_CACHE_VERSION, and the inputs are checked again on load, so changing any of them
+    builds fresh tables. directory=None keeps the cache in memory only.
+    """
+
+    def __init__(self, build: Callable[..., Tuple[Any, ...]], maxsize: int = 32, directory: Optional[str] = None,
+                 version: str = '') -> None:
+        self.build = build
+        self.maxsize = maxsize
+        self.directory = directory
+        self.version = version
+        self._memory: 'OrderedDict[str, Tuple[Any, ...]]' = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _manifest(self, inputs: dict) -> dict:
+        return {'format': OPTIONS_CACHE_VERSION, 'version': self.version, 'inputs': inputs}
+
+    def key(self, **inputs: Any) -> str:
+        manifest = json.dumps(self._manifest(inputs), sort_keys=True, default=str)
+        return hashlib.sha256(manifest.encode('utf-8')).hexdigest()
+
+    def get(self, **inputs: Any) -> Tuple[Any, ...]:
+        key = self.key(**inputs)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return self._memory[key]
+        tables = self._load(key, inputs)
+        if tables is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            tables = tuple(self.build(**inputs))
+            self._save(key, inputs, tables)
+        self._memory[key] = tables
+        if len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+        return tables
+
+    def clear(self, disk: bool = False) -> None:
+        self._memory.clear()
+        if disk and self.directory and os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _load(self, key: str, inputs: dict) -> Optional[Tuple[Any, ...]]:
+        if not self.directory:
+            return None
+        path = self._entry(key)
+        if not os.path.exists(os.path.join(path, 'manifest.json')):
+            return None
+        try:
+            with open(os.path.join(path, 'manifest.json')) as f:
+                manifest = json.load(f)
+            expected = json.loads(json.dumps(self._manifest(inputs), sort_keys=True, default=str))
+            if manifest['cache'] != expected:
+                return None
+            tables = []
+            for i, kind in enumerate(manifest['tables']):
+                if kind == 'npy':
+                    tables.append(np.load(os.path.join(path, f'{i}.npy'), mmap_mode='c'))
+                else:
+                    with open(os.path.join(path, f'{i}.pkl'), 'rb') as f:
+                        tables.append(pickle.load(f))
+            return tuple(tables)
+        except Exception as e:
+            logger.warning(f'Ignoring unreadable options cache entry {path}: {e}')
+            return None
+
+    def _save(self, key: str, inputs: dict, tables: Tuple[Any, ...]) -> None:
+        """Write an entry to a temporary directory and rename it into place, so readers never see half an entry."""
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            staging = tempfile.mkdtemp(prefix=f'.{key}.', dir=self.directory)
+            kinds = []
+            for i, table in enumerate(tables):
+                if isinstance(table, np.ndarray) and table.dtype != object:
+                    np.save(os.path.join(staging, f'{i}.npy'), table)
+                    kinds.append('npy')
+                else:
+                    with open(os.path.join(staging, f'{i}.pkl'), 'wb') as f:
+                        pickle.dump(table, f)
+                    kinds.append('pkl')
+            with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+                json.dump({'cache': self._manifest(inputs), 'tables': kinds}, f, sort_keys=True, default=str)
+            path = self._entry(key)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            try:
+                os.rename(staging, path)
+            except OSError:
+                # Another process wrote the same entry first
+                shutil.rmtree(staging, ignore_errors=True)
+        except OSError as e:
+            logger.warning(f'Could not write options cache entry {key}: {e}')
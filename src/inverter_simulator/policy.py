@@ -0,0 +1,64 @@
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def vector_policy(fn: Callable) -> Callable:
+    """Mark a control function as deciding every interval of a run in one call.
+
+    It is called as policy(interval_times, **columns) with the DatetimeIndex of the run and a
+    float array per numeric system column (buy_price, sell_price, solar_power, house_power, ...)
+    plus hour (fractional hour of the day), weekday and interval. It returns an array of actions,
+    or (actions, reasons), or (actions, reasons, params) where params maps a param such as
+    feed_in_power_limitation to an array with NaN for intervals that do not set it.
+    Policies cannot see the battery state; the simulator only integrates the battery.
+    """
+    fn.vector_policy = True  # type: ignore[attr-defined]
+    return fn
+
+
+def is_vector_policy(fn: Callable) -> bool:
+    return getattr(fn, 'vector_policy', False) is True
+
+
+def policy_columns(system: pd.DataFrame, interval: int) -> Dict[str, Any]:
+    """The columns a vector policy is called with."""
+    columns: Dict[str, Any] = {
+        col: system[col].to_numpy(dtype=float) for col in system.columns
+        if pd.api.types.is_numeric_dtype(system[col]) and not pd.api.types.is_bool_dtype(system[col])
+    }
+    index = system.index
+    columns['hour'] = index.hour.to_numpy() + index.minute.to_numpy() / 60
+    columns['weekday'] = index.weekday.to_numpy()
+    columns['interval'] = interval
+    return columns
+
+
+class PolicyDecisions:
+    """The actions, reasons and params a vector policy returned, read back one interval at a time."""
+
+    def __init__(self, result: Any, length: int) -> None:
+        if isinstance(result, tuple):
+            actions, reasons, params = (tuple(result) + (None, None))[:3]
+        else:
+            actions, reasons, params = result, None, None
+        self.actions: List[Any] = self._column('actions', actions, length)
+        self.reasons: List[Any] = self._column('reasons', reasons, length) if reasons is not None else ['vector policy'] * length
+        self.params: List[Tuple[str, List[Any]]] = [(key, self._column(key, values, length))
+                                                    for key, values in (params or {}).items()]
+
+    @staticmethod
+    def _column(name: str, values: Any, length: int) -> List[Any]:
+        values = np.asarray(values)
+        if values.shape != (length,):
+            raise ValueError(f'Vector policy returned {name} of shape {values.shape}, expected ({length},)')
+        return values.tolist()
+
+    def params_at(self, position: int) -> dict:
+        params = {}
+        for key, values in self.params:
+            value = values[position]
+            if value is not None and value == value:
+                params[key] = value
+        return params
@@ -0,0 +1,93 @@
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from inverter_simulator.simulator import sim_inverter
+
+# Energy or money per interval, summed when intervals are merged; any other numeric column
+# (power in W, prices, limits) is averaged over the merged interval and anything else takes its first value
+SUM_COLUMNS = ('billed_costs', 'billed_earnings', 'sim_cost', 'Energy from grid', 'Energy to grid')
+SUM_SUFFIXES = ('_kwh',)
+
+
+def data_interval(system: pd.DataFrame) -> int:
+    """The interval of the system in minutes, from the most common step of its index."""
+    if len(system.index) < 2:
+        raise ValueError('Cannot tell the interval of a system with fewer than two rows')
+    step = pd.Series(system.index[1:] - system.index[:-1]).mode().iloc[0]
+    return round(step / pd.Timedelta(minutes=1))
+
+
+def aggregations(system: pd.DataFrame, how: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """How each column is aggregated when the system is resampled, overridden per column by how."""
+    rules = {}
+    for col in system.columns:
+        numeric = pd.api.types.is_numeric_dtype(system[col]) and not pd.api.types.is_bool_dtype(system[col])
+        if col in SUM_COLUMNS or str(col).endswith(SUM_SUFFIXES):
+            rules[col] = 'sum'
+        elif numeric:
+            rules[col] = 'mean'
+        else:
+            rules[col] = 'first'
+    rules.update(how or {})
+    return rules
+
+
+def resample_system(system: pd.DataFrame, interval: int, how: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """Merge the intervals of a system into intervals of `interval` minutes, labelled by their start.
+
+    house_power, solar_power and other powers in W are averaged, so the energy of each merged
+    interval is kept; prices are averaged over time, as the market settles half hours from 5
+    minute prices; energy and billed columns (see SUM_COLUMNS) are summed; forecasts and other
+    non-numeric columns take the value at the start of the merged interval. Run the result with
+    interval=interval.
+    """
+    base = data_interval(system)
+    if interval < base or interval % base:
+        raise ValueError(f'Cannot resample {base} minute data to {interval} minutes, expected a multiple of {base}')
+    if interval == base:
+        return system.copy()
+    resampler = system.resample(f'{interval}min', label='left', closed='left')
+    resampled = resampler.agg(aggregations(system, how))
+    # Drop merged intervals without any rows, e.g. gaps in the meter data
+    return resampled[resampler.size() > 0]
+
+
+def resolution_report(system: pd.DataFrame, control_function: Callable, intervals: Iterable[int] = (15, 30, 60),
+                      **kwargs: Any) -> pd.DataFrame:
+    """Simulate the system at its own resolution and resampled to each of `intervals`, and compare.
+
+    Use it to check how far a coarse screening run (e.g. of a sizing grid) can be trusted before
+    running the finalists at full resolution. kwargs are passed to sim_inverter for every run.
+    Returns one row per interval, the first the baseline: its cost, the cost error and relative
+    error against the baseline, the RMS error of the daily costs, the energy from and to the grid,
+    the final battery_soc, the seconds the run took and its speed-up over the baseline.
+    """
+    kwargs.pop('interval', None)
+    base = data_interval(system)
+    rows = []
+    baseline = None
+    for interval in [base] + [interval for interval in intervals if interval != base]:
+        resampled = resample_system(system, interval)
+        start = time.perf_counter()
+        cost, result = sim_inverter(resampled, control_function, interval=interval, **kwargs)
+        seconds = time.perf_counter() - start
+        daily = result['sim_cost'].resample('D').sum()
+        if baseline is None:
+            baseline = {'cost': cost, 'daily': daily, 'seconds': seconds}
+        rows.append({
+            'interval': interval,
+            'intervals': len(resampled),
+            'cost': cost,
+            'cost_error': cost - baseline['cost'],
+            'relative_error': (cost - baseline['cost']) / abs(baseline['cost']) if baseline['cost'] else np.nan,
+            'daily_rmse': float(np.sqrt(((daily - baseline['daily']) ** 2).mean())),
+            'energy_from_grid': result['Energy from grid'].sum(),
+            'energy_to_grid': result['Energy to grid'].sum(),
+            'final_soc': result['battery_soc'].iloc[-1],
+            'seconds': seconds,
+            'speedup': baseline['seconds'] / seconds if seconds else np.nan,
+        })
+    return pd.DataFrame(rows).set_index('interval')
@@ -0,0 +1,95 @@
+from typing import Any, Dict, Iterable, Sequence
+
+import numpy as np
+import pandas as pd
+
+from inverter_simulator.actions import ActionCategories
+
+# Output column name and the store column it is read from, in the order they are added to the frame
+OUTPUT_COLUMNS = (
+    ('charge', 'charge'),
+    ('discharge', 'discharge'),
+    ('battery_power', 'battery_power'),
+    ('action', 'action'),
+    ('reason', 'reason'),
+    ('battery_charge', 'battery_charge'),
+    ('battery_soc', 'battery_soc'),
+    ('balance', 'balance'),
+    ('sim_grid', 'balance'),
+    ('grid_power', 'balance'),
+    ('sim_cost', 'sim_cost'),
+    ('solar_power', 'solar_power'),
+    ('Power from grid', 'power_from_grid'),
+    ('Power to grid', 'power_to_grid'),
+    ('Energy from grid', 'energy_from_grid'),
+    ('Energy to grid', 'energy_to_grid'),
+    ('feed_in_power_limitation', 'feed_in_power_limitation'),
+    ('solar_curtailed', 'solar_curtailed'),
+)
+
+OBJECT_COLUMNS = ('reason',)
+
+
+def _is_number(value: Any) -> bool:
+    return value is None or (isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_)))
+
+
+class ResultStore:
+    """Preallocated columnar results for one simulation run.
+
+    Core series live in fixed-dtype arrays written by position; actions as int16 codes into
+    `actions`, the distinct actions of the run, and as a Categorical in the frame. Params returned by the control
+    function get a column the first time a key is seen: float64 (NaN when missing) if the first
+    value is numeric, object (None when missing) otherwise, upgraded to object if a later value
+    is not numeric. Keys already in the system frame are not stored, as before.
+    """
+
+    def __init__(self, index: pd.Index, exclude: Iterable[str] = ()) -> None:
+        self.index = index
+        self.length = len(index)
+        self.core: Dict[str, np.ndarray] = {}
+        for _, key in OUTPUT_COLUMNS:
+            if key == 'action':
+                self.core[key] = np.full(self.length, -1, dtype=np.int16)
+            elif key in OBJECT_COLUMNS:
+                self.core[key] = np.full(self.length, None, dtype=object)
+            elif key == 'feed_in_power_limitation':
+                self.core[key] = np.full(self.length, np.nan)
+            else:
+                self.core[key] = np.zeros(self.length)
+        self.actions = ActionCategories()
+        self.params: Dict[str, np.ndarray] = {}
+        self.exclude = set(exclude) | {name for name, _ in OUTPUT_COLUMNS}
+
+    def set_column(self, key: str, values: Sequence) -> None:
+        if key == 'action':
+            self.core[key] = self.actions.encode(values)
+        else:
+            self.core[key] = np.asarray(values, dtype=self.core[key].dtype)
+
+    def _new_column(self, value: Any) -> np.ndarray:
+        if _is_number(value):
+            return np.full(self.length, np.nan)
+        return np.full(self.length, None, dtype=object)
+
+    def record_params(self, position: int, params: dict) -> None:
+        for key, value in params.items():
+            column = self.params.get(key)
+            if column is None:
+                if key in self.exclude:
+                    continue
+                column = self.params[key] = self._new_column(value)
+            elif column.dtype != object and not _is_number(value):
+                column = column.astype(object)
+                column[pd.isna(column)] = None
+                self.params[key] = column
+            column[position] = value
+
+    def to_frame(self, system: pd.DataFrame) -> pd.DataFrame:
+        """Build the result frame in one construction: system columns, then core, then params columns."""
+        data = {col: system[col].array for col in system.columns}
+        for name, key in OUTPUT_COLUMNS:
+            data[name] = self.core[key]
+        data['action'] = self.actions.to_categorical(self.core['action'])
+        data.update(self.params)
+        return pd.DataFrame(data, index=self.index, copy=False)
@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def default_error_directory() -> str:
+    return os.environ.get('INVERTER_SIMULATOR_ERROR_DIR', os.path.join(os.getcwd(), 'script_errors'))
+
+
+class ScriptErrors:
+    """Failures of a user script over a run: one sample and a count per fingerprint.
+
+    A fingerprint is the script, the line and the exception type, so a script that fails the
+    same way in every interval is logged and sampled once however long the run. Samples are
+    written by a background thread to a directory of their own per run and process under
+    `directory` (default_error_directory() by default): error_<id>_code.py and
+    error_<id>_params.json per fingerprint, and errors.json with the counts when the run is closed.
+    A copy sent to another process (pickled, or inherited by a forked process pool worker) starts
+    empty, with a directory of its own; its report() can be
+    merged back into the original, whose summary then counts the failures of every process.
+    """
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        self.directory = directory
+        self._pid = os.getpid()
+        self.run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{self._pid}-{id(self):x}"
+        self.errors: Dict[Tuple[Any, Any, str], dict] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: List[Future] = []
+        self._merged: Dict[str, List[dict]] = {}
+
+    def __getstate__(self) -> dict:
+        return {'directory': self.directory}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
+
+    def __len__(self) -> int:
+        return len(self.errors)
+
+    def _own_process(self) -> None:
+        # A forked process inherits the counts, lock and writer thread of its parent's collector
+        if self._pid != os.getpid():
+            self.__init__(self.directory)
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory or default_error_directory(), self.run_id)
+
+    def record(self, exception: BaseException, lineno: Optional[int] = None, file_name: Optional[str] = None,
+               interval_time: Any = None) -> Optional[dict]:
+        """Count a failure. Returns its entry when it is the first of its fingerprint, otherwise None."""
+        self._own_process()
+        key = (file_name, lineno, type(exception).__name__)
+        with self._lock:
+            entry = self.errors.get(key)
+            if entry is not None:
+                entry['count'] += 1
+                entry['last_interval'] = str(interval_time)
+                return None
+            entry = self.errors[key] = {
+                'id': len(self.errors),
+                'file_name': file_name,
+                'lineno': lineno,
+                'type': type(exception).__name__,
+                'message': str(exception),
+                'count': 1,
+                'first_interval': str(interval_time),
+                'last_interval': str(interval_time),
+                'files': [],
+            }
+        return entry
+
+    def write_sample(self, entry: dict, user_code: str, params_json: str) -> None:
+        """Write the code and params of the first failure of a fingerprint in the background."""
+        files = [os.path.join(self.path, f"error_{entry['id']}_code.py"),
+                 os.path.join(self.path, f"error_{entry['id']}_params.json")]
+        entry['files'] = files
+        self._submit(self._write, list(zip(files, (user_code, params_json))))
+
+    def _submit(self, fn: Any, *args: Any) -> None:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='script-errors')
+            self._pending.append(self._executor.submit(fn, *args))
+
+    @staticmethod
+    def _write(contents: List[Tuple[str, str]]) -> None:
+        try:
+            for path, text in contents:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w') as f:
+                    f.write(text)
+        except OSError as e:
+            logger.warning(f'Could not write script error sample: {e}')
+
+    def summary(self) -> List[dict]:
+        """One dict per fingerprint, the most frequent first, with the failures merged from other processes."""
+        with self._lock:
+            entries = [dict(entry, files=list(entry['files'])) for entry in self.errors.values()]
+            merged = [entry for report in self._merged.values() for entry in report]
+        combined = {(entry['file_name'], entry['lineno'], entry['type']): entry for entry in entries}
+        for entry in merged:
+            key = (entry['file_name'], entry['lineno'], entry['type'])
+            total = combined.get(key)
+            if total is None:
+                combined[key] = dict(entry, id=len(combined), files=list(entry['files']))
+                continue
+            total['count'] += entry['count']
+            total['first_interval'] = min(total['first_interval'], entry['first_interval'])
+            total['last_interval'] = max(total['last_interval'], entry['last_interval'])
+            total['files'].extend(entry['files'])
+        return sorted(combined.values(), key=lambda entry: (-entry['count'], entry['id']))
+
+    def report(self) -> Tuple[str, List[dict]]:
+        """Wait for the samples written so far and return the run id and summary, for merge in another process."""
+        self._own_process()
+        self.flush()
+        return self.run_id, self.summary()
+
+    def merge(self, report: Tuple[str, List[dict]]) -> None:
+        """Count the failures a copy in another process reported.
+
+        Reports are cumulative, so the latest report of each copy replaces the earlier ones. A
+        report of this collector itself (e.g. from a run in process) is already counted.
+        """
+        run_id, summary = report
+        if run_id == self.run_id:
+            return
+        with self._lock:
+            known = self._merged.get(run_id, [])
+            if sum(entry['count'] for entry in summary) >= sum(entry['count'] for entry in known):
+                self._merged[run_id] = summary
+
+    def flush(self) -> None:
+        """Wait for the samples submitted so far to be written."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def close(self) -> List[dict]:
+        """Wait for the samples to be written, write errors.json when there were errors and return the summary."""
+        summary = self.summary()
+        if summary:
+            self._submit(self._write, [(os.path.join(self.path, 'errors.json'), json.dumps(summary, indent=2, default=str))])
+        with self._lock:
+            pending, self._pending = self._pending, []
+            executor, self._executor = self._executor, None
+        for future in pending:
+            future.result()
+        if executor is not None:
+            executor.shutdown()
+        return summary
+
+
+def script_errors(control_function: Any) -> Optional[ScriptErrors]:
+    """The ScriptErrors a control function collects its failures in (e.g. a ScriptedControl, memoized or not), if any."""
+    control_function = getattr(control_function, 'control_function', control_function)
+    errors = getattr(control_function, 'errors', None)
+    return errors if isinstance(errors, ScriptErrors) else None
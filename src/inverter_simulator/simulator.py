@@ -1,15 +1,33 @@
+import numpy as np
 import pandas as pd
-from typing import Any, Tuple, Callable
+from typing import Any, Dict, Tuple, Callable, Iterable, Iterator, Mapping, Optional
 import logging
+from collections import Counter
+from sys import intern
+from time import perf_counter
 from astral import LocationInfo
-from astral.sun import sun
-from inverter_simulator.battery import Battery
-from zoneinfo import ZoneInfo
+from inverter_simulator.actions import Action, ActionCategories, parse_action
+from inverter_simulator.battery import Battery, BatteryBank
+from inverter_simulator.checkpoint import load_checkpoint, save_checkpoint
+from inverter_simulator.history import GridHistory, PastPower
+from inverter_simulator.instrumentation import Instrumentation
+from inverter_simulator.policy import PolicyDecisions, is_vector_policy, policy_columns
+from inverter_simulator.results import ResultStore
+from inverter_simulator.solar import SunTable
+from inverter_simulator.state import IntervalState
+from inverter_simulator.tariffs import ForecastTariffs, default_spot_to_feed_in_tariff, default_spot_to_tariff
 
 logger = logging.getLogger(__name__)
 
 class InverterSimulator:
     DEFAULT_INTERVAL = 5
+    ENGINES = ('pandas', 'numpy')
+    PAST_POWER_FROM_GRID_MODES = ('view', 'list')
+    # State keys taken from the row when the system has the column, otherwise defaulted
+    STATE_DEFAULTS = (('feed_in_power_limitation', 0), ('threshold_1', 0), ('threshold_2', 0), ('threshold_3', 0),
+                      ('threshold_4', 0), ('threshold_5', 0))
+    STATE_CONTAINER_DEFAULTS = (('site_statistics', dict), ('runtime_params', dict), ('weather_data', dict),
+                                ('buy_forecast', list), ('sell_forecast', list))
 
     def __init__(self, system: pd.DataFrame, control_function: Callable, **kwargs: Any):
         self.system = system
@@ -25,22 +43,55 @@ class InverterSimulator:
         initial_charge = kwargs.get('battery_charge', battery_capacity / 2)
         battery_loss = kwargs.get('battery_loss', 5)
         self.min_soc = kwargs.get('min_soc', 10)
+        # Minutes per row of the system; every energy, cost and fee calculation scales with it
+        self.interval = kwargs.get('interval', self.DEFAULT_INTERVAL)
         self.battery = Battery(capacity=battery_capacity, charge_rate=charge_rate, min_soc=self.min_soc,
-                               initial_charge=initial_charge, loss_rate=battery_loss)
+                               initial_charge=initial_charge, loss_rate=battery_loss, interval=self.interval)
 
         self.grid_limit = kwargs.get('grid_limit', self._calculate_grid_limit())
         self.tariff = kwargs.get('tariff', '6900')
         self.network = kwargs.get('network', 'energex')
         self.state = kwargs.get('state', 'QLD')
         self.max_ppv_power = kwargs.get('max_ppv_power', 5000)
-        self.interval = kwargs.get('interval', self.DEFAULT_INTERVAL)
         self.timezone_str = kwargs.get('timezone_str', 'Australia/Brisbane')
         self.location = kwargs.get('location', 'Brisbane')
         self.latitude = kwargs.get('latitude', -27.4698)
         self.longitude = kwargs.get('longitude', 153.0251)
+        self.location_info = LocationInfo(name=self.location, region=self.state, timezone=self.timezone_str,
+                                          latitude=self.latitude, longitude=self.longitude)
+        self.sun_table = SunTable.for_index(self.latitude, self.longitude, self.timezone_str, self.system.index)
         self.daily_fee = kwargs.get('daily_fee', 1)
-        self.spot_to_tariff = kwargs.get('spot_to_tariff', lambda x, y, z, a: a / 10)
-        self.spot_to_feed_in_tariff = kwargs.get('spot_to_feed_in_tariff', lambda x: x / 10)
+        self.spot_to_tariff = kwargs.get('spot_to_tariff', default_spot_to_tariff)
+        self.spot_to_feed_in_tariff = kwargs.get('spot_to_feed_in_tariff', default_spot_to_feed_in_tariff)
+        # Derive buy_forecast/sell_forecast from the forecast column when the system has none
+        self.tariff_forecasts = kwargs.get('tariff_forecasts', False)
+        self.forecast_tariffs: Optional[ForecastTariffs] = None
+        # 'pandas' walks iterrows(), 'numpy' runs the same state machine over preloaded column arrays
+        self.engine = kwargs.get('engine', 'pandas')
+        if self.engine not in self.ENGINES:
+            raise ValueError(f'Unknown engine {self.engine}, expected one of {self.ENGINES}')
+        # 'list' hands control functions a PastPower, a read-only list sharing the grid history's buffer;
+        # 'view' (opt-in) a read-only array view of it
+        self.past_power_from_grid_mode = kwargs.get('past_power_from_grid', 'list')
+        if self.past_power_from_grid_mode not in self.PAST_POWER_FROM_GRID_MODES:
+            raise ValueError(f'Unknown past_power_from_grid mode {self.past_power_from_grid_mode}, '
+                             f'expected one of {self.PAST_POWER_FROM_GRID_MODES}')
+        self.past_power_from_grid_depth = kwargs.get('past_power_from_grid_depth', None)
+        # Write a checkpoint to checkpoint_path every checkpoint_every intervals (numpy engine only)
+        self.checkpoint_path = kwargs.get('checkpoint_path', None)
+        self.checkpoint_every = kwargs.get('checkpoint_every', None)
+        if self.checkpoint_path or self.checkpoint_every is not None:
+            if not self.checkpoint_path or self.checkpoint_every is None:
+                raise ValueError('Checkpoints need both checkpoint_path and checkpoint_every')
+            if self.engine != 'numpy':
+                raise ValueError("Checkpoints need engine='numpy'")
+            if int(self.checkpoint_every) != self.checkpoint_every or self.checkpoint_every < 1:
+                raise ValueError(f'checkpoint_every must be a positive number of intervals, got {self.checkpoint_every}')
+        self._resume_from: Optional[Tuple[int, ResultStore]] = None
+        # Time each phase of every interval; the report is left on self.report after a run
+        self.instrument = kwargs.get('instrument', False)
+        self.instrumentation: Optional[Instrumentation] = None
+        self.report: Optional[dict] = None
         if 'sim_cost' not in self.system.columns:
             self.system['sim_cost'] = 0.0
         self.algo_sim_usage = self.system['sim_cost'].sum()
@@ -66,6 +117,24 @@ class InverterSimulator:
         self.feed_in_power_limitation = []
         self.solar_curtailed = []
         self.params = []
+        self.fallbacks = Counter()
+        self.grid_history = self._new_grid_history()
+
+    def load_chunk(self, system: pd.DataFrame) -> None:
+        """Continue on the next chunk of interval data.
+
+        Battery state and the grid history carry over; per-interval results start afresh so
+        memory only holds one chunk at a time. The sim_cost control functions see is reset from the
+        chunk as a single run sets it from its system, so earlier chunks' costs do not leak into the state.
+        """
+        grid_history = self.grid_history
+        self.system = system[~system.index.duplicated(keep='last')]
+        if 'sim_cost' not in self.system.columns:
+            self.system['sim_cost'] = 0.0
+        self.algo_sim_usage = self.system['sim_cost'].sum()
+        self.sun_table = SunTable.for_index(self.latitude, self.longitude, self.timezone_str, self.system.index)
+        self._init_simulation_data()
+        self.grid_history = grid_history
 
     def _calculate_grid_limit(self) -> int:
         return self.system['house_power'].max() * 2
@@ -74,6 +143,38 @@ class InverterSimulator:
         self._init_simulation_data()
         self.battery.reset()
 
+    def _new_grid_history(self, ring: bool = False) -> GridHistory:
+        # past_power_from_grid leaves out the last 12 intervals, whatever the interval, as scripts index it that way
+        return GridHistory(depth=self.past_power_from_grid_depth,
+                           capacity=len(self.system), ring=ring)
+
+    def _past_power_from_grid(self, history: Optional[GridHistory] = None) -> Any:
+        history = history or self.grid_history
+        past = history.past()
+        if self.past_power_from_grid_mode == 'view':
+            return past
+        # A ring overwrites the values a PastPower would share, but its window is only depth long
+        return past.tolist() if history.ring else PastPower(past)
+
+    def _prepare_forecast_tariffs(self) -> None:
+        self.forecast_tariffs = None
+        if self.tariff_forecasts and 'forecast' in self.system.columns and \
+                not {'buy_forecast', 'sell_forecast'} <= set(self.system.columns):
+            self.forecast_tariffs = ForecastTariffs(self.system.index, self.system['forecast'].tolist(),
+                                                    self.spot_to_tariff, self.spot_to_feed_in_tariff,
+                                                    self.network, self.tariff)
+
+    def _add_forecasts(self, params: dict, position: int, interval_time: pd.Timestamp, forecast: Any) -> None:
+        if self.forecast_tariffs is not None:
+            if 'buy_forecast' not in self.system.columns:
+                params['buy_forecast'] = self.forecast_tariffs.buy_forecast(position)
+            if 'sell_forecast' not in self.system.columns:
+                params['sell_forecast'] = self.forecast_tariffs.sell_forecast(position)
+        if 'buy_forecast' not in params:
+            params['buy_forecast'] = [self.spot_to_tariff(interval_time, self.network, self.tariff, f) for f in forecast]
+        if 'sell_forecast' not in params:
+            params['sell_forecast'] = [self.spot_to_feed_in_tariff(f) for f in forecast]
+
     def is_done(self) -> bool:
         return self.current_interval == self.system.index[-1]
 
@@ -81,14 +182,9 @@ class InverterSimulator:
         row = self.system.loc[self.current_interval].copy()
         return self._create_state_dict(row)
 
-    def _create_state_dict(self, row: pd.Series) -> dict:
-        state_dict = row.to_dict()
-        location = LocationInfo(name=self.location, region=self.state, timezone=self.timezone_str,
-                                    latitude=self.latitude, longitude=self.longitude)
-        # Calculate sunrise and sunset times
-        s = sun(location.observer, date=self.current_interval.date())
-        sunrise = s['sunrise']
-        sunset = s['sunset']
+    def _create_state_dict(self, row: Mapping) -> dict:
+        state_dict = row.to_dict() if isinstance(row, pd.Series) else dict(row)
+        sunrise, sunset = self.sun_table.get(self.current_interval.date())
         state_dict.update({
             'battery_charge': self.battery.charge,
             'battery_soc': self.battery.soc,
@@ -102,8 +198,8 @@ class InverterSimulator:
             'timezone_str': self.timezone_str,
             'latitude': self.latitude,
             'longitude': self.longitude,
-            'sunrise': sunrise.astimezone(ZoneInfo(self.timezone_str)),
-            'sunset': sunset.astimezone(ZoneInfo(self.timezone_str)),
+            'sunrise': sunrise,
+            'sunset': sunset,
             'feed_in_power_limitation': row.get('feed_in_power_limitation', 0),
             'site_statistics': row.get('site_statistics', {}),
             'runtime_params': row.get('runtime_params', {}),
@@ -115,13 +211,76 @@ class InverterSimulator:
             'threshold_3': row.get('threshold_3', 0),
             'threshold_4': row.get('threshold_4', 0),
             'threshold_5': row.get('threshold_5', 0),
-            'location': location,
+            'location': self.location_info,
             'spot_to_tariff': self.spot_to_tariff,
             'spot_to_feed_in_tariff': self.spot_to_feed_in_tariff,
             'sim_cost': self.algo_sim_usage
         })
         return state_dict
 
+    def _static_state(self) -> Tuple[dict, tuple]:
+        """State that is the same for every interval of a run, shared by each IntervalState.
+
+        Also returns the container defaults that need a fresh instance per interval.
+        """
+        static = {
+            'interval': self.interval,
+            'grid_limit': self.grid_limit,
+            'tariff': self.tariff,
+            'network': self.network,
+            'state': self.state,
+            'max_ppv_power': self.max_ppv_power,
+            'timezone_str': self.timezone_str,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'location': self.location_info,
+            'spot_to_tariff': self.spot_to_tariff,
+            'spot_to_feed_in_tariff': self.spot_to_feed_in_tariff,
+            'sim_cost': self.algo_sim_usage,
+        }
+        for key, default in self.STATE_DEFAULTS:
+            if key not in self.system.columns:
+                static[key] = default
+        containers = tuple((key, factory) for key, factory in self.STATE_CONTAINER_DEFAULTS if key not in self.system.columns)
+        return static, containers
+
+    def _echoed_state(self) -> Dict[str, Optional[Callable[[int], Any]]]:
+        """The state keys, other than system columns, a control function may hand back in its params.
+
+        Each maps to how its value at a position is rebuilt, or None for state that cannot be
+        rebuilt afterwards (the battery and grid history, forecasts). Checkpoints leave these out.
+        """
+        static, containers = self._static_state()
+        index = self.system.index
+        echoed: Dict[str, Optional[Callable[[int], Any]]] = {key: (lambda position, value=value: value)
+                                                             for key, value in static.items()}
+        echoed.update({key: (lambda position, factory=factory: factory()) for key, factory in containers})
+        echoed.update({
+            'interval_time': index.__getitem__,
+            'current_interval': index.__getitem__,
+            'sunrise': lambda position: self.sun_table.get(index[position].date())[0],
+            'sunset': lambda position: self.sun_table.get(index[position].date())[1],
+            'battery_charge': None,
+            'battery_soc': None,
+            'past_power_from_grid': None,
+            'buy_forecast': None,
+            'sell_forecast': None,
+        })
+        return {key: rebuild for key, rebuild in echoed.items() if key not in self.system.columns}
+
+    def _interval_state(self, columns: dict, position: int, static: dict, containers: tuple) -> IntervalState:
+        sunrise, sunset = self.sun_table.get(self.current_interval.date())
+        dynamic = {
+            'battery_charge': self.battery.charge,
+            'battery_soc': self.battery.soc,
+            'current_interval': self.current_interval,
+            'sunrise': sunrise,
+            'sunset': sunset,
+        }
+        for key, factory in containers:
+            dynamic[key] = factory()
+        return IntervalState(columns, position, static, dynamic)
+
     def apply_action(self, inverter_action: str) -> None:
         row = self.system.loc[self.current_interval]
         if inverter_action is None:
@@ -134,42 +293,42 @@ class InverterSimulator:
     def _process_interval(self, index: pd.Timestamp, row: pd.Series, action: str, reason: str, params={}) -> None:
         house_power, solar_power, buy_price, sell_price, start_battery_soc = self._get_params(index, row)
         feed_in_power_limitation = params.get('feed_in_power_limitation', None)
+        solar_power, solar_curtailed, charge, discharge = self._step(action, house_power, solar_power, params)
+        self._update_simulation_data(action, reason, solar_power, charge, discharge, house_power, buy_price, sell_price, start_battery_soc, feed_in_power_limitation, solar_curtailed, params)
+
+    def _step(self, action: str, house_power: float, solar_power: float, params={}) -> Tuple[float, float, float, float]:
+        """Apply curtailment and the battery action for one interval.
+
+        Shared by both engines so they stay numerically identical.
+        Returns the delivered solar power, the curtailed solar power, and the charge and discharge in W.
+        """
+        solar_power, solar_curtailed, _balance = self._curtail(action, house_power, solar_power, params)
+        charge, discharge = self._calculate_charge_discharge(action, _balance, params=params)  # This is in Wh
+        return solar_power, solar_curtailed, charge, discharge
+
+    def _curtail(self, action: str, house_power: float, solar_power: float, params={}) -> Tuple[float, float, float]:
+        """Curtail solar for the action and any feed-in limit.
+
+        Returns the delivered solar power, the curtailed solar power and the balance the battery works against.
+        """
+        feed_in_power_limitation = params.get('feed_in_power_limitation', None)
         solar_curtailed = 0
         _balance = solar_power - house_power
-        show_debug = False
         expected_grid_power = solar_power - house_power
-        # print('expected_grid_power', expected_grid_power, 'feed_in_power_limitation', feed_in_power_limitation, 'balance:', _balance)
-        # print('solar_power',solar_power, 'house_power',house_power)
-        if action == 'import_no_solar':
-            solar_curtailed = solar_power
-            solar_power = 0
-            _balance = solar_power - house_power
-            expected_grid_power = solar_power - house_power
-        if action == 'fullstop':
+        if parse_action(action).curtails_solar:
             solar_curtailed = solar_power
             solar_power = 0
             _balance = solar_power - house_power
             expected_grid_power = solar_power - house_power
         if feed_in_power_limitation is not None and expected_grid_power > feed_in_power_limitation:
             curtail_needed = expected_grid_power + feed_in_power_limitation
-            # if index == pd.Timestamp('2025-03-30 22:40:00+11:00'):
-            #     logger.info(f'Curtail needed: {curtail_needed} solar_power: {solar_power}') 
             if curtail_needed > solar_power:
                 solar_curtailed = solar_power
                 solar_power = 0
             else:
                 solar_curtailed = curtail_needed
                 solar_power -= curtail_needed
-        # if index == pd.Timestamp('2025-03-30 22:40:00+11:00'):
-        #     show_debug = True
-        #     print('Processing interval:', index, 'action:', action, 'reason:', reason, 'balance:', _balance,
-        #           'house_power:', house_power, 'solar_power:', solar_power, 'buy_price:', buy_price,
-        #           'sell_price:', sell_price, 'start_battery_soc:', start_battery_soc,)
-        charge, discharge = self._calculate_charge_discharge(action, _balance, params=params, show_debug=show_debug)  # This is in Wh
-        
-        # if index == pd.Timestamp('2025-03-30 22:40:00+11:00'):
-        #     logger.info(f'Processing interval: {index}, action: {action}, reason: {reason}, balance: {_balance}, house_power: {house_power}, solar_curtailed: {solar_curtailed} solar_power: {solar_power}, buy_price: {buy_price}, feed_in_power_limitation: {feed_in_power_limitation}, charge: {charge}, discharge: {discharge}')
-        self._update_simulation_data(action, reason, solar_power, charge, discharge, house_power, buy_price, sell_price, start_battery_soc, feed_in_power_limitation, solar_curtailed, params)
+        return solar_power, solar_curtailed, _balance
 
     def _get_params(self, index: pd.Timestamp, row: pd.Series) -> Tuple[float, float, float]:
         if 'buy_price' not in row:
@@ -194,69 +353,10 @@ class InverterSimulator:
             self.battery.charge_rate = min(optimal_charging, self.battery.max_charge_rate)
         if optimal_discharging is not None:
             self.battery.discharge_rate = min(optimal_discharging, self.battery.max_discharge_rate)
-        if action is None:
-            action = 'auto'
-        action = str(action).lower()
-        if '-' in action:
-            action = action.split('-')[0]
-        if action == 'auto_api_curtail':
-            action = 'auto'
-            if feed_in_power_limitation is None:
-                feed_in_power_limitation = 0
-        if action == 'charge':
-            charge = self.battery.charge_battery(balance, self.interval)
-            discharge = 0
-        elif action == 'discharge':
-            charge = 0
-            # print('IMC: Discharge action:', action, 'balance:', balance, 'feed_in_power_limitation:',
-            #       feed_in_power_limitation, '=', feed_in_power_limitation - balance)
-            if feed_in_power_limitation:
-                discharge = self.battery.discharge_battery(-balance, self.interval,
-                                                           feed_in_power_limitation=feed_in_power_limitation - balance)
-            else:
-                discharge = self.battery.discharge_battery(-balance, self.interval)
-        elif action == 'stopped':
-            charge = discharge = 0
-        elif action == 'fullstop':
-            charge = discharge = 0
-        elif action == 'export0':
-            charge = 0
-            discharge = self.battery.discharge_battery(self.battery.discharge_rate, self.interval,
-                                                       feed_in_power_limitation=0 - balance)
-        elif action == 'export200':
-            feed_in_power_limitation = 200
-            if balance > 0:
-                charge = self.battery.charge_battery(balance, self.interval,
-                                                     feed_in_power_limitation=feed_in_power_limitation - balance)
-                discharge = 0
-            else:
-                charge = 0
-                discharge = self.battery.discharge_battery(-balance, self.interval)
-        elif action in ['export', 'export100']:
-            charge = 0
-            if action == 'export100' and feed_in_power_limitation is None:
-                feed_in_power_limitation = 100
-            if feed_in_power_limitation is not None:
-                feed_in_power_limitation = feed_in_power_limitation - balance
-                discharge = self.battery.discharge_battery(self.battery.discharge_rate, self.interval,
-                                                           feed_in_power_limitation=feed_in_power_limitation)
-            else:
-                discharge = self.battery.discharge_battery(self.battery.discharge_rate, self.interval)
-        elif action in ['import', 'import_no_solar', 'import_at_max']:
-            import_rate = self._get_import_rate(balance, show_debug=show_debug)
-            if show_debug:
-                print(f'Import rate: {import_rate}, balance: {balance}, grid_limit: {self.grid_limit}')
-            charge = self.battery.charge_battery(import_rate, self.interval)
-            discharge = 0
-        else:
-            if action != 'auto':
-                print('Invalid action: using auto:', action)
-            if balance > 0:
-                charge = self.battery.charge_battery(balance, self.interval)
-                discharge = 0
-            else:
-                charge = 0
-                discharge = self.battery.discharge_battery(-balance, self.interval)
+        parsed = parse_action(action)
+        if parsed.invalid is not None:
+            self._fallback_to_auto(parsed.invalid)
+        charge, discharge = self._CHARGE_DISCHARGE[parsed.action](self, balance, feed_in_power_limitation, show_debug)
 
         assert charge >= 0, f'Charge is negative: {charge}'
         assert discharge >= 0, f'Discharge is negative: {discharge}'
@@ -264,6 +364,12 @@ class InverterSimulator:
         assert discharge <= self.battery.max_charge_rate, f'Discharge is greater than charge rate: {discharge} v {self.max_charge_rate}'
         return charge, discharge
 
+    def _fallback_to_auto(self, action: str) -> None:
+        """Count an unknown action run as auto, warning the first time it is seen."""
+        if action not in self.fallbacks:
+            logger.warning(f'Invalid action: using auto: {action}')
+        self.fallbacks[action] += 1
+
     def _get_import_rate(self, balance: float, show_debug=False) -> float:
         import_rate = self.battery.charge_rate
         if show_debug:
@@ -280,6 +386,111 @@ class InverterSimulator:
             print(f'Calculated import rate: {import_rate} for balance: {balance}')
         return import_rate if import_rate > 0 else 0
 
+    # Battery handlers per action, each returning the charge and discharge for the interval's balance
+    def _charge(self, balance: float, feed_in_power_limitation: Optional[float], show_debug: bool) -> Tuple[float, float]:
+        return self.battery.charge_battery(balance, self.interval), 0
+
+    def _discharge(self, balance: float, feed_in_power_limitation: Optional[float], show_debug: bool) -> Tuple[float, float]:
+        # print('IMC: Discharge action:', action, 'balance:', balance, 'feed_in_power_limitation:',
+        #       feed_in_power_limitation, '=', feed_in_power_limitation - balance)
+        if feed_in_power_limitation:
+            return 0, self.battery.discharge_battery(-balance, self.interval,
+                                                     feed_in_power_limitation=feed_in_power_limitation - balance)
+        return 0, self.battery.discharge_battery(-balance, self.interval)
+
+    def _stop(self, balance: float, feed_in_power_limitation: Optional[float], show_debug: bool) -> Tuple[float, float]:
+        return 0, 0
+
+    def _export0(self, balance: float, feed_in_power_limitation: Optional[float], show_debug: bool) -> Tuple[float, float]:
+        return 0, self.battery.discharge_battery(self.battery.discharge_rate, self.interval, feed_in_power_limitation=0 - balance)
+
+    def _export200(self, balance: float, feed_in_power_limitation: Optional[float], show_debug: bool) -> Tuple[float, float]:
+        # Charging never exports, so the 200W feed-in limit only matters when discharging
+        if balance > 0:
+            return self.battery.charge_battery(balance, self.interval), 0
+        return 0, self.battery.discharge_battery(-balance, self.interval)
+
+    def _export(self, balance: float, feed_in_power_limitation: Optional[float], show_debug: bool) -> Tuple[float, float]:
+        if feed_in_power_limitation is not None:
+            return 0, self.battery.discharge_battery(self.battery.discharge_rate, self.interval,
+                                                     feed_in_power_limitation=feed_in_power_limitation - balance)
+        return 0, self.battery.discharge_battery(self.battery.discharge_rate, self.interval)
+
+    def _export100(self, balance: float, feed_in_power_limitation: Optional[float], show_debug: bool) -> Tuple[float, float]:
+        return self._export(balance, 100 if feed_in_power_limitation is None else feed_in_power_limitation, show_debug)
+
+    def _import(self, balance: float, feed_in_power_limitation: Optional[float], show_debug: bool) -> Tuple[float, float]:
+        import_rate = self._get_import_rate(balance, show_debug=show_debug)
+        if show_debug:
+            print(f'Import rate: {import_rate}, balance: {balance}, grid_limit: {self.grid_limit}')
+        return self.battery.charge_battery(import_rate, self.interval), 0
+
+    def _auto(self, balance: float, feed_in_power_limitation: Optional[float], show_debug: bool) -> Tuple[float, float]:
+        if balance > 0:
+            return self.battery.charge_battery(balance, self.interval), 0
+        return 0, self.battery.discharge_battery(-balance, self.interval)
+
+    _CHARGE_DISCHARGE = {
+        Action.AUTO: _auto,
+        Action.CHARGE: _charge,
+        Action.DISCHARGE: _discharge,
+        Action.STOPPED: _stop,
+        Action.FULLSTOP: _stop,
+        Action.EXPORT0: _export0,
+        Action.EXPORT200: _export200,
+        Action.EXPORT: _export,
+        Action.EXPORT100: _export100,
+        Action.IMPORT: _import,
+        Action.IMPORT_NO_SOLAR: _import,
+        Action.IMPORT_AT_MAX: _import,
+    }
+
+    def _bank_charge_discharge(self, bank: BatteryBank, action: str, balance: float, params={}) -> Tuple[np.ndarray, np.ndarray]:
+        """_calculate_charge_discharge for every configuration of a BatteryBank at once."""
+        feed_in_power_limitation = params.get('feed_in_power_limitation', None)
+        optimal_charging = params.get('optimal_charging', None)
+        optimal_discharging = params.get('optimal_discharging', None)
+        if optimal_charging is not None:
+            bank.charge_rate = np.minimum(optimal_charging, bank.max_charge_rate)
+        if optimal_discharging is not None:
+            bank.discharge_rate = np.minimum(optimal_discharging, bank.max_discharge_rate)
+        parsed = parse_action(action)
+        if parsed.invalid is not None:
+            self._fallback_to_auto(parsed.invalid)
+        action = parsed.action
+        nothing = np.zeros(len(bank))
+        if action == Action.CHARGE:
+            return bank.charge_battery(balance, self.interval), nothing
+        if action == Action.DISCHARGE:
+            if feed_in_power_limitation:
+                return nothing, bank.discharge_battery(-balance, self.interval,
+                                                       feed_in_power_limitation=feed_in_power_limitation - balance)
+            return nothing, bank.discharge_battery(-balance, self.interval)
+        if action in (Action.STOPPED, Action.FULLSTOP):
+            return nothing, nothing
+        if action == Action.EXPORT0:
+            return nothing, bank.discharge_battery(bank.discharge_rate, self.interval, feed_in_power_limitation=0 - balance)
+        if action == Action.EXPORT200:
+            # Charging never exports, so the 200W feed-in limit only matters when discharging
+            if balance > 0:
+                return bank.charge_battery(balance, self.interval), nothing
+            return nothing, bank.discharge_battery(-balance, self.interval)
+        if action in (Action.EXPORT, Action.EXPORT100):
+            if action == Action.EXPORT100 and feed_in_power_limitation is None:
+                feed_in_power_limitation = 100
+            if feed_in_power_limitation is not None:
+                return nothing, bank.discharge_battery(bank.discharge_rate, self.interval,
+                                                       feed_in_power_limitation=feed_in_power_limitation - balance)
+            return nothing, bank.discharge_battery(bank.discharge_rate, self.interval)
+        if action in (Action.IMPORT, Action.IMPORT_NO_SOLAR, Action.IMPORT_AT_MAX):
+            import_rate = bank.charge_rate
+            if self.grid_limit:
+                import_rate = np.minimum(bank.charge_rate, max(0, self.grid_limit + balance))
+            return bank.charge_battery(np.maximum(import_rate, 0), self.interval), nothing
+        if balance > 0:
+            return bank.charge_battery(balance, self.interval), nothing
+        return nothing, bank.discharge_battery(-balance, self.interval)
+
     def _update_simulation_data(self, action: str, reason: str, solar_power: float, charge: float, discharge: float, house_power: float,
                                 buy_price: float, sell_price: float, start_battery_soc: float,
                                 feed_in_power_limitation: float, solar_curtailed: float, params={}) -> None:
@@ -292,11 +503,11 @@ class InverterSimulator:
         self.battery_socs.append(self.battery.soc)
         self.solar_curtailed.append(solar_curtailed)
         self.actions.append(action)
-        self.reasons.append(reason)
+        # Scripts build equal reasons afresh every interval; interned they share one string
+        self.reasons.append(intern(reason) if type(reason) is str else reason)
         self.params.append(params)
 
         balance = solar_power - house_power - charge + discharge
-        # print('balance', balance, 'solar_power', solar_power, 'house_power', house_power, 'charge', charge, 'discharge', discharge)
         self.grid_power = balance
         self.balances.append(balance)
 
@@ -306,73 +517,410 @@ class InverterSimulator:
             self.energy_from_grid.append(-kwh_balance)
             self.power_to_grid.append(0)
             self.energy_to_grid.append(0)
-            self.last_cost = buy_price * -kwh_balance
         else:
             self.power_from_grid.append(0)
             self.energy_from_grid.append(0)
             self.power_to_grid.append(balance)
             self.energy_to_grid.append(kwh_balance)
-            self.last_cost = -sell_price * kwh_balance
-        self.last_cost += self.daily_fee / (60 * 24 / self.interval)
+        self.grid_history.append(self.power_from_grid[-1])
+        self.last_cost = self._interval_cost(kwh_balance, buy_price, sell_price)
         self.sim_costs.append(self.last_cost)
 
+    def _interval_cost(self, kwh_balance: float, buy_price: float, sell_price: float) -> float:
+        if kwh_balance < 0:
+            cost = buy_price * -kwh_balance
+        else:
+            cost = -sell_price * kwh_balance
+        return cost + self.daily_fee / (60 * 24 / self.interval)
+
     def run_simulation(self) -> Tuple[float, pd.DataFrame]:
-        for index, row in self.system.iterrows():
+        # A vector policy has no per-interval state to build, so it always runs on the array loop
+        if self.engine == 'numpy' or is_vector_policy(self.control_function):
+            return self._run_numpy_simulation()
+        self._prepare_forecast_tariffs()
+        instrumentation = self._start_instrumentation()
+        for position, (index, row) in enumerate(self.system.iterrows()):
+            if instrumentation is not None:
+                started = perf_counter()
             self.current_interval = index
-            params = self.get_state()
-            params['past_power_from_grid'] = self.power_from_grid[:-12] if len(self.power_from_grid) > 12 else self.power_from_grid
+            params = self._create_state_dict(row)
+            params['past_power_from_grid'] = self._past_power_from_grid()
             if 'interval_time' in params:
                 del params['interval_time']
-            if 'buy_forecast' not in params:
-                params['buy_forecast'] = [self.spot_to_tariff(index, self.network, self.tariff, f) for f in row['forecast']]
-            if 'sell_forecast' not in params:
-                params['sell_forecast'] = [self.spot_to_feed_in_tariff(f) for f in row['forecast']]
-            self._process_interval(index, row, *self.control_function(index, **params))
-        self._calculate_final_metrics()
+            self._add_forecasts(params, position, index, row.get('forecast'))
+            if instrumentation is not None:
+                state_done = perf_counter()
+            decision = self.control_function(index, **params)
+            if instrumentation is not None:
+                control_done = perf_counter()
+            self._process_interval(index, row, *decision)
+            if instrumentation is not None:
+                instrumentation.record(position, started, state_done, control_done, perf_counter())
+        self._finish_run()
         return self.algo_sim_usage, self.system
 
-    def _calculate_final_metrics(self) -> None:
-        self.system['charge'] = self.charges
-        self.system['discharge'] = self.discharges
-        self.system['battery_power'] = self.battery_power
-        self.system['action'] = self.actions
-        self.system['reason'] = self.reasons
-        self.system['battery_charge'] = self.battery_charges
-        self.system['battery_soc'] = self.battery_socs
-        self.system['balance'] = self.balances
-        self.system['sim_grid'] = self.balances
-        self.system['grid_power'] = self.balances
-        self.system['sim_cost'] = self.sim_costs
-        self.system['solar_power'] = self.solar_powers
-        self.system['Power from grid'] = self.power_from_grid
-        self.system['Power to grid'] = self.power_to_grid
-        self.system['Energy from grid'] = self.energy_from_grid
-        self.system['Energy to grid'] = self.energy_to_grid
-        self.system['feed_in_power_limitation'] = self.feed_in_power_limitation
-        self.system['solar_curtailed'] = self.solar_curtailed
-        existing_columns = set(self.system.columns)
-        new_columns = set()
-        for param in self.params:
-            for key, value in param.items():
-                if key not in existing_columns and key not in new_columns:
-                    new_columns.add(key)
-        # Remove any columns with incorrect length
-        for col in list(self.system.columns):
-            if len(self.system[col]) != len(self.system.index):
-                self.system.drop(columns=[col], inplace=True)
-        # Add new columns with correct length
-        new_cols_dict = {}
-        for new_col in new_columns:
-            values = [param.get(new_col, None) for param in self.params]
-            if len(values) == len(self.system.index):
-                new_cols_dict[new_col] = values
-        if new_cols_dict:
-            new_cols_df = pd.DataFrame(new_cols_dict, index=self.system.index)
-            self.system = pd.concat([self.system, new_cols_df], axis=1)
-        
+    def _start_instrumentation(self) -> Optional[Instrumentation]:
+        self.instrumentation = Instrumentation(len(self.system)) if self.instrument else None
+        self.report = None
+        return self.instrumentation
+
+    def _finish_run(self, store: Optional[ResultStore] = None) -> None:
+        """Build the result frame and, when instrumented, the report with the final metrics timing."""
+        if self.instrumentation is None:
+            self._calculate_final_metrics(store)
+            return
+        started = perf_counter()
+        self._calculate_final_metrics(store)
+        self.instrumentation.finish(perf_counter() - started)
+        self.report = self.instrumentation.report(self.system['action'].to_numpy(), self.fallbacks)
+        self.system.attrs['instrumentation'] = self.report
+
+    def _load_arrays(self) -> dict:
+        """Read the interval inputs into contiguous float arrays once, mirroring _get_params."""
+        system = self.system
+        if 'buy_price' not in system.columns:
+            raise ValueError('buy_price is not in the system dataframe')
+        if 'sell_price' in system.columns:
+            sell_price = system['sell_price'].to_numpy(dtype=float)
+        else:
+            sell_price = np.array([self.spot_to_feed_in_tariff(f) for f in system['forecast']], dtype=float)
+        if 'start_battery_soc' in system.columns:
+            start_battery_soc = system['start_battery_soc'].to_numpy(dtype=float)
+        else:
+            start_battery_soc = np.zeros(len(system))
+        return {
+            'house_power': system['house_power'].to_numpy(dtype=float),
+            'solar_power': system['solar_power'].to_numpy(dtype=float),
+            'buy_price': system['buy_price'].to_numpy(dtype=float),
+            'sell_price': sell_price,
+            'start_battery_soc': start_battery_soc,
+        }
+
+    def _policy_decisions(self) -> Optional[PolicyDecisions]:
+        """Run a vector policy over the whole system, or None for a per-interval control function."""
+        if not is_vector_policy(self.control_function):
+            return None
+        result = self.control_function(self.system.index, **policy_columns(self.system, self.interval))
+        return PolicyDecisions(result, len(self.system))
+
+    def _run_numpy_simulation(self) -> Tuple[float, pd.DataFrame]:
+        inputs = self._load_arrays()
+        house_powers = inputs['house_power']
+        solar_inputs = inputs['solar_power']
+        buy_prices = inputs['buy_price']
+        sell_prices = inputs['sell_price']
+        start = 0
+        store = ResultStore(self.system.index, exclude=self.system.columns)
+        if self._resume_from is not None:
+            start, store = self._resume_from
+            self._resume_from = None
+        checkpoint_every = self.checkpoint_every if self.checkpoint_path else None
+        core = store.core
+        solar_powers = core['solar_power']
+        charges = core['charge']
+        discharges = core['discharge']
+        battery_charges = core['battery_charge']
+        battery_socs = core['battery_soc']
+        balances = core['balance']
+        power_from_grid = core['power_from_grid']
+        power_to_grid = core['power_to_grid']
+        energy_from_grid = core['energy_from_grid']
+        energy_to_grid = core['energy_to_grid']
+        sim_costs = core['sim_cost']
+        solar_curtailed = core['solar_curtailed']
+        feed_in_power_limitation = core['feed_in_power_limitation']
+        actions = core['action']
+        action_code = store.actions.code
+        reasons = core['reason']
+        hours_per_interval = self.interval / 60
+
+        instrumentation = self._start_instrumentation()
+        decisions = self._policy_decisions()
+        if decisions is None:
+            self._prepare_forecast_tariffs()
+            columns = {col: self.system[col].tolist() for col in self.system.columns}
+            forecasts = columns.get('forecast')
+            static, containers = self._static_state()
+        for i, interval_time in enumerate(self.system.index[start:], start):
+            if instrumentation is not None:
+                started = perf_counter()
+            self.current_interval = interval_time
+            if decisions is None:
+                params = self._interval_state(columns, i, static, containers)
+                params['past_power_from_grid'] = self._past_power_from_grid()
+                if 'interval_time' in params:
+                    del params['interval_time']
+                self._add_forecasts(params, i, interval_time, forecasts[i] if forecasts else None)
+                if instrumentation is not None:
+                    state_done = perf_counter()
+                action, reason, *rest = self.control_function(interval_time, **params)
+                if instrumentation is not None:
+                    control_done = perf_counter()
+                step_params = rest[0] if rest else {}
+            else:
+                action = decisions.actions[i]
+                reason = decisions.reasons[i]
+                step_params = decisions.params_at(i)
+                if instrumentation is not None:
+                    state_done = control_done = perf_counter()
+
+            house_power = house_powers[i]
+            solar_power, curtailed, charge, discharge = self._step(action, house_power, solar_inputs[i], step_params)
+            balance = solar_power - house_power - charge + discharge
+            kwh_balance = balance * hours_per_interval / 1000
+            solar_powers[i] = solar_power
+            charges[i] = charge
+            discharges[i] = discharge
+            battery_charges[i] = self.battery.charge
+            battery_socs[i] = self.battery.soc
+            solar_curtailed[i] = curtailed
+            feed_in_power_limitation[i] = step_params.get('feed_in_power_limitation', None)
+            actions[i] = action_code(action)
+            reasons[i] = intern(reason) if type(reason) is str else reason
+            store.record_params(i, step_params)
+            balances[i] = balance
+            if kwh_balance < 0:
+                power_from_grid[i] = -balance
+                energy_from_grid[i] = -kwh_balance
+            else:
+                power_to_grid[i] = balance
+                energy_to_grid[i] = kwh_balance
+            self.grid_history.append(power_from_grid[i])
+            sim_costs[i] = self.last_cost = self._interval_cost(kwh_balance, buy_prices[i], sell_prices[i])
+            self.grid_power = balance
+            if instrumentation is not None:
+                instrumentation.record(i, started, state_done, control_done, perf_counter())
+            if checkpoint_every and (i + 1) % checkpoint_every == 0:
+                self.save_checkpoint(self.checkpoint_path, store, i + 1)
+        store.core['battery_power'] = discharges - charges
+
+        self.solar_powers = solar_powers
+        self.charges = charges
+        self.discharges = discharges
+        self.battery_power = store.core['battery_power']
+        self.battery_charges = battery_charges
+        self.battery_socs = battery_socs
+        self.balances = balances
+        self.power_from_grid = power_from_grid
+        self.power_to_grid = power_to_grid
+        self.energy_from_grid = energy_from_grid
+        self.energy_to_grid = energy_to_grid
+        self.sim_costs = sim_costs
+        self.solar_curtailed = solar_curtailed
+        self.feed_in_power_limitation = feed_in_power_limitation
+        self.actions = store.actions.to_categorical(actions)
+        self.reasons = reasons
+        self._finish_run(store)
+        return self.algo_sim_usage, self.system
+
+    def save_checkpoint(self, path: str, store: ResultStore, position: int) -> None:
+        """Checkpoint a numpy engine run after `position` intervals have been processed.
+
+        Params columns that only echo the simulator's state (see _echoed_state) are not written,
+        so the checkpoint grows with what the control function decided, not with its inputs.
+        """
+        echoed = self._echoed_state()
+        state = {
+            'position': position,
+            'length': len(self.system),
+            'first_interval': str(self.system.index[0]),
+            'current_interval': str(self.current_interval),
+            'battery': {key: float(getattr(self.battery, key)) for key in ('charge', 'charge_rate', 'discharge_rate')},
+            'algo_sim_usage': float(self.algo_sim_usage),
+            'grid_power': float(self.grid_power),
+            'last_cost': float(getattr(self, 'last_cost', 0)),
+            'action_categories': [action if isinstance(action, (str, int, float)) else str(action)
+                                  for action in store.actions.categories],
+            'params': list(store.params),
+            'echoed': [key for key in store.params if key in echoed],
+        }
+        save_checkpoint(path, state,
+                        {key: values[:position] for key, values in store.core.items()},
+                        {key: values[:position] for key, values in store.params.items() if key not in echoed},
+                        self.grid_history.values())
+
+    def resume(self, path: str) -> None:
+        """Restore a checkpoint so the next run_simulation carries on from where it was written.
+
+        The simulator must be built from the same system and control function as the checkpointed run.
+        Echoed state params are rebuilt where they can be; the others are None before the checkpoint.
+        """
+        if self.engine != 'numpy':
+            raise ValueError("Resuming needs engine='numpy'")
+        state, core, params, history = load_checkpoint(path)
+        if state['length'] != len(self.system) or state['first_interval'] != str(self.system.index[0]):
+            raise ValueError(f'Checkpoint {path} was written for a different system')
+        position = state['position']
+        store = ResultStore(self.system.index, exclude=self.system.columns)
+        store.actions = ActionCategories(state['action_categories'])
+        for key, values in core.items():
+            store.core[key][:position] = values.astype(store.core[key].dtype)
+        for key, values in params.items():
+            if values.dtype.kind in 'OU':
+                column = store.params[key] = np.full(len(self.system), None, dtype=object)
+            else:
+                column = store.params[key] = np.full(len(self.system), np.nan)
+            column[:position] = values.astype(column.dtype)
+        echoed = self._echoed_state()
+        for key in state.get('echoed', []):
+            rebuild = echoed.get(key)
+            if rebuild is None or not position:
+                store.params[key] = np.full(len(self.system), None, dtype=object)
+                continue
+            values = [rebuild(i) for i in range(position)]
+            column = store.params[key] = store._new_column(values[0])
+            column[:position] = values
+        # Columns in the order of the checkpointed run, as the result frame's params follow it
+        order = state.get('params', list(store.params))
+        store.params = {key: store.params[key] for key in order + list(store.params) if key in store.params}
+        for key, value in state['battery'].items():
+            setattr(self.battery, key, value)
+        self.algo_sim_usage = state['algo_sim_usage']
+        self.grid_power = state['grid_power']
+        self.last_cost = state['last_cost']
+        self.current_interval = self.system.index[position - 1] if position else self.system.index[0]
+        self.grid_history = self._new_grid_history(ring=self.grid_history.ring)
+        for value in history:
+            self.grid_history.append(value)
+        self._resume_from = (position, store)
+
+    def run_bank_simulation(self, bank: BatteryBank) -> Tuple[np.ndarray, pd.DataFrame]:
+        """Run every configuration of a BatteryBank against the system in a single pass.
+
+        The control function is called for each configuration with that configuration's
+        battery_charge, battery_soc and past_power_from_grid, as in a separate run. Configurations
+        that make the same decision are stepped together. A vector policy decides once for all.
+        Returns the total cost per configuration and the per-interval costs, one column per configuration.
+        """
+        if self.checkpoint_path:
+            raise ValueError('Bank runs do not write checkpoints')
+        inputs = self._load_arrays()
+        n = len(self.system)
+        m = len(bank)
+        sim_costs = np.zeros((n, m))
+        power_from_grid = np.zeros((n, m))
+        histories = [self._new_grid_history() for _ in range(m)]
+        hours_per_interval = self.interval / 60
+        daily_fee = self.daily_fee / (60 * 24 / self.interval)
+        everyone = np.arange(m)
+
+        decisions = self._policy_decisions()
+        if decisions is None:
+            self._prepare_forecast_tariffs()
+            columns = {col: self.system[col].tolist() for col in self.system.columns}
+            forecasts = columns.get('forecast')
+            static, containers = self._static_state()
+        for i, interval_time in enumerate(self.system.index):
+            self.current_interval = interval_time
+            if decisions is None:
+                groups = []
+                battery_charge, battery_soc = bank.charge.tolist(), bank.soc.tolist()
+                for j in range(m):
+                    params = self._interval_state(columns, i, static, containers)
+                    params['battery_charge'] = battery_charge[j]
+                    params['battery_soc'] = battery_soc[j]
+                    params['past_power_from_grid'] = self._past_power_from_grid(histories[j])
+                    if 'interval_time' in params:
+                        del params['interval_time']
+                    self._add_forecasts(params, i, interval_time, forecasts[i] if forecasts else None)
+                    action, reason, *rest = self.control_function(interval_time, **params)
+                    _add_to_group(groups, action, rest[0] if rest else {}, j)
+            else:
+                groups = [(decisions.actions[i], decisions.params_at(i), everyone)]
+
+            house_power = inputs['house_power'][i]
+            balance = self._bank_step(bank, groups, house_power, inputs['solar_power'][i]) - house_power
+            kwh_balance = balance * hours_per_interval / 1000
+            importing = kwh_balance < 0
+            power_from_grid[i] = np.where(importing, -balance, 0)
+            for j, history in enumerate(histories):
+                history.append(power_from_grid[i, j])
+            sim_costs[i] = np.where(importing, inputs['buy_price'][i] * -kwh_balance,
+                                    -inputs['sell_price'][i] * kwh_balance) + daily_fee
+        return sim_costs.sum(axis=0), pd.DataFrame(sim_costs, index=self.system.index)
+
+    def _bank_step(self, bank: BatteryBank, groups: list, house_power: float, solar_input: float) -> np.ndarray:
+        """Apply each group's decision to its configurations; returns solar_power - charge + discharge per configuration."""
+        if len(groups) == 1:
+            action, step_params, _ = groups[0]
+            solar_power, _, balance = self._curtail(action, house_power, solar_input, step_params)
+            charge, discharge = self._bank_charge_discharge(bank, action, balance, step_params)
+            return solar_power - charge + discharge
+        # Every decision steps the whole bank from the same state; each configuration keeps its own decision's outcome
+        before = {key: getattr(bank, key).copy() for key in ('charge', 'charge_rate', 'discharge_rate')}
+        after = {key: values.copy() for key, values in before.items()}
+        supplied = np.zeros(len(bank))
+        for action, step_params, members in groups:
+            for key, values in before.items():
+                setattr(bank, key, values.copy())
+            solar_power, _, balance = self._curtail(action, house_power, solar_input, step_params)
+            charge, discharge = self._bank_charge_discharge(bank, action, balance, step_params)
+            supplied[members] = (solar_power - charge + discharge)[members]
+            for key, values in after.items():
+                values[members] = getattr(bank, key)[members]
+        for key, values in after.items():
+            setattr(bank, key, values)
+        return supplied
+
+    def _calculate_final_metrics(self, store: Optional[ResultStore] = None) -> None:
+        if store is None:
+            store = ResultStore(self.system.index, exclude=self.system.columns)
+            for key, values in (('charge', self.charges), ('discharge', self.discharges),
+                                ('battery_power', self.battery_power), ('action', self.actions),
+                                ('reason', self.reasons), ('battery_charge', self.battery_charges),
+                                ('battery_soc', self.battery_socs), ('balance', self.balances),
+                                ('sim_cost', self.sim_costs), ('solar_power', self.solar_powers),
+                                ('power_from_grid', self.power_from_grid), ('power_to_grid', self.power_to_grid),
+                                ('energy_from_grid', self.energy_from_grid), ('energy_to_grid', self.energy_to_grid),
+                                ('feed_in_power_limitation', self.feed_in_power_limitation),
+                                ('solar_curtailed', self.solar_curtailed)):
+                store.set_column(key, values)
+            for position, params in enumerate(self.params):
+                store.record_params(position, params)
+        self.system = store.to_frame(self.system)
         self.algo_sim_usage = self.system['sim_cost'].sum()
 
 
 def sim_inverter(system: pd.DataFrame, control_function: Callable, **kwargs: Any) -> Tuple[float, pd.DataFrame]:
     sim = InverterSimulator(system, control_function, **kwargs)
     return sim.run_simulation()
+
+
+def _add_to_group(groups: list, action: Any, step_params: dict, member: int) -> None:
+    """Add a configuration to the group of configurations that made the same decision, or start one."""
+    for group in groups:
+        try:
+            same = group[0] == action and group[1] == step_params
+        except (TypeError, ValueError):
+            same = False
+        if same:
+            group[2].append(member)
+            return
+    groups.append((action, step_params, [member]))
+
+
+# A week of 5 minute intervals of past_power_from_grid is kept when streaming
+STREAM_HISTORY_DEPTH = 2016
+
+
+def stream_simulation(chunks: Iterable[pd.DataFrame], control_function: Callable,
+                      **kwargs: Any) -> Iterator[Tuple[float, pd.DataFrame]]:
+    """Simulate consecutive chunks of interval data, e.g. monthly NEM12 extracts.
+
+    Battery state, the grid history and the running cost carry across chunk boundaries and
+    past_power_from_grid is served from a ring buffer of past_power_from_grid_depth intervals,
+    so memory stays flat however long the history. Pass grid_limit explicitly, otherwise it is
+    taken from the first chunk. Yields the cumulative cost and the result frame of each chunk.
+    """
+    kwargs.setdefault('past_power_from_grid_depth', STREAM_HISTORY_DEPTH)
+    sim = None
+    total_cost = 0.0
+    for chunk in chunks:
+        if sim is None:
+            sim = InverterSimulator(chunk, control_function, **kwargs)
+            sim.grid_history = sim._new_grid_history(ring=True)
+        else:
+            sim.load_chunk(chunk)
+        cost, result = sim.run_simulation()
+        total_cost += cost
+        yield total_cost, result
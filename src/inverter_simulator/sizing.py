@@ -0,0 +1,105 @@
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from inverter_simulator.resolution import data_interval, resample_system
+from inverter_simulator.sweep import expand_grid, sweep_configs
+
+
+def representative_days(system: pd.DataFrame, days: int) -> pd.DataFrame:
+    """The rows of `days` whole days spread over the range of daily costs of the system.
+
+    Days are ranked by their grid draw (house_power - solar_power) weighted by buy_price when the
+    system has one, split into `days` groups of consecutive ranks and the middle day of each kept.
+    """
+    net = system['house_power'] - system['solar_power']
+    if 'buy_price' in system.columns:
+        net = net * system['buy_price']
+    dates = system.index.normalize()
+    daily = net.groupby(dates).mean().sort_values()
+    if days >= len(daily):
+        return system
+    chosen = [group[len(group) // 2] for group in np.array_split(daily.index.to_numpy(), days)]
+    return system[dates.isin(chosen)]
+
+
+def _days(system: pd.DataFrame) -> int:
+    return system.index.normalize().nunique()
+
+
+def _score(summary: pd.DataFrame, configs: List[dict], baseline_cost: Optional[float], days: int,
+           battery_price: Union[None, float, Callable[[dict], float]]) -> pd.DataFrame:
+    """Add annual savings against the baseline (in dollars, costs are cents) and the payback in years."""
+    if baseline_cost is None:
+        return summary
+    summary['annual_savings'] = (baseline_cost - summary['cost']) / 100 * 365 / days
+    if battery_price is not None:
+        summary['battery_price'] = [battery_price(config) if callable(battery_price)
+                                    else battery_price * config.get('battery_capacity', 0) / 1000 for config in configs]
+        savings = summary['annual_savings'].where(summary['annual_savings'] > 0)
+        summary['payback_years'] = (summary['battery_price'] / savings).fillna(np.inf)
+    return summary
+
+
+def _rank(summary: pd.DataFrame) -> pd.DataFrame:
+    key = 'payback_years' if 'payback_years' in summary.columns else 'cost'
+    return summary.sort_values([key, 'cost'], kind='stable')
+
+
+def optimize_sizing(system: pd.DataFrame, control_function: Callable, param_grid: Dict[str, Iterable],
+                    top_k: int = 3, coarse_interval: Optional[int] = 60, sample_days: Optional[int] = None,
+                    battery_price: Union[None, float, Callable[[dict], float]] = None,
+                    baseline_cost: Optional[float] = None, max_workers: Optional[int] = None,
+                    **kwargs: Any) -> dict:
+    """Find the best battery sizing in param_grid without running every configuration at full fidelity.
+
+    Every configuration is first swept on a cheap approximation of the system: resampled to
+    coarse_interval minutes and, with sample_days, cut down to that many representative_days.
+    The top_k of them are then swept again on the full system and the best of those returned.
+    battery_price, in dollars per kWh of battery_capacity or a function of a configuration,
+    ranks configurations by payback years rather than by cost. The payback is against a run
+    without a battery (charge_rate=0) at each fidelity, unless the full fidelity baseline_cost
+    (in cents, as sim_inverter returns) is given. max_workers and kwargs are as for sweep.
+    Returns the best params with their full fidelity cost (and annual_savings and payback_years
+    when there is a baseline), the coarse and fine summaries, and the runs and seconds of each stage.
+    """
+    configs = expand_grid(param_grid)
+    kwargs.pop('interval', None)
+    coarse_system = representative_days(system, sample_days) if sample_days else system
+    fine_interval = data_interval(system)
+    coarse_interval = coarse_interval or fine_interval
+    coarse_system = resample_system(coarse_system, coarse_interval)
+
+    def stage(frame: pd.DataFrame, interval: int, stage_configs: List[dict], baseline: Optional[float]) -> pd.DataFrame:
+        # The baseline runs in the same pool as the configurations, as one more with charge_rate=0
+        run_baseline = baseline is None and battery_price is not None
+        runs = stage_configs + [{**stage_configs[0], 'charge_rate': 0}] if run_baseline else stage_configs
+        summary = sweep_configs(frame, control_function, runs, max_workers=max_workers, interval=interval, **kwargs)
+        if run_baseline:
+            baseline = summary['cost'].iloc[-1]
+            summary = summary.iloc[:-1].drop(columns=[] if 'charge_rate' in stage_configs[0] else ['charge_rate'])
+        return _rank(_score(summary, stage_configs, baseline, _days(frame), battery_price))
+
+    start = time.perf_counter()
+    coarse = stage(coarse_system, coarse_interval, configs, None)
+    coarse_seconds = time.perf_counter() - start
+    names = list(param_grid)
+    shortlist = coarse[names].head(top_k).to_dict('records')
+    start = time.perf_counter()
+    fine = stage(system, fine_interval, shortlist, baseline_cost)
+    fine_seconds = time.perf_counter() - start
+    best = fine.iloc[0]
+    result = {
+        'params': shortlist[fine.index[0]],
+        'cost': best['cost'],
+        'coarse': coarse.reset_index(drop=True),
+        'fine': fine.reset_index(drop=True),
+        'runs': {'coarse': len(coarse), 'fine': len(fine)},
+        'seconds': {'coarse': coarse_seconds, 'fine': fine_seconds},
+    }
+    for key in ('annual_savings', 'payback_years'):
+        if key in fine.columns:
+            result[key] = best[key]
+    return result
@@ -0,0 +1,61 @@
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Dict, Iterable, Tuple
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+from astral import Observer
+from astral.sun import sun
+
+# Roughly ten years of days for a handful of sites
+SUN_TIMES_CACHE_SIZE = 16384
+
+
+@lru_cache(maxsize=SUN_TIMES_CACHE_SIZE)
+def sun_times(latitude: float, longitude: float, timezone_str: str, day: date) -> Tuple[datetime, datetime]:
+    """Sunrise and sunset for a site and local date, converted to the site timezone.
+
+    Results are kept in a bounded LRU cache keyed by (latitude, longitude, timezone, date),
+    so repeated calls for the intervals of one day only run the solar calculation once.
+    """
+    s = sun(Observer(latitude=latitude, longitude=longitude), date=day)
+    tz = ZoneInfo(timezone_str)
+    return s['sunrise'].astimezone(tz), s['sunset'].astimezone(tz)
+
+
+class SunTable:
+    """Sunrise and sunset precomputed for every date of a simulation, indexed by date.
+
+    Lookups for dates outside the table fall back to the shared sun_times cache.
+    """
+
+    def __init__(self, latitude: float, longitude: float, timezone_str: str, days: Iterable[date] = ()) -> None:
+        self.latitude = latitude
+        self.longitude = longitude
+        self.timezone_str = timezone_str
+        self.times: Dict[date, Tuple[datetime, datetime]] = {}
+        for day in days:
+            self.times[day] = sun_times(latitude, longitude, timezone_str, day)
+
+    @classmethod
+    def for_range(cls, latitude: float, longitude: float, timezone_str: str, start: date, end: date) -> 'SunTable':
+        days = pd.date_range(start, end, freq='D').date
+        return cls(latitude, longitude, timezone_str, days)
+
+    @classmethod
+    def for_index(cls, latitude: float, longitude: float, timezone_str: str, index: pd.DatetimeIndex) -> 'SunTable':
+        """Precompute every local date covered by a DataFrame index."""
+        if len(index) == 0:
+            return cls(latitude, longitude, timezone_str)
+        return cls(latitude, longitude, timezone_str, pd.unique(pd.DatetimeIndex(index).date))
+
+    def get(self, day: date) -> Tuple[datetime, datetime]:
+        times = self.times.get(day)
+        if times is None:
+            times = sun_times(self.latitude, self.longitude, self.timezone_str, day)
+            self.times[day] = times
+        return times
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame([(day, sunrise, sunset) for day, (sunrise, sunset) in sorted(self.times.items())],
+                            columns=['date', 'sunrise', 'sunset']).set_index('date')
@@ -0,0 +1,65 @@
+from typing import Any, Dict, Iterator, List, MutableMapping
+
+
+class IntervalState(MutableMapping):
+    """The state handed to a control function for one interval, without copying the row.
+
+    Row values are read lazily from column lists at `position`. Configuration that is fixed
+    for the run lives in a `static` mapping shared by every interval, and the few values that
+    change per interval (battery charge, sunrise, ...) in a small `dynamic` dict. Writes and
+    deletes go to a local overlay, so the shared mappings are never modified.
+    Lookups prefer overrides, then dynamic, then static, then the row, like _create_state_dict.
+    """
+
+    __slots__ = ('_columns', '_position', '_static', '_dynamic', '_overrides', '_deleted')
+
+    def __init__(self, columns: Dict[str, List[Any]], position: int, static: Dict[str, Any], dynamic: Dict[str, Any]) -> None:
+        self._columns = columns
+        self._position = position
+        self._static = static
+        self._dynamic = dynamic
+        self._overrides: Dict[str, Any] = {}
+        self._deleted: set = set()
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._overrides:
+            return self._overrides[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        if key in self._dynamic:
+            return self._dynamic[key]
+        if key in self._static:
+            return self._static[key]
+        return self._columns[key][self._position]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._overrides[key] = value
+        self._deleted.discard(key)
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self._overrides.pop(key, None)
+        self._deleted.add(key)
+
+    def __contains__(self, key: object) -> bool:
+        if key in self._overrides:
+            return True
+        if key in self._deleted:
+            return False
+        return key in self._dynamic or key in self._static or key in self._columns
+
+    def __iter__(self) -> Iterator[str]:
+        seen = set(self._overrides)
+        yield from self._overrides
+        for mapping in (self._dynamic, self._static, self._columns):
+            for key in mapping:
+                if key not in seen and key not in self._deleted:
+                    seen.add(key)
+                    yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f'IntervalState({dict(self)!r})'
@@ -0,0 +1,149 @@
+import itertools
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from inverter_simulator.memo import MEMO_STATS, MemoizedControl, hit_rate
+from inverter_simulator.script_errors import script_errors
+from inverter_simulator.simulator import sim_inverter
+
+SWEEP_PARAMETERS = ('battery_capacity', 'charge_rate', 'battery_loss', 'min_soc', 'grid_limit')
+
+# Per-worker state set by _init_worker: the shared system frame, control function and fixed kwargs
+_WORKER: Dict[str, Any] = {}
+
+
+def expand_grid(param_grid: Dict[str, Iterable]) -> List[dict]:
+    """Every combination of a parameter grid, in the order the values were given."""
+    unknown = set(param_grid) - set(SWEEP_PARAMETERS)
+    if unknown:
+        raise ValueError(f'Cannot sweep {sorted(unknown)}, expected some of {SWEEP_PARAMETERS}')
+    keys = list(param_grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(list(param_grid[key]) for key in keys))]
+
+
+def share_frame(system: pd.DataFrame, directory: str) -> dict:
+    """Write the numeric columns of a frame to .npy blocks, one per dtype, that workers memory-map.
+
+    Returns the spec _attach_frame needs. Columns keep their dtypes: other columns (object, bool
+    and nullable ones such as Int64) and the index travel with the spec and are pickled once per
+    worker rather than once per task. This saves pickling the frame for every task, not memory:
+    the frame each worker attaches, and the one each run simulates, are copies.
+    """
+    numeric: Dict[np.dtype, List[str]] = {}
+    for col in system.columns:
+        dtype = system[col].dtype
+        if isinstance(dtype, np.dtype) and dtype.kind in 'iuf':
+            numeric.setdefault(dtype, []).append(col)
+    blocks = []
+    for dtype, columns in numeric.items():
+        path = os.path.join(directory, f'system_{len(blocks)}.npy')
+        np.save(path, np.ascontiguousarray(system[columns].to_numpy(dtype=dtype).T))
+        blocks.append({'path': path, 'columns': columns})
+    shared = [col for columns in numeric.values() for col in columns]
+    return {
+        'blocks': blocks,
+        'numeric': shared,
+        'columns': list(system.columns),
+        'index': system.index,
+        'other': {col: system[col] for col in system.columns if col not in shared},
+    }
+
+
+def _attach_frame(spec: dict) -> pd.DataFrame:
+    frames = [pd.DataFrame(np.load(block['path'], mmap_mode='r').T, index=spec['index'], columns=block['columns'], copy=False)
+              for block in spec['blocks']]
+    if spec['other']:
+        frames.append(pd.DataFrame(spec['other'], index=spec['index']))
+    if len(frames) == 1:
+        return frames[0][spec['columns']]
+    return pd.concat(frames, axis=1)[spec['columns']]
+
+
+def _init_worker(spec: dict, control_function: Callable, kwargs: dict) -> None:
+    _WORKER['system'] = _attach_frame(spec)
+    _WORKER['control_function'] = control_function
+    _WORKER['kwargs'] = kwargs
+
+
+def summarise_run(cost: float, result: pd.DataFrame) -> dict:
+    return {
+        'cost': cost,
+        'energy_from_grid': result['Energy from grid'].sum(),
+        'energy_to_grid': result['Energy to grid'].sum(),
+        'battery_throughput': (result['discharge'].sum() + result['charge'].sum()) / 2,
+    }
+
+
+def _run_config(params: dict) -> dict:
+    control_function = _WORKER['control_function']
+    memoized = isinstance(control_function, MemoizedControl)
+    if memoized:
+        before = control_function.stats()
+    cost, result = sim_inverter(_WORKER['system'], control_function, **_WORKER['kwargs'], **params)
+    row = {**params, **summarise_run(cost, result)}
+    if memoized:
+        after = control_function.stats()
+        row['memo'] = {name: after[name] - before[name] for name in MEMO_STATS}
+    errors = script_errors(control_function)
+    if errors is not None:
+        row['script_errors'] = errors.report()
+    return row
+
+
+def _memo_stats(rows: List[dict]) -> Optional[dict]:
+    """The memoization counts of every run of a sweep added up, or None if it was not memoized."""
+    runs = [row.pop('memo') for row in rows if 'memo' in row]
+    if not runs:
+        return None
+    stats: Dict[str, Any] = {name: sum(run[name] for run in runs) for name in MEMO_STATS}
+    stats['hit_rate'] = hit_rate(stats)
+    stats['run_hit_rates'] = [hit_rate(run) for run in runs]
+    return stats
+
+
+def sweep(system: pd.DataFrame, control_function: Callable, param_grid: Dict[str, Iterable],
+          max_workers: Optional[int] = None, **kwargs: Any) -> pd.DataFrame:
+    """Run sim_inverter for every combination in param_grid and summarise the costs.
+
+    Runs are spread over a ProcessPoolExecutor; the input frame is sent to the workers once, its
+    numeric columns through memory-mapped files, instead of being pickled for every task, so control_function
+    and any kwargs (e.g. spot_to_tariff) must be picklable. max_workers=1 runs in process.
+    Returns one row per configuration: the swept parameters followed by cost and energy totals.
+    With a MemoizedControl the runs share its cache (per worker with a process pool) and the
+    summary's attrs['memo'] has the hits, misses and hit rate over the sweep and the hit rate of each run.
+    The script failures of a ScriptedControl's copies in the workers are merged into its own errors.
+    """
+    return sweep_configs(system, control_function, expand_grid(param_grid), max_workers=max_workers, **kwargs)
+
+
+def sweep_configs(system: pd.DataFrame, control_function: Callable, configs: List[dict],
+                  max_workers: Optional[int] = None, **kwargs: Any) -> pd.DataFrame:
+    """sweep for an explicit list of configurations, e.g. the shortlist of a coarser sweep."""
+    names = list(dict.fromkeys(key for config in configs for key in config))
+    with tempfile.TemporaryDirectory(prefix='inverter_sweep_') as directory:
+        spec = share_frame(system, directory)
+        if max_workers == 1:
+            _init_worker(spec, control_function, kwargs)
+            try:
+                rows = [_run_config(params) for params in configs]
+            finally:
+                _WORKER.clear()
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                     initargs=(spec, control_function, kwargs)) as executor:
+                rows = list(executor.map(_run_config, configs))
+    memo = _memo_stats(rows)
+    errors = script_errors(control_function)
+    for row in rows:
+        report = row.pop('script_errors', None)
+        if errors is not None and report is not None:
+            errors.merge(report)
+    summary = pd.DataFrame(rows, columns=names + ['cost', 'energy_from_grid', 'energy_to_grid', 'battery_throughput'])
+    if memo is not None:
+        summary.attrs['memo'] = memo
+    return summary
@@ -0,0 +1,66 @@
+from itertools import chain
+from typing import Any, Callable, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+def vectorized(fn: Callable) -> Callable:
+    """Mark a tariff function as accepting whole arrays of interval times and spot prices.
+
+    spot_to_tariff(interval_times, network, tariff, prices) and spot_to_feed_in_tariff(prices)
+    are then called once per run instead of once per forecast point.
+    """
+    fn.vectorized = True  # type: ignore[attr-defined]
+    return fn
+
+
+@vectorized
+def default_spot_to_tariff(interval_time: Any, network: Any, tariff: Any, price: Any) -> Any:
+    return price / 10
+
+
+@vectorized
+def default_spot_to_feed_in_tariff(price: Any) -> Any:
+    return price / 10
+
+
+def is_vectorized(fn: Callable) -> bool:
+    return getattr(fn, 'vectorized', False)
+
+
+def buy_tariff_array(spot_to_tariff: Callable, interval_times: Sequence, network: str, tariff: str,
+                     prices: np.ndarray) -> np.ndarray:
+    """Map spot prices to buy tariffs in one call, looping over a scalar function as a fallback."""
+    if is_vectorized(spot_to_tariff):
+        return np.asarray(spot_to_tariff(interval_times, network, tariff, prices), dtype=float)
+    return np.array([spot_to_tariff(interval_time, network, tariff, price)
+                     for interval_time, price in zip(interval_times, prices)], dtype=float)
+
+
+def feed_in_tariff_array(spot_to_feed_in_tariff: Callable, prices: np.ndarray) -> np.ndarray:
+    if is_vectorized(spot_to_feed_in_tariff):
+        return np.asarray(spot_to_feed_in_tariff(prices), dtype=float)
+    return np.array([spot_to_feed_in_tariff(price) for price in prices], dtype=float)
+
+
+class ForecastTariffs:
+    """Buy and sell tariffs for every forecast of a run, converted up front.
+
+    Forecasts are flattened into one array (they may differ in length) with each point tagged
+    with its row's interval time, mapped in a single tariff call and sliced back out per row.
+    """
+
+    def __init__(self, index: pd.Index, forecasts: Sequence[Sequence[float]], spot_to_tariff: Callable,
+                 spot_to_feed_in_tariff: Callable, network: str, tariff: str) -> None:
+        lengths = np.fromiter((len(forecast) for forecast in forecasts), dtype=np.int64, count=len(forecasts))
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)])
+        prices = np.fromiter(chain.from_iterable(forecasts), dtype=float, count=int(self.offsets[-1]))
+        self.buy = buy_tariff_array(spot_to_tariff, index.repeat(lengths), network, tariff, prices)
+        self.sell = feed_in_tariff_array(spot_to_feed_in_tariff, prices)
+
+    def buy_forecast(self, position: int) -> list:
+        return self.buy[self.offsets[position]:self.offsets[position + 1]].tolist()
+
+    def sell_forecast(self, position: int) -> list:
+        return self.sell[self.offsets[position]:self.offsets[position + 1]].tolist()
@@ -1,13 +1,27 @@
-from matplotlib import pyplot as plt
+"""
+Scripted simulation runs and the tools around them: battery loss calibration, permutation model
+battery activities and plotting.
+matplotlib and pytrader are imported by the functions that use them, so processes that only run
+scripts (e.g. process pool workers) do not pay for importing them; see benchmark.bench_import.
+"""
 import pandas as pd
 import math
 import json
+import hashlib
+import copy
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone  # noqa: F401
 from zoneinfo import ZoneInfo
 import numpy as np  # noqa: F401
-import asyncio  # noqa: F401
 from contextlib import suppress  # noqa: F401
+from inverter_simulator.calibration import calibrate
+from inverter_simulator.downsample import downsample_indices
+from inverter_simulator.memo import MemoizedControl, script_assigned_names, script_memo_key
+from inverter_simulator.options_cache import OptionsCache, default_cache_directory
+from inverter_simulator.script_errors import ScriptErrors
 from inverter_simulator.simulator import InverterSimulator
+from inverter_simulator.solar import SunTable
 from RestrictedPython import compile_restricted
 from RestrictedPython.Guards import guarded_iter_unpack_sequence
 from RestrictedPython import safe_builtins
@@ -18,11 +32,7 @@ from inverterintelligence.decision_logger import DecisionLogger
 from inverterintelligence.user_actions import block_code, get_error_details, process_params
 from inverterintelligence.ac_estimator import find_soc_needed_for_ac
 from inverterintelligence.ii_logging import logger
-from pytrader.permutation_model import PermutationModel, find_best_five_minute_trades
-from pytrader.aemo_retrieval import retrieve_forecasted_prices
-from pytrader.battery.battery_activity import BatteryActivity
 from inverterintelligence.format_utils import json_sanitize
-from unittest.mock import MagicMock
 
 
 def cicd_parse_script(script_lines):
@@ -60,29 +70,40 @@ def cicd_parse_line(line):
 def find_battery_loss(
     meter_data_df, file_name, interval,
     battery_capacity, tariff, export_tariff, network, charge_rate, max_ppv_power, daily_fee,
-    spot_to_tariff, state, grid_limit, latitude, longitude, timezone, battery_charge
+    spot_to_tariff, state, grid_limit, latitude, longitude, timezone, battery_charge, **kwargs
 ):
-    script_content = 'action = billed_action'
-    existing_bill = meter_data_df['billed_costs'].sum() - meter_data_df['billed_earnings'].sum()
-    best_battery_loss = None
-    best_difference = abs(existing_bill * 10)
-    for battery_loss in [5, 10, 15, 20, 25, 30]:
-        script_bill, ret_df = run_scripted_simulation(
-            meter_data_df, script_content, file_name, interval=interval,
-            battery_capacity=battery_capacity, tariff=tariff, export_tariff=export_tariff, network=network,
-            charge_rate=charge_rate, max_ppv_power=max_ppv_power, daily_fee=daily_fee,
-            spot_to_tariff=spot_to_tariff, state=state, battery_loss=battery_loss, grid_limit=grid_limit,
-            latitude=latitude, longitude=longitude, timezone_str=timezone, battery_charge=battery_charge)
-        difference = abs((script_bill - existing_bill))
-        if best_battery_loss and difference > best_difference:
-            logger.info("Battery loss optimization converged.")
-            break
-        if difference < best_difference:
-            best_difference = difference
-            best_battery_loss = battery_loss
-        print('battery_loss:', battery_loss, 'script_bill:', script_bill, 'existing_bill:', existing_bill, 'diff:', script_bill - existing_bill)
-    print('Best battery_loss:', best_battery_loss)
-    return best_battery_loss
+    """
+    Find the battery_loss that makes a replay of the billed actions cost what was billed.
+    Returns the fitted battery_loss; pass return_result=True for the full calibrate() result
+    (fitted params and the convergence trace) and bounds={'battery_loss': ..., 'min_soc': ...}
+    to fit min_soc as well. max_workers spreads the runs of each round over processes.
+    Failures of the replay, in process or in the workers, are summarised in the result's
+    'script_errors' and sampled under error_directory, as for run_scripted_simulation.
+    """
+    return_result = kwargs.pop('return_result', False)
+    bounds = kwargs.pop('bounds', None)
+    error_directory = kwargs.pop('error_directory', None)
+    control = ScriptedControl('action = billed_action', file_name, meter_data_df.index, battery_capacity=battery_capacity,
+                              charge_rate=charge_rate, max_ppv_power=max_ppv_power, tariff=tariff,
+                              export_tariff=export_tariff, latitude=latitude, longitude=longitude,
+                              timezone_str=timezone, error_directory=error_directory)
+    try:
+        result = calibrate(meter_data_df, control, bounds=bounds, interval=interval, battery_capacity=battery_capacity,
+                           spot_to_tariff=spot_to_tariff, tariff=tariff, export_tariff=export_tariff, network=network,
+                           charge_rate=charge_rate, max_ppv_power=max_ppv_power, daily_fee=daily_fee,
+                           grid_limit=grid_limit, battery_charge=battery_charge, **kwargs)
+    finally:
+        script_errors = control.errors.close()
+    result['script_errors'] = script_errors
+    for error in script_errors:
+        logger.warning(f"{error['count']} intervals of the replay failed with {error['type']}: {error['message']}")
+    for _, row in result['trace'].iterrows():
+        logger.info(f"calibration round {row['round']}: {dict(row[list(result['params'])])} "
+                    f"script_bill: {row['cost']} diff: {row['difference']}")
+    logger.info(f"Best battery_loss: {result['params'].get('battery_loss')} after {result['runs']} runs")
+    if return_result:
+        return result
+    return result['params'].get('battery_loss')
 
 
 def classify_battery(state='NSW', battery_capacity=50, charge_rate=25, charge=25,
@@ -97,6 +118,7 @@ def classify_battery(state='NSW', battery_capacity=50, charge_rate=25, charge=25
     base_unit = 25
     # Recalculate new capacity and proportionate charge
     new_capacity = int(classified_duration * base_unit)
+    from unittest.mock import MagicMock
     battery_soc = (charge / battery_capacity)
     new_charge = int(charge * battery_soc)
     logger.info(f"Classified battery: {state} capacity: {new_capacity} kWh charge: {new_charge} kWh")
@@ -105,8 +127,48 @@ def classify_battery(state='NSW', battery_capacity=50, charge_rate=25, charge=25
                      clairvoyant=clairvoyant, cash=cash, sink=sink)
 
 
-# Global cache for options to avoid recomputation per simulation run
-_OPTIONS_CACHE = {}
+def _build_permutation_options(half_hour_window, five_minute_window, capacity, charge_efficiency, discharge_efficiency):
+    from pytrader.permutation_model import PermutationModel
+    permutation_model = PermutationModel()
+    half_hour_options = permutation_model.get_options(
+        half_hour_window,
+        capacity=capacity,
+        in_discharge_efficiency=discharge_efficiency,
+        in_charge_efficiency=charge_efficiency
+    )
+    five_minute_options = permutation_model.get_five_minute_options(
+        capacity=capacity,
+        in_discharge_efficiency=discharge_efficiency,
+        in_charge_efficiency=charge_efficiency,
+        window=five_minute_window
+    )
+    return half_hour_options, five_minute_options
+
+
+# Options per permutation model input: a bounded in-memory LRU, over a shared on-disk store when a
+# directory is set (INVERTER_SIMULATOR_CACHE_DIR or set_options_cache_directory), so process pool workers
+# load the tables instead of rebuilding them. Created by _options_cache on first use.
+_OPTIONS_CACHE = None
+
+
+def _options_cache(directory=None):
+    global _OPTIONS_CACHE
+    if _OPTIONS_CACHE is None:
+        import pytrader
+        _OPTIONS_CACHE = OptionsCache(_build_permutation_options, maxsize=32, directory=directory or default_cache_directory(),
+                                      version=getattr(pytrader, '__version__', ''))
+    return _OPTIONS_CACHE
+
+
+def set_options_cache_directory(directory):
+    """
+    Keep the battery options on disk under directory (None for memory only) from now on in this process.
+    Workers started with spawn rather than fork read INVERTER_SIMULATOR_CACHE_DIR instead.
+    """
+    global _OPTIONS_CACHE
+    _OPTIONS_CACHE = None
+    if directory is not None:
+        _options_cache(directory)
 
 
 def build_options(
@@ -115,32 +177,15 @@ def build_options(
 ):
     """
     Build the battery options for the simulation.
-    Caches options globally per run to avoid recomputation.
+    Cached by the inputs of the permutation model in memory, and on disk when a cache directory is set (see OptionsCache).
     """
-    cache_key = str(f"{half_hour_window}_{five_minute_window}_{battery_capacity}_{charge_rate}_"
-                    f"{charge_efficiency}_{discharge_efficiency}")
-    if cache_key in _OPTIONS_CACHE:
-        return _OPTIONS_CACHE[cache_key]
-
     battery = classify_battery(state='NSW', clairvoyant=False, battery_capacity=battery_capacity,
                                charge_rate=charge_rate, charge_efficiency=charge_efficiency,
                                discharge_efficiency=discharge_efficiency,
                                charge=charge, cash=0, sink=0)
-    permutation_model = PermutationModel()
-    half_hour_options = permutation_model.get_options(
-        half_hour_window,
-        capacity=battery.battery_capacity,
-        in_discharge_efficiency=int(battery.discharge_efficiency),
-        in_charge_efficiency=int(battery.charge_efficiency)
-    )
-    five_minute_options = permutation_model.get_five_minute_options(
-        capacity=battery.battery_capacity,
-        in_discharge_efficiency=int(battery.discharge_efficiency),
-        in_charge_efficiency=int(battery.charge_efficiency),
-        window=five_minute_window
-    )
-    _OPTIONS_CACHE[cache_key] = (half_hour_options, five_minute_options)
-    return half_hour_options, five_minute_options
+    return _options_cache().get(half_hour_window=half_hour_window, five_minute_window=five_minute_window,
+                                capacity=battery.battery_capacity, charge_efficiency=int(battery.charge_efficiency),
+                                discharge_efficiency=int(battery.discharge_efficiency))
 
 
 def get_battery_activity(
@@ -162,21 +207,15 @@ def get_battery_activity(
     :param half_hour_window: The half-hour window for the battery options.
     :param five_minute_window: The five-minute window for the battery options.
     :return: A tuple containing the action and confidence of the battery activity."""
+    from pytrader.aemo_retrieval import retrieve_forecasted_prices
+    from pytrader.permutation_model import find_best_five_minute_trades
 
     battery = classify_battery(state='NSW', clairvoyant=False, battery_capacity=battery_capacity,
                                charge_rate=charge_rate, charge_efficiency=charge_efficiency,
                                discharge_efficiency=discharge_efficiency,
                                charge=charge, cash=0, sink=0)
     if five_min_options is None or half_hour_options is None:
-        half_hour_options, five_min_options = build_options(
-            half_hour_window=5,
-            five_minute_window=12,
-            battery_capacity=battery.battery_capacity,
-            charge_rate=battery.charge_rate,
-            charge_efficiency=battery.charge_efficiency,
-            discharge_efficiency=battery.discharge_efficiency,
-            charge=battery.charge
-        )
+        half_hour_options, five_min_options = _activity_options(battery)
     if five_min_forecast is None or forecast is None:
         five_min_forecast, forecast = retrieve_forecasted_prices(interval_time, battery, is_historic=False)
     five_minute_prices = [float(i) for i in five_min_forecast]
@@ -190,16 +229,111 @@ def get_battery_activity(
         half_hour_window=half_hour_window,
         charge=battery.charge  # type: ignore
     )
+    return _activity_action(max_permutation), confidence
+
+
+def _activity_options(battery):
+    return build_options(
+        half_hour_window=5,
+        five_minute_window=12,
+        battery_capacity=battery.battery_capacity,
+        charge_rate=battery.charge_rate,
+        charge_efficiency=battery.charge_efficiency,
+        discharge_efficiency=battery.discharge_efficiency,
+        charge=battery.charge
+    )
+
+
+def _activity_action(max_permutation):
+    from pytrader.battery.battery_activity import BatteryActivity
     action = BatteryActivity.get_action_by_cash(max_permutation["five_minute_permutation"][0])
     if action == BatteryActivity.HOLD:
-        action = 'stopped'
-    elif action == BatteryActivity.DISCHARGE:
-        action = 'export'
-    elif action == BatteryActivity.CHARGE:
-        action = 'import'
+        return 'stopped'
+    if action == BatteryActivity.DISCHARGE:
+        return 'export'
+    if action == BatteryActivity.CHARGE:
+        return 'import'
+    return 'auto'
+
+
+# Per-worker state for get_battery_activities, set by _init_activity_worker
+_ACTIVITY_WORKER = {}
+
+
+def _init_activity_worker(battery_kwargs, half_hour_window, five_minute_window):
+    battery = classify_battery(**battery_kwargs)
+    half_hour_options, five_min_options = _activity_options(battery)
+    _ACTIVITY_WORKER.update(half_hour_options=half_hour_options, five_min_options=five_min_options,
+                            half_hour_window=half_hour_window, five_minute_window=five_minute_window,
+                            charge=battery.charge)
+
+
+def _battery_activity_batch(prices):
+    """Run find_best_five_minute_trades for a batch of (five minute prices, half hour prices)."""
+    from pytrader.permutation_model import find_best_five_minute_trades
+    worker = _ACTIVITY_WORKER
+    results = []
+    for five_minute_prices, half_hour_prices in prices:
+        max_permutation, confidence = find_best_five_minute_trades(
+            five_min_options=worker['five_min_options'],
+            half_hour_options=worker['half_hour_options'],
+            five_min_prices=five_minute_prices,
+            half_hour_prices=half_hour_prices,
+            five_min_window=worker['five_minute_window'],
+            half_hour_window=worker['half_hour_window'],
+            charge=worker['charge']
+        )
+        results.append((_activity_action(max_permutation), confidence))
+    return results
+
+
+def get_battery_activities(
+    interval_times, five_min_forecasts=None, forecasts=None, state='NSW', battery_capacity=80, charge_rate=25,
+    charge_efficiency=95, discharge_efficiency=95, charge=40, half_hour_window=5, five_minute_window=12,
+    max_workers=None, batch_size=256
+):
+    """
+    get_battery_activity for every interval of a run at once.
+    :param interval_times: The interval times, e.g. the simulation index.
+    :param five_min_forecasts: The five-minute price forecast for each interval, aligned with interval_times.
+    :param forecasts: The half-hour price forecast for each interval. Intervals whose forecasts are None
+        (or all of them when not given) are retrieved with retrieve_forecasted_prices as before.
+    :param max_workers: Size of the process pool the intervals are spread over; 1 runs them in process.
+    :param batch_size: Intervals sent to a worker per task.
+    The other parameters are as for get_battery_activity. The battery is classified and its options
+    built once per process rather than once per interval.
+    :return: A tuple of arrays of the actions and confidences, one per interval.
+    """
+    from pytrader.aemo_retrieval import retrieve_forecasted_prices
+    battery_kwargs = dict(state='NSW', clairvoyant=False, battery_capacity=battery_capacity, charge_rate=charge_rate,
+                          charge_efficiency=charge_efficiency, discharge_efficiency=discharge_efficiency,
+                          charge=charge, cash=0, sink=0)
+    battery = classify_battery(**battery_kwargs)
+    count = len(interval_times)
+    prices = []
+    for i, interval_time in enumerate(interval_times):
+        five_min_forecast = five_min_forecasts[i] if five_min_forecasts is not None else None
+        forecast = forecasts[i] if forecasts is not None else None
+        if five_min_forecast is None or forecast is None:
+            five_min_forecast, forecast = retrieve_forecasted_prices(interval_time, battery, is_historic=False)
+        prices.append((np.asarray(five_min_forecast, dtype=float).tolist(), np.asarray(forecast, dtype=float).tolist()))
+    batches = [prices[start:start + batch_size] for start in range(0, count, batch_size)]
+    initargs = (battery_kwargs, half_hour_window, five_minute_window)
+    if max_workers == 1 or len(batches) <= 1:
+        _init_activity_worker(*initargs)
+        try:
+            results = [result for batch in batches for result in _battery_activity_batch(batch)]
+        finally:
+            _ACTIVITY_WORKER.clear()
     else:
-        action = 'auto'
-    return action, confidence
+        # Build the options here first so forked workers inherit them, or load them from the disk cache when one is set
+        _activity_options(battery)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_activity_worker,
+                                 initargs=initargs) as executor:
+            results = [result for batch in executor.map(_battery_activity_batch, batches) for result in batch]
+    actions = np.array([action for action, _ in results], dtype=object)
+    confidences = np.array([confidence for _, confidence in results])
+    return actions, confidences
 
 
 def guarded_unpack_sequence(seq, count):
@@ -212,81 +346,132 @@ def guarded_unpack_sequence(seq, count):
     raise ValueError(f"Cannot unpack sequence: Expected {count} elements, got {len(seq)}")
 
 
-def restricted_run_code(user_code, action_params, file_name=None):
+SAFE_AUGUMENTED_ASSIGNMENT_OPERATORS = (
+    '+=', '-=', '*=', '/=', '%=', '**=',
+    '<<=', '>>=', '|=', '^=', '&=', '//='
+)
 
-    user_code, block_code_count, user_code_count = block_code(user_code)
 
-    SAFE_AUGUMENTED_ASSIGNMENT_OPERATORS = (
-        '+=', '-=', '*=', '/=', '%=', '**=',
-        '<<=', '>>=', '|=', '^=', '&=', '//='
-    )
-    
-    def getattr_debug(obj, attr):
-        try:
-            return getattr(obj, attr)
-        except Exception as e:
-            type_name = type(obj).__name__
-            logger.error(f"Error accessing attribute '{attr}' of object '{obj}' (type: {type_name}): {e}")
-            raise e
+def custom_inplacevar(op, x, y):
+    assert op in SAFE_AUGUMENTED_ASSIGNMENT_OPERATORS
+    globs = {'x': x, 'y': y}
+    exec(f'x {op} y', {}, globs)
+    return globs['x']
+
+
+def build_restricted_globals():
+    """
+    Build the globals that do not change between intervals of a scripted run.
+    interval_time, hour and inverters are set per interval by restricted_run_code.
+    """
+    return {"__builtins__": safe_builtins,
+            "__import__": lambda name, globals=None, locals=None, fromlist=(), level=0: __import__(name),
+            "getattr": lambda obj, attr: getattr(obj, attr),
+            "_getitem_": lambda obj, attr: obj[attr],
+            "min": min,
+            "max": max,
+            "sum": sum,
+            "mean": lambda x: sum(x) / len(x) if len(x) else 0,
+            "math_log": math.log,
+            "sun": sun,
+            "all": all,
+            "any": any,
+            "list": list,
+            "range": range,
+            "sorted": sorted,
+            "enumerate": enumerate,
+            "timedelta": timedelta,
+            "datetime": datetime,
+            "timezone": timezone,
+            "ZoneInfo": ZoneInfo,
+            "suppress": suppress,
+            "next": next,
+            "np": np,
+            "log": logger.info if logger else lambda x: None,
+            "exit": lambda: None,
+            "quit": lambda: None,
+            "MagicMock": lambda: None,
+            "_inplacevar_": custom_inplacevar,
+            "_iter_unpack_sequence_": guarded_iter_unpack_sequence,
+            "_unpack_sequence_": guarded_unpack_sequence,
+            "_getiter_": iter}
+
+
+# Compiled scripts keyed by the sha256 of their source, so a run compiles its script once;
+# the least recently used are dropped beyond SCRIPT_CACHE_SIZE scripts
+SCRIPT_CACHE_SIZE = 64
+_SCRIPT_CACHE = OrderedDict()
+
+
+def compile_script(user_code):
+    """
+    Block, parse and compile a control script once.
+    Returns a dict with the blocked code, its line counts, the restricted byte code and the constant globals
+    (safe builtins plus the capitalised variables declared in the script).
+    A compile error is kept in 'error' (without its traceback) and raised on every execution, as before.
+    """
+    script_hash = hashlib.sha256(user_code.encode('utf-8')).hexdigest()
+    if script_hash in _SCRIPT_CACHE:
+        _SCRIPT_CACHE.move_to_end(script_hash)
+        return _SCRIPT_CACHE[script_hash]
+    blocked_code, block_code_count, user_code_count = block_code(user_code)
+    restricted_globals = build_restricted_globals()
+    compiled = {'hash': script_hash,
+                'user_code': blocked_code,
+                'block_code_count': block_code_count,
+                'user_code_count': user_code_count,
+                'globals': restricted_globals,
+                'byte_code': None,
+                'error': None}
+    try:
+        restricted_globals.update(read_vars_from_lines(blocked_code.split("\n")))
+        compiled['byte_code'] = compile_restricted(blocked_code, '<inline code>', 'exec')
+    except Exception as e:
+        compiled['error'] = e.with_traceback(None)
+    _SCRIPT_CACHE[script_hash] = compiled
+    if len(_SCRIPT_CACHE) > SCRIPT_CACHE_SIZE:
+        _SCRIPT_CACHE.popitem(last=False)
+    return compiled
+
+
+def _log_error_context(user_code, lineno):
+    lines = user_code.split('\n')
+    for x, line in enumerate(lines):
+        if x + 1 == lineno:
+            start = max(0, x - 3)
+            end = min(len(lines), x + 4)
+            logger.error(f"Context around error (lines {start+1}-{end}):")
+            for i in range(start, end):
+                marker = '>>' if i == x else '  '
+                logger.error(f"{marker} {i+1}: {lines[i]}")
+            break
+
+
+def restricted_run_code(user_code, action_params, file_name=None, compiled=None, errors=None):
+    """
+    Run a user script for one interval with action_params as its variables, returning them.
+    A failure is logged and sampled: with errors (a ScriptErrors) once per line and exception type,
+    in the background, otherwise every time to error_code.py and error_params.json as before.
+    """
+    if compiled is None:
+        compiled = compile_script(user_code)
+    user_code = compiled['user_code']
+    block_code_count = compiled['block_code_count']
+    user_code_count = compiled['user_code_count']
 
-    def getitem_debug(obj, key):
-        try:
-            return obj[key]
-        except Exception as e:
-            type_name = type(obj).__name__
-            logger.error(f"Error accessing item '{key}' of object '{obj}' (type: {type_name}): {e}")
-            raise e
-
-    def custom_inplacevar(op, x, y):
-        assert op in SAFE_AUGUMENTED_ASSIGNMENT_OPERATORS
-        globs = {'x': x, 'y': y}
-        exec(f'x {op} y', {}, globs)
-        return globs['x']
-    
     interval_time = action_params.get('interval_time', datetime.now())
-    hour = action_params.get('interval_time', datetime.now()).hour
     decisions = DecisionLogger()
-    restricted_globals = {"__builtins__": safe_builtins,
-                          "__import__": lambda name, globals=None, locals=None, fromlist=(), level=0: __import__(name),
-                          "getattr": lambda obj, attr: getattr(obj, attr),
-                          "_getitem_": lambda obj, attr: obj[attr],
-                          "min": min,
-                          "max": max,
-                          "sum": sum,
-                          "mean": lambda x: sum(x) / len(x) if x else 0,
-                          "math_log": math.log,
-                          "sun": sun,
-                          "all": all,
-                          "any": any,
-                          "list": list,
-                          "range": range,
-                          "sorted": sorted,
-                          "enumerate": enumerate,
-                          "timedelta": timedelta,
-                          "datetime": datetime,
-                          "timezone": timezone,
-                          "ZoneInfo": ZoneInfo,
-                          "suppress": suppress,
-                          "next": next,
-                          "interval_time": interval_time,
-                          "hour": hour,
-                          "inverters": {},
-                          "np": np,
-                          "log": logger.info if logger else lambda x: None,
-                          "exit": lambda: None,
-                          "quit": lambda: None,
-                          "MagicMock": lambda: None,
-                          "_inplacevar_": custom_inplacevar,
-                          "_iter_unpack_sequence_": guarded_iter_unpack_sequence,
-                          "_unpack_sequence_": guarded_unpack_sequence,
-                          "_getiter_": iter}
+    restricted_globals = dict(compiled['globals'])
+    restricted_globals['interval_time'] = interval_time
+    restricted_globals['hour'] = interval_time.hour
+    restricted_globals['inverters'] = {}
     try:
-        for key, value in read_vars_from_lines(user_code.split("\n")).items():
-            restricted_globals[key] = value
+        if compiled['error'] is not None:
+            # A copy, so the traceback (and the params it holds) of each interval is not chained onto the cached error
+            raise copy.copy(compiled['error'])
         action_params = process_params(action_params, restricted_globals)
-        byte_code = compile_restricted(user_code, '<inline code>', 'exec')
         action_params['decisions'] = decisions
-        exec(byte_code, restricted_globals, action_params)
+        exec(compiled['byte_code'], restricted_globals, action_params)
         if decisions.has_decisions():
             action_params['reason'] = decisions.get_reason()
         action_params['decisions'] = decisions.to_dict()
@@ -294,16 +479,15 @@ def restricted_run_code(user_code, action_params, file_name=None):
         # Extract line number, filename, offset, and text details for enhanced debugging
         # block_code_count, user_code_count, user_code, e
         lineno, filename, offset, error_text = get_error_details(block_code_count, user_code_count, user_code, e)
-        lines = user_code.split('\n')
-        for x, line in enumerate(lines):
-            if x + 1 == lineno:
-                start = max(0, x - 3)
-                end = min(len(lines), x + 4)
-                logger.error(f"Context around error (lines {start+1}-{end}):")
-                for i in range(start, end):
-                    marker = '>>' if i == x else '  '
-                    logger.error(f"{marker} {i+1}: {lines[i]}")
-                break
+        if errors is not None:
+            entry = errors.record(e, lineno=lineno, file_name=file_name, interval_time=interval_time)
+            if entry is not None:
+                _log_error_context(user_code, lineno)
+                logger.error(f"Error executing user code {file_name}: {e} (repeats are counted, samples in {errors.path})",
+                             exc_info=True)
+                errors.write_sample(entry, user_code, json.dumps(json_sanitize(action_params), indent=2))
+            return action_params
+        _log_error_context(user_code, lineno)
         logger.error(f"Error executing user code {file_name}: {e}", exc_info=True)
         with open('error_code.py', 'w') as f:
             f.write(user_code)
@@ -322,57 +506,130 @@ def log_code_context(user_code, lineno, context=4):
         logger.error(f"{prefix} {i+1:4d}: {lines[i]}")
     logger.error("------------------------")
 
-def run_scripted_simulation(meter_data_df, script_content, filename, interval, battery_capacity, tariff, network,  # noqa: C901
-                            charge_rate, max_ppv_power, daily_fee, spot_to_tariff, state,
-                            latitude, longitude, timezone_str, **kwargs):
-    default_action = kwargs.get('default_action', 'auto')
-    export_tariff = kwargs.get('export_tariff', tariff)
+class ScriptedControl:
+    """
+    The control function for a user script: runs the script for each interval with the default params.
+    Picklable, so scripted runs can be spread over processes; the script is compiled on first use in each process.
+    The decisions of each interval go to decision_log (a DecisionLog) when given, not to the result frame.
+    Script failures are collected in errors (a ScriptErrors writing its samples under error_directory).
+    A script whose header declares it pure (see script_memo_key) can be memoized with MemoizedControl.
+    """
 
-    def run_user_code(interval_time, **kwargs):
+    def __init__(self, script_content, filename, index, battery_capacity, charge_rate, max_ppv_power, tariff,
+                 export_tariff, latitude, longitude, timezone_str, default_action='auto', decision_log=None,
+                 error_directory=None):
+        self.script_content = script_content
+        self.filename = filename
+        self.battery_capacity = battery_capacity
+        self.charge_rate = charge_rate
+        self.max_ppv_power = max_ppv_power
+        self.tariff = tariff
+        self.export_tariff = export_tariff
+        self.latitude = latitude
+        self.longitude = longitude
+        self.default_action = default_action
+        self.decision_log = decision_log
+        self.errors = ScriptErrors(error_directory)
+        self.sun_table = SunTable.for_index(latitude, longitude, timezone_str, index)
+        self.location = LocationInfo("Sydney", "Australia", ZoneInfo(timezone_str), latitude, longitude)
+        self.compiled = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['compiled'] = None
+        return state
+
+    @property
+    def memo_key(self):
+        """The MemoKey the script's header declares; only read when the control is memoized."""
+        return script_memo_key(self.script_content)
+
+    @property
+    def assigned_names(self):
+        """The variables the script sets, which a memoized run treats as its outputs."""
+        return script_assigned_names(self.script_content)
+
+    def __call__(self, interval_time, **kwargs):
         try:
-            location = LocationInfo(name='', region=state, timezone=timezone_str,
-                                    latitude=latitude, longitude=longitude)
-            # Calculate sunrise and sunset times
-            s = sun(location.observer, date=interval_time.date())
-            sunrise = s['sunrise']
-            sunset = s['sunset']
-            timezone = ZoneInfo(timezone_str)
+            if self.compiled is None:
+                self.compiled = compile_script(self.script_content)
+            sunrise, sunset = self.sun_table.get(interval_time.date())
             params = {'interval_time': interval_time,
-                      'battery_capacity': battery_capacity,
-                      'charge_rate': charge_rate,
-                      'optimal_charging': charge_rate,
-                      'optimal_discharging': charge_rate,
-                      'max_ppv_power': max_ppv_power,
+                      'battery_capacity': self.battery_capacity,
+                      'charge_rate': self.charge_rate,
+                      'optimal_charging': self.charge_rate,
+                      'optimal_discharging': self.charge_rate,
+                      'max_ppv_power': self.max_ppv_power,
                       'action': 'auto',
                       'reason': 'default: auto',
-                      'latitude': latitude,
-                      'longitude': longitude,
-                      'tariff': tariff,
-                      'export_tariff': export_tariff,
+                      'latitude': self.latitude,
+                      'longitude': self.longitude,
+                      'tariff': self.tariff,
+                      'export_tariff': self.export_tariff,
                       'grid_power': 0,
-                      'export_limit_max': charge_rate,
-                      'feed_in_power_limitation': charge_rate,
+                      'export_limit_max': self.charge_rate,
+                      'feed_in_power_limitation': self.charge_rate,
                       'solar': 'maximise',
                       'temperatures_to_next_sun': [],
                       'soc_needed_for_ac': 0,
                       'manufacturer': '',
-                      'sunrise': sunrise.astimezone(timezone),
-                      'sunset': sunset.astimezone(timezone),
-                      'location': LocationInfo("Sydney", "Australia", timezone, latitude, longitude)}
+                      'sunrise': sunrise,
+                      'sunset': sunset,
+                      'location': self.location}
             for key, val in kwargs.items():
                 params[key] = val
 
-            params = restricted_run_code(script_content, params, filename)
+            params = restricted_run_code(self.script_content, params, self.filename, compiled=self.compiled,
+                                         errors=self.errors)
+            decisions = params.pop('decisions', None)
+            if hasattr(decisions, 'to_dict'):
+                # The script failed before its DecisionLogger was converted
+                decisions = decisions.to_dict()
+            if self.decision_log is not None:
+                self.decision_log.append(interval_time, params['action'], params['reason'], decisions)
             return params['action'], params['reason'], params
         except Exception as e:
-            logger.error(f"Error in user code {filename}: {e}", exc_info=True)
-            return default_action, f"Error: {e}"
+            if self.errors.record(e, file_name=self.filename, interval_time=interval_time) is not None:
+                logger.error(f"Error in user code {self.filename}: {e}", exc_info=True)
+            if self.decision_log is not None:
+                self.decision_log.append(interval_time, self.default_action, f"Error: {e}")
+            return self.default_action, f"Error: {e}"
+
 
-    sim = InverterSimulator(meter_data_df.copy(), run_user_code, interval=interval, battery_capacity=battery_capacity,
+def run_scripted_simulation(meter_data_df, script_content, filename, interval, battery_capacity, tariff, network,
+                            charge_rate, max_ppv_power, daily_fee, spot_to_tariff, state,
+                            latitude, longitude, timezone_str, **kwargs):
+    """
+    Simulate a user script over the meter data. Pass decision_log=DecisionLog(retention=...) to keep
+    the action, reason and decisions of each interval; the result frame has no decisions column.
+    Script failures are summarised in the result frame's attrs['script_errors'], one entry per line
+    and exception type with its count, and sampled under error_directory (see ScriptErrors).
+    memoize=True reuses the decisions of a script declared pure for intervals with the same key
+    (see MemoizedControl), with the hit statistics in attrs['memo']; other scripts run every interval.
+    """
+    decision_log = kwargs.pop('decision_log', None)
+    error_directory = kwargs.pop('error_directory', None)
+    memoize = kwargs.pop('memoize', False)
+    default_action = kwargs.get('default_action', 'auto')
+    export_tariff = kwargs.get('export_tariff', tariff)
+    run_user_code = ScriptedControl(script_content, filename, meter_data_df.index, battery_capacity=battery_capacity,
+                                    charge_rate=charge_rate, max_ppv_power=max_ppv_power, tariff=tariff,
+                                    export_tariff=export_tariff, latitude=latitude, longitude=longitude,
+                                    timezone_str=timezone_str, default_action=default_action, decision_log=decision_log,
+                                    error_directory=error_directory)
+    control_function = MemoizedControl(run_user_code) if memoize else run_user_code
+    sim = InverterSimulator(meter_data_df.copy(), control_function, interval=interval, battery_capacity=battery_capacity,
                             spot_to_tariff=spot_to_tariff, tariff=tariff, network=network,
                             charge_rate=charge_rate, max_ppv_power=max_ppv_power, daily_fee=daily_fee,
                             **kwargs)
-    return sim.run_simulation()
+    try:
+        cost, result = sim.run_simulation()
+    finally:
+        script_errors = run_user_code.errors.close()
+    result.attrs['script_errors'] = script_errors
+    if memoize:
+        result.attrs['memo'] = control_function.stats()
+    return cost, result
 
 
 def read_script_lines(filename):
@@ -427,7 +684,33 @@ ACTION_COLORS = {
 }
 
 
-def plot(ret_df, title='Simulation run'):  # noqa: C901
+def _action_changes(ret_df, action_column):
+    """Times, actions and y values of each change to a (non-empty) action, for labelling the battery chart."""
+    if not action_column:
+        return ret_df.index[:0], np.array([], dtype=object), np.array([])
+    actions = ret_df['action']
+    changed = (actions.shift(1) != actions).to_numpy()
+    labels = actions.to_numpy(dtype=object)[changed]
+    shown = np.fromiter((bool(action) and action == action for action in labels), dtype=bool, count=len(labels))
+    return ret_df.index[changed][shown], labels[shown], ret_df[action_column].to_numpy()[changed][shown]
+
+
+def _date_numbers(index):
+    """Matplotlib date numbers of a DatetimeIndex in one vectorized call, rather than one timestamp at a time."""
+    from matplotlib import dates as mdates
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    return mdates.date2num(index.to_numpy())
+
+
+def plot(ret_df, title='Simulation run', max_points=None):  # noqa: C901
+    """
+    Plot costs, grid power, battery, house and solar power and prices of a simulation run.
+    max_points draws each series with about that many points, the min and max of each bucket of
+    intervals, and one marker series per action instead of a text label per change. Use e.g.
+    max_points=4000 for runs of months or years; None draws every interval.
+    """
+    from matplotlib import pyplot as plt
     ret_df['cost'] = ret_df['sim_cost']
     interval = round((ret_df.index[1] - ret_df.index[0]) / pd.Timedelta(minutes=1))
     max_zoomed_rrp = 500
@@ -454,6 +737,28 @@ def plot(ret_df, title='Simulation run'):  # noqa: C901
 
     nb_bill = 0  # noqa
     retail_bill = ret_df['cost'].sum() / 100
+    # Cumulative costs are computed once and shared by the lines and fills
+    cost_cumsum = ret_df['cost'].cumsum()
+    has_retail = 'billed_costs' in ret_df.columns and 'billed_earnings' in ret_df.columns
+    if has_retail:
+        ret_df['retail_cost'] = (ret_df['billed_costs'] - ret_df['billed_earnings'])
+        retail_cumsum = ret_df['retail_cost'].cumsum()
+    action_column = 'battery_soc' if 'battery_soc' in ret_df.columns else 'battery_charge' if 'battery_charge' in ret_df.columns else ''
+    if 'action' in ret_df.columns:
+        change_times, change_actions, change_values = _action_changes(ret_df, action_column)
+    full_df = ret_df
+    if max_points:
+        plotted = [cost_cumsum] + ([retail_cumsum] if has_retail else []) + [
+            ret_df[col] for col in ('Power from grid', 'Power to grid', 'general_kwh', 'feed_in_kwh', 'battery_soc',
+                                    'start_battery_soc', 'battery_charge', 'battery_actual', 'house_consumption',
+                                    'ppv', 'rrp', 'buy_price') if col in ret_df.columns]
+        keep = downsample_indices([np.asarray(series, dtype=float) for series in plotted], max_points)
+        # Plot against date numbers, converting the dates is otherwise most of the drawing time
+        x = pd.Index(_date_numbers(ret_df.index[keep]))
+        ret_df = ret_df.iloc[keep].set_axis(x)
+        cost_cumsum = cost_cumsum.iloc[keep].set_axis(x)
+        if has_retail:
+            retail_cumsum = retail_cumsum.iloc[keep].set_axis(x)
     # five plots one ontop of the other, the first one twice as high as the others
     fig, ax = plt.subplots(
         5, 1, figsize=(20, 15), sharex=True,
@@ -467,22 +772,21 @@ def plot(ret_df, title='Simulation run'):  # noqa: C901
         a.spines['top'].set_visible(False)
         a.spines['right'].set_visible(False)
     # First show costs
-    start_date, end_date = ret_df.index[0], ret_df.index[-1]
+    start_date, end_date = full_df.index[0], full_df.index[-1]
     ax[0].set_title(f'{title}: {start_date.strftime("%Y-%m-%d")} to {end_date.strftime("%Y-%m-%d")}')
 
     algo_label = 'Simulation Run $%.2f' % retail_bill
-    ax[0].plot(ret_df['cost'].cumsum(), label=algo_label, color=ECONOMIST_COLORS["orange"])
-    if 'billed_costs' in ret_df.columns and 'billed_earnings' in ret_df.columns:
-        ret_df['retail_cost'] = (ret_df['billed_costs'] - ret_df['billed_earnings'])
+    ax[0].plot(cost_cumsum, label=algo_label, color=ECONOMIST_COLORS["orange"])
+    if has_retail:
         retail_label = 'Reported Bill'
-        ax[0].plot(ret_df['retail_cost'].cumsum(), label='%s $%.2f' % (retail_label, ret_df['retail_cost'].sum() / 100), color=ECONOMIST_COLORS["grey"])
+        ax[0].plot(retail_cumsum, label='%s $%.2f' % (retail_label, full_df['retail_cost'].sum() / 100), color=ECONOMIST_COLORS["grey"])
         # Highlight where cost is less than retail_cost (improvement)
-        improvement = ret_df['cost'].cumsum() < ret_df['retail_cost'].cumsum()
-        ax[0].fill_between(ret_df.index, ret_df['cost'].cumsum(), ret_df['retail_cost'].cumsum(),
+        improvement = cost_cumsum < retail_cumsum
+        ax[0].fill_between(ret_df.index, cost_cumsum, retail_cumsum,
                            where=improvement, color=ECONOMIST_COLORS["green"], alpha=0.2, label='Savings')
         # Highlight where cost is greater than retail_cost (worse)
-        worse = ret_df['cost'].cumsum() > ret_df['retail_cost'].cumsum()
-        ax[0].fill_between(ret_df.index, ret_df['cost'].cumsum(), ret_df['retail_cost'].cumsum(),
+        worse = cost_cumsum > retail_cumsum
+        ax[0].fill_between(ret_df.index, cost_cumsum, retail_cumsum,
                            where=worse, color=ECONOMIST_COLORS["red"], alpha=0.2, label='Extra Cost')
         ax[0].legend()
     ax[0].xaxis.set_visible(False)
@@ -505,9 +809,7 @@ def plot(ret_df, title='Simulation run'):  # noqa: C901
     ax[1].xaxis.set_visible(False)
     # now SOC and actions
     ax[2].xaxis.set_visible(False)
-    action_column = ''
     if 'battery_soc' in ret_df.columns:
-        action_column = 'battery_soc'
         ax[2].set_title('Battery SOC')
         ax[2].plot(ret_df['battery_soc'], label='Simulated soc (%)', color=ECONOMIST_COLORS["orange"])
         ax[2].legend()
@@ -515,7 +817,6 @@ def plot(ret_df, title='Simulation run'):  # noqa: C901
             ax[2].plot(ret_df['start_battery_soc'], label='Reported soc (%)', color=ECONOMIST_COLORS["grey"])
             ax[2].legend()
     elif 'battery_charge' in ret_df.columns:
-        action_column = 'battery_charge'
         ax[2].set_title('Battery charge')
         ax[2].plot(ret_df['battery_charge'], label='Battery charge (Wh)', color=ECONOMIST_COLORS["green"])
         ax[2].legend()
@@ -524,11 +825,17 @@ def plot(ret_df, title='Simulation run'):  # noqa: C901
             ax[2].legend()
     if 'action' in ret_df.columns:
         ax[2].set_title('Battery charge with actions')
-        ret_df['change_action'] = ret_df['action'].shift(1) != ret_df['action']
-        for row in ret_df[ret_df['change_action']].iterrows():
-            color = ACTION_COLORS.get(row[1]['action'], 'black')
-            if action_column in row[1] and row[1]['action']:
-                ax[2].text(row[0], row[1][action_column], f"{row[1]['action'][0]}", color=color)
+        full_df['change_action'] = full_df['action'].shift(1) != full_df['action']
+        if max_points:
+            # One marker series per action rather than a text artist per change
+            change_x = _date_numbers(change_times)
+            for action in dict.fromkeys(change_actions):
+                changes = change_actions == action
+                ax[2].plot(change_x[changes], change_values[changes], linestyle='none', marker=f'${str(action)[0]}$', markersize=8,
+                           color=ACTION_COLORS.get(action, 'black'))
+        else:
+            for x, action, y in zip(change_times, change_actions, change_values):
+                ax[2].text(x, y, f"{action[0]}", color=ACTION_COLORS.get(action, 'black'))
     ax[3].set_title('House and Solar Power')
     ax[3].plot(ret_df['house_consumption'], label='House Power (W)', color=ECONOMIST_COLORS["blue"])
     ax[3].fill_between(ret_df.index, 0, ret_df['house_consumption'], color=ECONOMIST_COLORS["blue"], alpha=0.15)
@@ -549,4 +856,6 @@ def plot(ret_df, title='Simulation run'):  # noqa: C901
     if 'buy_price' in ret_df.columns:
         ax[4].plot(ret_df['buy_price'], label='General price c/kWh', color=ECONOMIST_COLORS["darkblue"])
     ax[4].legend()
+    if max_points:
+        ax[4].xaxis_date()
     return fig, ax
@@ -0,0 +1,52 @@
+import unittest
+import numpy as np
+import pandas as pd
+from inverter_simulator.actions import Action, ActionCategories, parse_action
+
+
+class TestParseAction(unittest.TestCase):
+
+    def test_known_actions(self):
+        self.assertEqual(parse_action('export').action, Action.EXPORT)
+        self.assertEqual(parse_action('Import_No_Solar-cheap').action, Action.IMPORT_NO_SOLAR)
+        self.assertEqual(parse_action('auto_api_curtail').action, Action.AUTO)
+        self.assertEqual(parse_action(None), (Action.AUTO, None, False))
+
+    def test_invalid_action_runs_auto(self):
+        self.assertEqual(parse_action('Dump-typo'), (Action.AUTO, 'dump', False))
+
+    def test_curtailing_matches_exact_action(self):
+        self.assertTrue(parse_action('fullstop').curtails_solar)
+        self.assertTrue(parse_action('import_no_solar').curtails_solar)
+        self.assertFalse(parse_action('Fullstop').curtails_solar)
+        self.assertFalse(parse_action('import_no_solar-cheap').curtails_solar)
+
+    def test_unhashable_action(self):
+        self.assertEqual(parse_action(['charge']).action, Action.AUTO)
+
+
+class TestActionCategories(unittest.TestCase):
+
+    def test_codes_in_first_seen_order(self):
+        categories = ActionCategories()
+        self.assertEqual(categories.encode(['auto', 'charge', 'auto', None]).tolist(), [0, 1, 0, -1])
+        self.assertEqual(categories.categories, ['auto', 'charge'])
+        self.assertEqual(ActionCategories(['charge', 'auto']).code('auto'), 1)
+
+    def test_unhashable_action(self):
+        categories = ActionCategories(['auto'])
+        self.assertEqual(categories.code(['charge']), 1)
+        self.assertEqual(categories.code("['charge']"), 1)
+        self.assertEqual(categories.categories, ['auto', "['charge']"])
+
+    def test_missing_actions(self):
+        categories = ActionCategories()
+        codes = categories.encode(['auto', float('nan'), np.float64('nan'), pd.NA, None, 'auto'])
+        self.assertEqual(codes.tolist(), [0, -1, -1, -1, -1, 0])
+        self.assertEqual(categories.categories, ['auto'])
+        column = categories.to_categorical(codes)
+        self.assertEqual(column.isna().tolist(), [False, True, True, True, True, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
-from inverter_simulator.battery import Battery
+import numpy as np
+from inverter_simulator.battery import Battery, BatteryBank
 
 class TestBattery(unittest.TestCase):
     def setUp(self):
@@ -67,5 +68,60 @@ class TestBattery(unittest.TestCase):
         self.battery.reset()
         self.assertEqual(self.battery.charge, 5000)
 
+    def test_interval(self):
+        # Half an hour at 1000W stores six times the energy of 5 minutes
+        battery = Battery(capacity=10000, charge_rate=4600, initial_charge=5000, interval=30)
+        battery.charge_battery(1000)
+        self.assertAlmostEqual(battery.charge, 5000 + 6 * 79.1667, places=2)
+        battery.discharge_battery(1000, interval=5)
+        self.assertAlmostEqual(battery.charge, 5000 + 6 * 79.1667 - 83.3333 * 1.05, places=2)
+        # Never charged past capacity or discharged past min_soc within a long interval
+        battery = Battery(capacity=1000, charge_rate=5000, initial_charge=900, interval=60)
+        self.assertAlmostEqual(battery.charge_battery(5000), 100)
+        self.assertAlmostEqual(battery.discharge_ability(), 995 - 100)
+
+
+class TestBatteryBank(unittest.TestCase):
+    def setUp(self):
+        self.configs = [
+            {'capacity': 10000, 'charge_rate': 4600, 'initial_charge': 5000},
+            {'capacity': 5000, 'charge_rate': 2500, 'loss_rate': 10, 'min_soc': 20},
+            {'capacity': 20000, 'charge_rate': 10000, 'initial_charge': 19000},
+        ]
+        self.bank = BatteryBank.from_configs(self.configs)
+        self.batteries = [Battery(**config) for config in self.configs]
+
+    def assert_matches(self, bank_result, battery_results):
+        np.testing.assert_array_equal(bank_result, battery_results)
+        np.testing.assert_array_equal(self.bank.charge, [battery.charge for battery in self.batteries])
+        np.testing.assert_array_equal(self.bank.soc, [battery.soc for battery in self.batteries])
+
+    def test_initialization(self):
+        self.assertEqual(len(self.bank), 3)
+        np.testing.assert_array_equal(self.bank.charge, [5000, 2500, 19000])
+        np.testing.assert_array_equal(self.bank.min_charge, [1000, 1000, 2000])
+
+    def test_broadcast_scalars(self):
+        bank = BatteryBank(capacity=[5000, 10000], charge_rate=5000)
+        np.testing.assert_array_equal(bank.charge_rate, [5000, 5000])
+        np.testing.assert_array_equal(bank.charge, [2500, 5000])
+
+    def test_charge_matches_battery(self):
+        for amount in [1000, 6000, -500, 12000, 3000]:
+            self.assert_matches(self.bank.charge_battery(amount),
+                                [battery.charge_battery(amount) for battery in self.batteries])
+
+    def test_discharge_matches_battery(self):
+        for amount, limitation in [(1000, None), (6000, None), (1000, 500), (-1000, None), (8000, 0), (3000, 9000)]:
+            self.assert_matches(self.bank.discharge_battery(amount, feed_in_power_limitation=limitation),
+                                [battery.discharge_battery(amount, feed_in_power_limitation=limitation)
+                                 for battery in self.batteries])
+
+    def test_reset(self):
+        self.bank.charge_battery(5000)
+        self.bank.reset()
+        np.testing.assert_array_equal(self.bank.charge, [5000, 2500, 10000])
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,46 @@
+import json
+import os
+import tempfile
+import unittest
+from inverter_simulator.benchmark import IMPORT_BUDGET_SECONDS, bench_import, compare, run_benchmarks, save_results, synthetic_system
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_synthetic_system(self):
+        system = synthetic_system(days=2, seed=3)
+        self.assertEqual(len(system), 576)
+        for column in ['house_power', 'solar_power', 'buy_price', 'sell_price', 'forecast']:
+            self.assertIn(column, system.columns)
+        self.assertEqual(system['solar_power'].iloc[0], 0)
+        self.assertGreater(system['solar_power'].max(), 0)
+
+    def test_run_and_compare(self):
+        report = run_benchmarks(days=0.25)
+        names = [result['name'] for result in report['results']]
+        self.assertIn('sim_inverter[numpy]', names)
+        self.assertIn('Battery.charge/discharge', names)
+        for result in report['results']:
+            self.assertGreater(result['intervals_per_sec'], 0)
+            self.assertGreaterEqual(result['peak_memory_mb'], 0)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.json')
+            save_results(report, path)
+            with open(path) as f:
+                saved = json.load(f)
+        self.assertEqual(set(compare(saved, report)), set(names))
+        self.assertAlmostEqual(compare(saved, report)['sim_inverter[numpy]'], 1)
+
+    def test_import_budget(self):
+        imported = bench_import(repeat=1)
+        if imported is None:
+            self.skipTest('utils dependencies are not installed')
+        self.assertEqual(imported['heavy_modules'], [])
+        self.assertLessEqual(imported['seconds'], IMPORT_BUDGET_SECONDS)
+
+    def test_import_error(self):
+        self.assertIsNone(bench_import('import inverter_simulator.not_a_module', repeat=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
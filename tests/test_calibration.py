@@ -0,0 +1,90 @@
+import tempfile
+import unittest
+import pandas as pd
+from inverter_simulator.benchmark import synthetic_system
+from inverter_simulator.calibration import calibrate
+from inverter_simulator.script_errors import ScriptErrors
+from inverter_simulator.simulator import sim_inverter
+from tests.test_simulator import make_system
+
+
+def daily_control(interval_time, **params):
+    if interval_time.hour < 4:
+        return 'import', 'overnight'
+    if interval_time.hour >= 16:
+        return 'export', 'evening'
+    return 'auto', 'day'
+
+
+class FailingControl:
+    """Fails like a broken script in every interval, counting the failures as a ScriptedControl does."""
+
+    def __init__(self, directory):
+        self.errors = ScriptErrors(directory)
+
+    def __call__(self, interval_time, **params):
+        self.errors.record(NameError('billed_action'), lineno=1, file_name='billed.py', interval_time=interval_time)
+        return 'auto', 'Error'
+
+
+def billed_system(days=4, **params):
+    system = synthetic_system(days)
+    _, result = sim_inverter(system.copy(), daily_control, **params)
+    system['billed_costs'] = result['sim_cost'].to_numpy()
+    system['billed_earnings'] = 0.0
+    return system
+
+
+class TestCalibrate(unittest.TestCase):
+
+    def test_battery_loss(self):
+        system = billed_system(battery_loss=17)
+        result = calibrate(system, daily_control, max_workers=1, points=3, engine='numpy')
+        self.assertLessEqual(abs(result['difference']), abs(system['billed_costs'].sum()) * 0.001)
+        self.assertAlmostEqual(result['params']['battery_loss'], 17, delta=0.5)
+        trace = result['trace']
+        self.assertEqual(list(trace.columns), ['round', 'battery_loss', 'cost', 'difference', 'error'])
+        self.assertEqual(len(trace), result['runs'])
+        self.assertLess(result['runs'], 20)
+
+    def test_target_outside_bounds(self):
+        system = billed_system(battery_loss=30)
+        result = calibrate(system, daily_control, bounds={'battery_loss': (0, 10)}, max_workers=1)
+        self.assertEqual(result['params']['battery_loss'], 10)
+        self.assertEqual(result['runs'], 2)
+
+    def test_joint(self):
+        system = billed_system(battery_loss=12, min_soc=20)
+        result = calibrate(system, daily_control, bounds={'battery_loss': (0, 40), 'min_soc': (0, 50)},
+                           max_workers=1, points=2, resolution=1, engine='numpy')
+        self.assertAlmostEqual(result['params']['battery_loss'], 12, delta=1)
+        self.assertAlmostEqual(result['params']['min_soc'], 20, delta=1)
+        self.assertEqual(result['error'], result['trace']['error'].min())
+
+    def test_process_pool_matches_serial(self):
+        system = billed_system(days=2, battery_loss=8)
+        serial = calibrate(system, daily_control, max_workers=1, points=2, engine='numpy')
+        parallel = calibrate(system, daily_control, max_workers=2, points=2, engine='numpy')
+        self.assertEqual(serial['params'], parallel['params'])
+        pd.testing.assert_frame_equal(serial['trace'], parallel['trace'])
+
+    def test_script_errors_of_workers(self):
+        system = billed_system(days=1, battery_loss=8)
+        for max_workers in (1, 2):
+            with self.subTest(max_workers=max_workers), tempfile.TemporaryDirectory() as directory:
+                control = FailingControl(directory)
+                result = calibrate(system, control, max_workers=max_workers, points=2, max_rounds=2)
+                summary = control.errors.close()
+                self.assertEqual([entry['count'] for entry in summary], [len(system) * result['runs']])
+
+    def test_rejects_unknown_parameter(self):
+        with self.assertRaises(ValueError):
+            calibrate(billed_system(1), daily_control, bounds={'battery_size': (0, 1)})
+
+    def test_needs_a_target(self):
+        with self.assertRaises(ValueError):
+            calibrate(make_system(12), daily_control, max_workers=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
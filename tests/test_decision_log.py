@@ -0,0 +1,59 @@
+import unittest
+import pandas as pd
+from inverter_simulator.decision_log import DecisionLog
+
+
+def intervals(n=6):
+    return pd.date_range('2024-01-01', periods=n, freq='5min', tz='Australia/Brisbane')
+
+
+class TestDecisionLog(unittest.TestCase):
+
+    def fill(self, log):
+        actions = ['auto', 'auto', 'import', 'import', 'auto', 'export']
+        for i, interval_time in enumerate(intervals()):
+            log.append(interval_time, actions[i], f'rule {actions[i]}', {'rules': [actions[i]], 'price': 10})
+        return log
+
+    def test_all(self):
+        log = self.fill(DecisionLog())
+        self.assertEqual(len(log), 6)
+        self.assertEqual(log.seen, 6)
+        frame = log.to_frame()
+        self.assertTrue(frame.index.equals(intervals()))
+        self.assertEqual(list(frame['action']), ['auto', 'auto', 'import', 'import', 'auto', 'export'])
+        self.assertIsInstance(frame['reason'].dtype, pd.CategoricalDtype)
+        self.assertEqual(list(frame['reason'].cat.categories), ['rule auto', 'rule import', 'rule export'])
+        self.assertEqual(frame['decisions'].iloc[2], {'rules': ['import'], 'price': 10})
+        # Equal decisions are stored once
+        self.assertEqual(len(log._decision_values.values), 3)
+        self.assertIs(frame['decisions'].iloc[0], frame['decisions'].iloc[1])
+
+    def test_changes(self):
+        frame = self.fill(DecisionLog(retention='changes')).to_frame()
+        self.assertEqual(list(frame['action']), ['auto', 'import', 'auto', 'export'])
+        self.assertEqual(list(frame.index), list(intervals()[[0, 2, 4, 5]]))
+
+    def test_sampled(self):
+        log = self.fill(DecisionLog(retention='sampled', sample_every=4))
+        self.assertEqual(log.seen, 6)
+        self.assertEqual(list(log.to_frame().index), list(intervals()[[0, 4]]))
+
+    def test_expand_and_missing(self):
+        log = DecisionLog()
+        log.append(intervals()[0], 'auto', None)
+        log.append(intervals()[1], 'import', 'cheap', {'price': 5, 'rule': {'name': 'cheap'}})
+        frame = log.to_frame(expand=True)
+        self.assertEqual(list(frame.columns), ['action', 'reason', 'decisions.price', 'decisions.rule.name'])
+        self.assertTrue(pd.isna(frame['reason'].iloc[0]))
+        self.assertEqual(frame['decisions.rule.name'].iloc[1], 'cheap')
+        self.assertTrue(DecisionLog().to_frame().empty)
+        self.assertGreater(log.memory_bytes(), 0)
+
+    def test_unknown_retention(self):
+        with self.assertRaises(ValueError):
+            DecisionLog(retention='some')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+import numpy as np
+from inverter_simulator.downsample import downsample_indices, minmax_indices
+
+
+class TestDownsample(unittest.TestCase):
+
+    def setUp(self):
+        self.values = np.random.default_rng(3).normal(size=10_000)
+
+    def test_keeps_extremes_and_ends(self):
+        keep = minmax_indices(self.values, 100)
+        self.assertLessEqual(len(keep), 202)
+        self.assertEqual(keep[0], 0)
+        self.assertEqual(keep[-1], len(self.values) - 1)
+        self.assertIn(self.values.argmax(), keep)
+        self.assertIn(self.values.argmin(), keep)
+        self.assertTrue((np.diff(keep) > 0).all())
+
+    def test_bucket_envelope(self):
+        keep = minmax_indices(self.values, 100)
+        for bucket in np.array_split(np.arange(len(self.values)), 100)[:5]:
+            kept = keep[(keep >= bucket[0]) & (keep <= bucket[-1])]
+            self.assertEqual(self.values[kept].max(), self.values[bucket].max())
+
+    def test_short_series_unchanged(self):
+        np.testing.assert_array_equal(minmax_indices(self.values[:50], 100), np.arange(50))
+
+    def test_nan_only_picked_for_empty_bucket(self):
+        values = self.values.copy()
+        values[::2] = np.nan
+        keep = minmax_indices(values, 100)
+        self.assertFalse(np.isnan(values[keep[1:-1]]).any())
+
+    def test_union_of_series(self):
+        other = -self.values
+        keep = downsample_indices([self.values, other], 200)
+        self.assertTrue(set(minmax_indices(other, 100)) <= set(keep))
+        self.assertEqual(len(downsample_indices([], 200)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
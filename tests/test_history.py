@@ -0,0 +1,85 @@
+import pickle
+import unittest
+import numpy as np
+from inverter_simulator.history import GridHistory, PastPower
+
+
+def legacy_past(values):
+    return values[:-12] if len(values) > 12 else values
+
+
+class TestGridHistory(unittest.TestCase):
+
+    def test_past_matches_list_semantics(self):
+        history = GridHistory(capacity=4)
+        values = []
+        for i in range(40):
+            self.assertEqual(history.past().tolist(), legacy_past(values))
+            history.append(float(i))
+            values.append(float(i))
+        self.assertEqual(history.values().tolist(), values)
+
+    def test_past_is_read_only_view(self):
+        history = GridHistory()
+        for i in range(20):
+            history.append(i)
+        past = history.past()
+        self.assertFalse(past.flags.writeable)
+        self.assertFalse(past.flags.owndata)
+        with self.assertRaises(ValueError):
+            past[0] = 1
+
+    def test_depth_limits_past(self):
+        history = GridHistory(depth=5)
+        for i in range(30):
+            history.append(i)
+        self.assertEqual(history.past().tolist(), [13, 14, 15, 16, 17])
+
+    def test_ring_matches_growable(self):
+        ring = GridHistory(depth=7, ring=True)
+        growable = GridHistory(depth=7)
+        for i in range(100):
+            self.assertTrue(np.array_equal(ring.past(), growable.past()))
+            ring.append(i)
+            growable.append(i)
+        self.assertEqual(ring.values().tolist(), list(range(81, 100)))
+
+    def test_ring_needs_depth(self):
+        with self.assertRaises(ValueError):
+            GridHistory(ring=True)
+
+
+class TestPastPower(unittest.TestCase):
+
+    def test_behaves_as_list(self):
+        values = [float(i) for i in range(20)]
+        past = PastPower(np.array(values))
+        self.assertEqual(past, values)
+        self.assertEqual(len(past), 20)
+        self.assertEqual(past[-1], 19.0)
+        self.assertIsInstance(past[0], float)
+        self.assertEqual(past[-12:], values[-12:])
+        self.assertEqual(list(past), values)
+        self.assertEqual(list(reversed(past)), values[::-1])
+        self.assertEqual(sum(past) / len(past), np.mean(past))
+        self.assertEqual(past + [20.0], values + [20.0])
+        self.assertIn(3.0, past)
+        self.assertEqual(past.index(3.0), 3)
+        self.assertFalse(PastPower(np.zeros(0)))
+        self.assertEqual(repr(past), repr(values))
+        self.assertEqual(pickle.loads(pickle.dumps(past)), values)
+        with self.assertRaises(IndexError):
+            past[20]
+
+    def test_shares_the_history(self):
+        history = GridHistory()
+        for i in range(30):
+            history.append(i)
+        past = PastPower(history.past())
+        self.assertTrue(np.shares_memory(np.asarray(past), history.values()))
+        with self.assertRaises(TypeError):
+            past[0] = 1.0
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import pickle
+import unittest
+from inverter_simulator.memo import MemoKey, MemoizedControl, pure_policy, script_assigned_names, script_memo_key
+from inverter_simulator.policy import vector_policy
+from inverter_simulator.simulator import sim_inverter
+from inverter_simulator.sweep import sweep
+from tests.test_simulator import cycling_control, make_system
+
+
+@pure_policy(key=('interval_time', 'buy_price'))
+def pure_cycling_control(interval_time, **params):
+    return cycling_control(interval_time, **params)
+
+
+@pure_policy(key='buy_price', soc_step=10)
+def soc_control(interval_time, **params):
+    if params['battery_soc'] < 50:
+        return 'charge', 'low', {'battery_soc': params['battery_soc'], 'optimal_charging': 2000}
+    return 'auto', 'high'
+
+
+class TestMemoizedControl(unittest.TestCase):
+
+    def setUp(self):
+        self.system = make_system(96)
+        self.grid = {'battery_capacity': [5000, 10000], 'charge_rate': [2500, 5000]}
+
+    def test_sweep_matches_unmemoized(self):
+        plain = sweep(self.system, pure_cycling_control, self.grid, max_workers=1)
+        memo = MemoizedControl(pure_cycling_control)
+        memoized = sweep(self.system, memo, self.grid, max_workers=1)
+        self.assertTrue(plain.equals(memoized))
+        stats = memoized.attrs['memo']
+        self.assertEqual(stats['misses'], 96)
+        self.assertEqual(stats['hits'], 3 * 96)
+        self.assertEqual(stats['hit_rate'], 0.75)
+        self.assertEqual(stats['run_hit_rates'], [0.0, 1.0, 1.0, 1.0])
+        self.assertEqual(memo.stats()['size'], 96)
+        self.assertNotIn('memo', plain.attrs)
+
+    def test_sweep_process_pool(self):
+        memoized = sweep(self.system, MemoizedControl(pure_cycling_control), self.grid, max_workers=2, engine='numpy')
+        plain = sweep(self.system, pure_cycling_control, self.grid, max_workers=2, engine='numpy')
+        self.assertTrue(plain.equals(memoized))
+        self.assertEqual(memoized.attrs['memo']['hits'] + memoized.attrs['memo']['misses'], 4 * 96)
+
+    def test_undeclared_bypasses(self):
+        memo = MemoizedControl(cycling_control)
+        cost, _ = sim_inverter(self.system.copy(), memo)
+        self.assertEqual(cost, sim_inverter(self.system.copy(), cycling_control)[0])
+        self.assertEqual(memo.stats()['bypassed'], 96)
+        self.assertEqual(memo.stats()['hits'] + memo.stats()['misses'], 0)
+        self.assertEqual(len(memo), 0)
+
+    def test_soc_bucket(self):
+        memo = MemoizedControl(soc_control)
+        first = memo(None, buy_price=10, battery_soc=41)
+        self.assertEqual(first, ('charge', 'low', {'battery_soc': 41, 'optimal_charging': 2000}))
+        # Same bucket: reused, with the echoed state refreshed
+        self.assertEqual(memo(None, buy_price=10, battery_soc=49), ('charge', 'low', {'battery_soc': 49, 'optimal_charging': 2000}))
+        self.assertEqual(memo(None, buy_price=10, battery_soc=51), ('auto', 'high'))
+        self.assertEqual(memo(None, buy_price=10, battery_soc=float('nan')), ('auto', 'high'))
+        stats = memo.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['bypassed']), (1, 2, 1))
+
+    def test_outputs_equal_to_inputs(self):
+        @pure_policy(key='buy_price')
+        def floor_control(interval_time, **params):
+            return 'auto', 'floor', {'min_soc': 20, 'battery_soc': 50.0}
+        floor_control.assigned_names = {'min_soc'}
+        memo = MemoizedControl(floor_control)
+        memo(None, buy_price=10, min_soc=20, battery_soc=float('50'))
+        # Reused though they equalled the inputs of the first call: min_soc as the function sets it,
+        # battery_soc as it is not the input object passed back
+        self.assertEqual(memo(None, buy_price=10, min_soc=30, battery_soc=60.0),
+                         ('auto', 'floor', {'min_soc': 20, 'battery_soc': 50.0}))
+        self.assertEqual(memo.stats()['hits'], 1)
+
+    def test_maxsize(self):
+        memo = MemoizedControl(soc_control, maxsize=2)
+        for price in (1, 2, 3, 1):
+            memo(None, buy_price=price, battery_soc=60)
+        self.assertEqual(len(memo), 2)
+        self.assertEqual(memo.stats()['evictions'], 2)
+        self.assertEqual(memo.stats()['hits'], 0)
+
+    def test_pickle(self):
+        memo = MemoizedControl(pure_cycling_control)
+        sim_inverter(self.system.copy(), memo)
+        copy = pickle.loads(pickle.dumps(memo))
+        self.assertEqual(copy.memo_key, memo.memo_key)
+        self.assertEqual(len(copy), 0)
+        self.assertEqual(copy.stats()['misses'], 0)
+
+    def test_vector_policy(self):
+        with self.assertRaises(ValueError):
+            MemoizedControl(vector_policy(lambda interval_times, **columns: ['auto'] * len(interval_times)))
+
+    def test_declaration(self):
+        with self.assertRaises(ValueError):
+            pure_policy()
+        with self.assertRaises(ValueError):
+            pure_policy(key='buy_price', soc_step=0)
+
+
+class TestScriptMemoKey(unittest.TestCase):
+
+    def test_header(self):
+        script = '# Cheap import\n\n# pure: interval_time, buy_price ; soc_step=5\naction = "import"\n'
+        self.assertEqual(script_memo_key(script), MemoKey(('interval_time', 'buy_price'), 5.0))
+        self.assertEqual(script_memo_key('# PURE: buy_price\n'), MemoKey(('buy_price',), None))
+
+    def test_not_pure(self):
+        self.assertIsNone(script_memo_key('action = "import"\n'))
+        # Only the header counts
+        self.assertIsNone(script_memo_key('action = "import"\n# pure: buy_price\n'))
+
+    def test_assigned_names(self):
+        script = ("import math\naction = 'auto'\nbattery_soc += 1\nfor i in range(2):\n    pass\n"
+                  "total = [x for x in range(3)]\n")
+        self.assertEqual(script_assigned_names(script), {'math', 'action', 'battery_soc', 'i', 'total', 'x'})
+        self.assertEqual(script_assigned_names('action = (\n'), frozenset())
+
+    def test_unknown_option(self):
+        with self.assertRaises(ValueError):
+            script_memo_key('# pure: buy_price; soc=5\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from unittest import mock
+from inverter_simulator.options_cache import OptionsCache, default_cache_directory
+
+
+class TestOptionsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, 'options')
+        self.builds = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def build(self, window, capacity):
+        self.builds.append((window, capacity))
+        return np.arange(window * 3).reshape(window, 3) * capacity, {'window': window}
+
+    def test_default_directory(self):
+        with mock.patch.dict(os.environ, {'INVERTER_SIMULATOR_CACHE_DIR': ''}):
+            self.assertIsNone(default_cache_directory())
+        with mock.patch.dict(os.environ, {'INVERTER_SIMULATOR_CACHE_DIR': self.directory}):
+            self.assertEqual(default_cache_directory(), self.directory)
+
+    def test_default_is_memory_only(self):
+        with mock.patch.dict(os.environ, {'HOME': self.tmp.name}):
+            os.environ.pop('INVERTER_SIMULATOR_CACHE_DIR', None)
+            cache = OptionsCache(self.build, directory=default_cache_directory())
+            cache.get(window=5, capacity=50)
+        self.assertIsNone(cache.directory)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_memory_hits(self):
+        cache = OptionsCache(self.build)
+        first = cache.get(window=5, capacity=50)
+        self.assertIs(cache.get(window=5, capacity=50), first)
+        self.assertEqual(self.builds, [(5, 50)])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_lru_eviction(self):
+        cache = OptionsCache(self.build, maxsize=2)
+        cache.get(window=1, capacity=50)
+        cache.get(window=2, capacity=50)
+        cache.get(window=1, capacity=50)
+        cache.get(window=3, capacity=50)
+        cache.get(window=1, capacity=50)
+        cache.get(window=2, capacity=50)
+        self.assertEqual(self.builds, [(1, 50), (2, 50), (3, 50), (2, 50)])
+
+    def test_disk_tier_shared_between_caches(self):
+        OptionsCache(self.build, directory=self.directory).get(window=5, capacity=50)
+        worker = OptionsCache(self.build, directory=self.directory)
+        half_hour, five_minute = worker.get(window=5, capacity=50)
+        self.assertEqual(len(self.builds), 1)
+        self.assertEqual(worker.disk_hits, 1)
+        self.assertIsInstance(half_hour, np.memmap)
+        np.testing.assert_array_equal(half_hour, np.arange(15).reshape(5, 3) * 50)
+        self.assertEqual(five_minute, {'window': 5})
+
+    def test_invalidation(self):
+        OptionsCache(self.build, directory=self.directory, version='1.0').get(window=5, capacity=50)
+        OptionsCache(self.build, directory=self.directory, version='1.1').get(window=5, capacity=50)
+        OptionsCache(self.build, directory=self.directory, version='1.1').get(window=5, capacity=60)
+        self.assertEqual(self.builds, [(5, 50), (5, 50), (5, 60)])
+
+    def test_unreadable_entry_rebuilt(self):
+        cache = OptionsCache(self.build, directory=self.directory)
+        cache.get(window=5, capacity=50)
+        os.remove(os.path.join(self.directory, cache.key(window=5, capacity=50), '0.npy'))
+        with self.assertLogs('inverter_simulator.options_cache', level='WARNING'):
+            OptionsCache(self.build, directory=self.directory).get(window=5, capacity=50)
+        self.assertEqual(len(self.builds), 2)
+        self.assertEqual(OptionsCache(self.build, directory=self.directory).get(window=5, capacity=50)[1], {'window': 5})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import numpy as np
+import pandas as pd
+from inverter_simulator.benchmark import synthetic_system
+from inverter_simulator.resolution import aggregations, data_interval, resample_system, resolution_report
+from inverter_simulator.simulator import sim_inverter
+from tests.test_calibration import daily_control
+
+
+class TestResampleSystem(unittest.TestCase):
+
+    def setUp(self):
+        self.system = synthetic_system(1)
+        self.system['billed_costs'] = 1.0
+        self.system['general_kwh'] = 0.5
+
+    def test_aggregations(self):
+        rules = aggregations(self.system, how={'rrp': 'max'})
+        self.assertEqual(rules['house_power'], 'mean')
+        self.assertEqual(rules['billed_costs'], 'sum')
+        self.assertEqual(rules['general_kwh'], 'sum')
+        self.assertEqual(rules['forecast'], 'first')
+        self.assertEqual(rules['rrp'], 'max')
+
+    def test_resample(self):
+        resampled = resample_system(self.system, 30)
+        self.assertEqual(data_interval(resampled), 30)
+        self.assertEqual(len(resampled), 48)
+        self.assertEqual(resampled.index[0], self.system.index[0])
+        first = self.system.iloc[:6]
+        self.assertAlmostEqual(resampled['house_power'].iloc[0], first['house_power'].mean())
+        self.assertAlmostEqual(resampled['buy_price'].iloc[0], first['buy_price'].mean())
+        self.assertEqual(resampled['billed_costs'].iloc[0], 6)
+        self.assertEqual(resampled['forecast'].iloc[0], first['forecast'].iloc[0])
+        # Energy is kept
+        self.assertAlmostEqual(resampled['solar_power'].sum() * 30, self.system['solar_power'].sum() * 5, places=3)
+
+    def test_gaps_and_errors(self):
+        system = self.system.drop(self.system.index[12:24])
+        self.assertEqual(len(resample_system(system, 60)), 23)
+        self.assertEqual(len(resample_system(self.system, 5)), len(self.system))
+        with self.assertRaises(ValueError):
+            resample_system(self.system, 7)
+        with self.assertRaises(ValueError):
+            resample_system(self.system.iloc[:1], 30)
+
+
+class TestInterval(unittest.TestCase):
+
+    def test_constant_system_independent_of_interval(self):
+        # With constant power and prices every resolution sees the same energy, so the same bill
+        index = pd.date_range('2024-01-01', periods=288, freq='5min', tz='Australia/Brisbane')
+        system = pd.DataFrame({'house_power': 800.0, 'solar_power': np.where(index.hour < 12, 3000.0, 0.0),
+                               'rrp': 100.0, 'buy_price': 30.0, 'sell_price': 8.0}, index=index)
+        costs = [sim_inverter(resample_system(system, interval), daily_control, interval=interval, engine='numpy',
+                              battery_capacity=100000)[0] for interval in (5, 30, 60)]
+        np.testing.assert_allclose(costs, costs[0], rtol=1e-6)
+
+    def test_resolution_report(self):
+        report = resolution_report(synthetic_system(3), daily_control, intervals=(30, 60), engine='numpy')
+        self.assertEqual(list(report.index), [5, 30, 60])
+        self.assertEqual(list(report['intervals']), [864, 144, 72])
+        self.assertEqual(report.loc[5, 'cost_error'], 0)
+        self.assertEqual(report.loc[5, 'daily_rmse'], 0)
+        self.assertLess(abs(report.loc[30, 'relative_error']), 0.1)
+        for column in ['cost', 'energy_from_grid', 'energy_to_grid', 'final_soc', 'seconds', 'speedup']:
+            self.assertIn(column, report.columns)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import numpy as np
+import pandas as pd
+from inverter_simulator.results import OUTPUT_COLUMNS, ResultStore
+
+
+class TestResultStore(unittest.TestCase):
+
+    def setUp(self):
+        self.system = pd.DataFrame({'house_power': [1.0, 2.0, 3.0], 'solar_power': [0.0, 1.0, 2.0]},
+                                   index=pd.date_range('2024-01-01', periods=3, freq='5min'))
+        self.store = ResultStore(self.system.index, exclude=self.system.columns)
+
+    def test_core_columns_preallocated(self):
+        self.assertEqual(self.store.core['charge'].dtype, np.float64)
+        self.assertEqual(self.store.core['action'].dtype, np.int16)
+        self.assertEqual(self.store.core['reason'].dtype, object)
+        self.assertTrue(np.isnan(self.store.core['feed_in_power_limitation']).all())
+
+    def test_params_schema_on_first_write(self):
+        self.store.record_params(0, {'optimal_charging': 500, 'note': 'a', 'house_power': 9})
+        self.store.record_params(2, {'optimal_charging': 250.5, 'note': 'b'})
+        self.assertNotIn('house_power', self.store.params)
+        self.assertEqual(self.store.params['optimal_charging'].dtype, np.float64)
+        np.testing.assert_array_equal(self.store.params['optimal_charging'], [500, np.nan, 250.5])
+        self.assertEqual(list(self.store.params['note']), ['a', None, 'b'])
+
+    def test_params_upgrade_to_object(self):
+        self.store.record_params(0, {'threshold': 1})
+        self.store.record_params(1, {'threshold': [1, 2]})
+        self.assertEqual(self.store.params['threshold'].dtype, object)
+        self.assertEqual(list(self.store.params['threshold']), [1, [1, 2], None])
+
+    def test_core_names_are_not_params(self):
+        self.store.record_params(0, {'charge': 1, 'sim_cost': 2})
+        self.assertEqual(self.store.params, {})
+
+    def test_actions_categorical(self):
+        self.store.set_column('action', ['auto', 'Export-peak', 'auto'])
+        self.assertEqual(self.store.core['action'].tolist(), [0, 1, 0])
+        action = self.store.to_frame(self.system)['action']
+        self.assertIsInstance(action.dtype, pd.CategoricalDtype)
+        self.assertEqual(action.tolist(), ['auto', 'Export-peak', 'auto'])
+        self.store.set_column('action', [None, 'auto', 'auto'])
+        self.assertTrue(pd.isna(self.store.to_frame(self.system)['action'].iloc[0]))
+
+    def test_to_frame_column_order(self):
+        self.store.set_column('solar_power', [5, 6, 7])
+        self.store.record_params(1, {'extra': 1.5})
+        frame = self.store.to_frame(self.system)
+        names = [name for name, _ in OUTPUT_COLUMNS if name != 'solar_power']
+        self.assertEqual(list(frame.columns), ['house_power', 'solar_power'] + names + ['extra'])
+        self.assertEqual(frame['solar_power'].tolist(), [5, 6, 7])
+        self.assertTrue(frame.index.equals(self.system.index))
+        self.assertTrue(np.shares_memory(frame['charge'].to_numpy(), self.store.core['charge']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import json
+import os
+import pickle
+import tempfile
+import unittest
+import pandas as pd
+from inverter_simulator.script_errors import ScriptErrors
+
+
+class TestScriptErrors(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_dedup(self):
+        errors = ScriptErrors(self.tmp.name)
+        times = pd.date_range('2024-01-01', periods=4, freq='5min')
+        entry = errors.record(ZeroDivisionError('division by zero'), lineno=3, file_name='s.py', interval_time=times[0])
+        self.assertEqual(entry['id'], 0)
+        for interval_time in times[1:]:
+            self.assertIsNone(errors.record(ZeroDivisionError('division by zero'), lineno=3, file_name='s.py',
+                                            interval_time=interval_time))
+        # Another line or exception type is another fingerprint
+        self.assertIsNotNone(errors.record(ZeroDivisionError('division by zero'), lineno=4, file_name='s.py'))
+        self.assertIsNotNone(errors.record(KeyError('price'), lineno=3, file_name='s.py'))
+        self.assertEqual(len(errors), 3)
+        summary = errors.summary()
+        self.assertEqual(summary[0]['count'], 4)
+        self.assertEqual(summary[0]['first_interval'], str(times[0]))
+        self.assertEqual(summary[0]['last_interval'], str(times[-1]))
+        errors.close()
+
+    def test_samples(self):
+        errors = ScriptErrors(self.tmp.name)
+        self.assertTrue(errors.path.startswith(self.tmp.name))
+        entry = errors.record(NameError('x'), lineno=1, file_name='s.py')
+        errors.write_sample(entry, 'action = x', '{"action": "auto"}')
+        summary = errors.close()
+        with open(os.path.join(errors.path, 'error_0_code.py')) as f:
+            self.assertEqual(f.read(), 'action = x')
+        with open(os.path.join(errors.path, 'error_0_params.json')) as f:
+            self.assertEqual(json.load(f), {'action': 'auto'})
+        with open(os.path.join(errors.path, 'errors.json')) as f:
+            self.assertEqual(json.load(f), summary)
+        self.assertEqual(summary[0]['files'], [os.path.join(errors.path, 'error_0_code.py'),
+                                               os.path.join(errors.path, 'error_0_params.json')])
+
+    def test_no_errors(self):
+        errors = ScriptErrors(self.tmp.name)
+        self.assertEqual(errors.close(), [])
+        self.assertFalse(os.path.exists(errors.path))
+
+    def test_default_directory(self):
+        os.environ['INVERTER_SIMULATOR_ERROR_DIR'] = self.tmp.name
+        self.addCleanup(os.environ.pop, 'INVERTER_SIMULATOR_ERROR_DIR')
+        self.assertTrue(ScriptErrors().path.startswith(self.tmp.name))
+
+    def test_pickle(self):
+        errors = ScriptErrors(self.tmp.name)
+        errors.record(NameError('x'), lineno=1, file_name='s.py')
+        copy = pickle.loads(pickle.dumps(errors))
+        self.assertEqual(copy.directory, self.tmp.name)
+        self.assertEqual(len(copy), 0)
+        self.assertNotEqual(copy.run_id, errors.run_id)
+        errors.close()
+
+    def test_merge(self):
+        errors = ScriptErrors(self.tmp.name)
+        errors.record(NameError('x'), lineno=1, file_name='s.py', interval_time='2024-01-01 00:05:00')
+        worker = pickle.loads(pickle.dumps(errors))
+        for interval_time in ('2024-01-01 00:00:00', '2024-01-01 00:10:00'):
+            entry = worker.record(NameError('x'), lineno=1, file_name='s.py', interval_time=interval_time)
+        worker.write_sample(worker.errors[('s.py', 1, 'NameError')], 'action = x', '{}')
+        worker.record(KeyError('price'), lineno=2, file_name='s.py')
+        self.assertIsNone(entry)
+        errors.merge(worker.report())
+        # A later report of the same copy replaces the earlier one, and a report of itself is ignored
+        errors.merge(worker.report())
+        errors.merge(errors.report())
+        summary = errors.close()
+        self.assertEqual([(entry['type'], entry['count']) for entry in summary], [('NameError', 3), ('KeyError', 1)])
+        self.assertEqual(summary[0]['first_interval'], '2024-01-01 00:00:00')
+        self.assertEqual(summary[0]['last_interval'], '2024-01-01 00:10:00')
+        self.assertTrue(os.path.exists(summary[0]['files'][0]))
+        with open(os.path.join(errors.path, 'errors.json')) as f:
+            self.assertEqual(json.load(f), summary)
+        worker.close()
@@ -1,9 +1,14 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import Mock, patch
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
-from inverter_simulator.simulator import InverterSimulator
-from inverter_simulator.battery import Battery
+from inverter_simulator.simulator import InverterSimulator, stream_simulation
+from inverter_simulator.battery import Battery, BatteryBank
+from inverter_simulator.history import PastPower
+from inverter_simulator.policy import vector_policy
 
 class TestInverterSimulator(unittest.TestCase):
 
@@ -417,5 +422,396 @@ class TestInverterSimulator(unittest.TestCase):
         for column in expected_columns:
             self.assertIn(column, updated_system.columns)
 
+
+def cycling_control(interval_time, **params):
+    actions = ['auto', 'charge', 'discharge', 'import', 'export', 'stopped', 'import_no_solar', 'export0', 'fullstop']
+    action = actions[interval_time.minute // 5 % len(actions)]
+    if params['buy_price'] > 30:
+        return action, 'expensive', {'feed_in_power_limitation': 1500, 'optimal_charging': 3000}
+    return action, 'cycling'
+
+
+def make_system(periods=288, seed=1):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2024-01-01', periods=periods, freq='5min', tz='Australia/Brisbane')
+    return pd.DataFrame({
+        'house_power': rng.uniform(200, 6000, periods).round(),
+        'solar_power': rng.uniform(0, 7000, periods).round(),
+        'buy_price': rng.uniform(5, 60, periods),
+        'sell_price': rng.uniform(-5, 20, periods),
+        'forecast': [[100.0, 200.0, 300.0]] * periods,
+    }, index=index)
+
+
+class TestNumpyEngine(unittest.TestCase):
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            InverterSimulator(make_system(3), cycling_control, engine='cython')
+
+    def test_matches_pandas_engine(self):
+        system = make_system()
+        pandas_cost, pandas_df = InverterSimulator(system.copy(), cycling_control).run_simulation()
+        numpy_cost, numpy_df = InverterSimulator(system.copy(), cycling_control, engine='numpy').run_simulation()
+        self.assertEqual(pandas_cost, numpy_cost)
+        pd.testing.assert_frame_equal(pandas_df, numpy_df[pandas_df.columns], check_dtype=False)
+
+    def test_control_function_sees_same_state(self):
+        seen = {'pandas': [], 'numpy': []}
+        for engine, calls in seen.items():
+            def control(interval_time, **params):
+                calls.append((params['battery_charge'], params['house_power'], list(params['past_power_from_grid'])))
+                return 'auto', 'auto'
+            InverterSimulator(make_system(30), control, engine=engine).run_simulation()
+        self.assertEqual(seen['pandas'], seen['numpy'])
+
+    def test_past_power_from_grid_modes(self):
+        for engine in InverterSimulator.ENGINES:
+            seen = {}
+
+            def control(interval_time, **params):
+                seen[interval_time] = params['past_power_from_grid']
+                return 'import', 'import'
+            simulator = InverterSimulator(make_system(30), control, engine=engine)
+            simulator.run_simulation()
+            last = seen[max(seen)]
+            self.assertIsInstance(last, PastPower)
+            # The default list shares the history's buffer rather than copying it each interval
+            self.assertTrue(np.shares_memory(np.asarray(last), simulator.grid_history.values()))
+            self.assertEqual(last, list(simulator.system['Power from grid'][:-13]))
+
+            simulator = InverterSimulator(make_system(30), control, engine=engine, past_power_from_grid='view')
+            simulator.run_simulation()
+            last = seen[simulator.system.index[-1]]
+            self.assertIsInstance(last, np.ndarray)
+            self.assertFalse(last.flags.writeable)
+            self.assertEqual(last.tolist(), list(simulator.system['Power from grid'][:-13]))
+
+            InverterSimulator(make_system(30), control, engine=engine, past_power_from_grid='list',
+                              past_power_from_grid_depth=4).run_simulation()
+            self.assertIsInstance(seen[simulator.system.index[-1]], PastPower)
+            self.assertEqual(len(seen[simulator.system.index[-1]]), 4)
+
+    def test_past_power_from_grid_lags_12_intervals(self):
+        for interval in (5, 30):
+            seen = {}
+
+            def control(interval_time, **params):
+                seen[interval_time] = params['past_power_from_grid']
+                return 'import', 'import'
+            simulator = InverterSimulator(make_system(30), control, engine='numpy', interval=interval)
+            simulator.run_simulation()
+            self.assertEqual(seen[simulator.system.index[-1]], list(simulator.system['Power from grid'][:-13]))
+
+    def test_tariff_forecasts(self):
+        for engine in InverterSimulator.ENGINES:
+            seen = []
+
+            def control(interval_time, **params):
+                seen.append((params['buy_forecast'], params['sell_forecast']))
+                return 'auto', 'auto'
+            InverterSimulator(make_system(5), control, engine=engine).run_simulation()
+            self.assertEqual(seen[0], ([], []))
+            seen.clear()
+            InverterSimulator(make_system(5), control, engine=engine, tariff_forecasts=True).run_simulation()
+            self.assertEqual(seen[0], ([10.0, 20.0, 30.0], [10.0, 20.0, 30.0]))
+
+    def test_unhashable_action_runs_auto(self):
+        def buggy_control(interval_time, **params):
+            return ['charge'], 'bug'
+        for engine in InverterSimulator.ENGINES:
+            simulator = InverterSimulator(make_system(5), buggy_control, engine=engine)
+            cost, result = simulator.run_simulation()
+            self.assertEqual(set(result['action']), {"['charge']"})
+            self.assertEqual(simulator.fallbacks["['charge']"], 5)
+            self.assertEqual(result['charge'].tolist(), InverterSimulator(make_system(5), lambda t, **p: ('auto', 'auto'),
+                                                                          engine=engine).run_simulation()[1]['charge'].tolist())
+
+    def test_nan_action_is_missing(self):
+        def nan_control(interval_time, **params):
+            return (float('nan'), 'no decision') if interval_time.minute % 10 else ('charge', 'charge')
+        for engine in InverterSimulator.ENGINES:
+            cost, result = InverterSimulator(make_system(6), nan_control, engine=engine).run_simulation()
+            self.assertEqual(result['action'].isna().tolist(), [False, True] * 3)
+            self.assertEqual(set(result['action'].dropna()), {'charge'})
+
+    def test_unknown_past_power_from_grid_mode(self):
+        with self.assertRaises(ValueError):
+            InverterSimulator(make_system(3), cycling_control, past_power_from_grid='tuple')
+
+
+class TestBatteryBankSimulation(unittest.TestCase):
+
+    def test_bank_matches_individual_runs(self):
+        system = make_system(120)
+        configs = [{'battery_capacity': 5000, 'charge_rate': 2500},
+                   {'battery_capacity': 10000, 'charge_rate': 4600, 'battery_loss': 10},
+                   {'battery_capacity': 20000, 'charge_rate': 8000, 'min_soc': 20}]
+        bank = BatteryBank.from_configs([{'capacity': c['battery_capacity'], 'charge_rate': c['charge_rate'],
+                                          'loss_rate': c.get('battery_loss', 5), 'min_soc': c.get('min_soc', 10)}
+                                         for c in configs])
+        simulator = InverterSimulator(system.copy(), cycling_control, grid_limit=8000)
+        totals, costs = simulator.run_bank_simulation(bank)
+        self.assertEqual(costs.shape, (120, 3))
+        for i, config in enumerate(configs):
+            cost, result = InverterSimulator(system.copy(), cycling_control, grid_limit=8000, **config).run_simulation()
+            np.testing.assert_allclose(costs[i].to_numpy(), result['sim_cost'].to_numpy())
+            self.assertAlmostEqual(totals[i], cost)
+
+    def test_bank_decides_per_configuration(self):
+        def soc_control(interval_time, **params):
+            self.assertIsInstance(params['battery_soc'], float)
+            past = params['past_power_from_grid']
+            if len(past) and sum(past) / len(past) > 1500:
+                return 'discharge', 'grid heavy'
+            if params['battery_soc'] < 40:
+                return 'import', 'low', {'optimal_charging': 3000}
+            if params['battery_soc'] > 70:
+                return 'export', 'high', {'feed_in_power_limitation': 2000}
+            return 'auto', 'auto'
+        system = make_system(150)
+        configs = [{'battery_capacity': 5000, 'charge_rate': 2500},
+                   {'battery_capacity': 20000, 'charge_rate': 8000, 'min_soc': 20},
+                   {'battery_capacity': 10000, 'charge_rate': 4600, 'battery_loss': 10}]
+        for interval in (5, 30):
+            with self.subTest(interval=interval):
+                bank = BatteryBank.from_configs([{'capacity': c['battery_capacity'], 'charge_rate': c['charge_rate'],
+                                                  'loss_rate': c.get('battery_loss', 5), 'min_soc': c.get('min_soc', 10)}
+                                                 for c in configs], interval=interval)
+                actions = []
+                totals, costs = InverterSimulator(system.copy(), soc_control, grid_limit=8000,
+                                                  interval=interval).run_bank_simulation(bank)
+                for i, config in enumerate(configs):
+                    cost, result = InverterSimulator(system.copy(), soc_control, grid_limit=8000, interval=interval,
+                                                     **config).run_simulation()
+                    actions.append(tuple(result['action']))
+                    np.testing.assert_allclose(costs[i].to_numpy(), result['sim_cost'].to_numpy())
+                    self.assertAlmostEqual(totals[i], cost)
+                # The configurations decided differently
+                self.assertEqual(len(set(actions)), len(configs))
+
+
+class TestStreamSimulation(unittest.TestCase):
+
+    def test_stream_matches_single_run(self):
+        system = make_system(300)
+        for engine in InverterSimulator.ENGINES:
+            with self.subTest(engine=engine):
+                seen = []
+
+                def control(interval_time, **params):
+                    seen.append((list(params['past_power_from_grid']), params['sim_cost']))
+                    if params['sim_cost'] > 0:
+                        return 'export', 'over budget'
+                    return cycling_control(interval_time, **params)
+                cost, result = InverterSimulator(system.copy(), control, engine=engine, grid_limit=8000,
+                                                 past_power_from_grid_depth=50).run_simulation()
+                full_seen, seen = seen, []
+                chunks = [system.iloc[start:start + 70] for start in range(0, 300, 70)]
+                streamed = list(stream_simulation(iter(chunks), control, engine=engine, grid_limit=8000,
+                                                  past_power_from_grid_depth=50))
+                self.assertEqual(len(streamed), 5)
+                self.assertEqual(seen, full_seen)
+                self.assertAlmostEqual(streamed[-1][0], cost)
+                combined = pd.concat([frame for _, frame in streamed])
+                pd.testing.assert_series_equal(combined['battery_charge'], result['battery_charge'])
+                pd.testing.assert_series_equal(combined['sim_cost'], result['sim_cost'])
+
+    def test_stream_history_is_bounded(self):
+        buffers = []
+
+        def control(interval_time, **params):
+            past = params['past_power_from_grid']
+            self.assertLessEqual(len(past), 10)
+            if past.base is not None:
+                buffers.append(past.base.size)
+            return 'auto', 'auto'
+        chunks = (make_system(100, seed=seed) for seed in range(3))
+        for _ in stream_simulation(chunks, control, engine='numpy', past_power_from_grid='view', past_power_from_grid_depth=10):
+            pass
+        # the ring holds depth + lag values, twice over
+        self.assertEqual(set(buffers), {2 * (10 + 12)})
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.system = make_system(200)
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'run.npz')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_resume_matches_uninterrupted_run(self):
+        cost, expected = InverterSimulator(self.system.copy(), cycling_control, engine='numpy').run_simulation()
+
+        def crashing_control(interval_time, **params):
+            if interval_time == self.system.index[130]:
+                raise RuntimeError('preempted')
+            return cycling_control(interval_time, **params)
+        simulator = InverterSimulator(self.system.copy(), crashing_control, engine='numpy',
+                                      checkpoint_path=self.path, checkpoint_every=50)
+        with self.assertRaises(RuntimeError):
+            simulator.run_simulation()
+        self.assertTrue(os.path.exists(self.path))
+
+        resumed = InverterSimulator(self.system.copy(), cycling_control, engine='numpy')
+        resumed.resume(self.path)
+        self.assertEqual(resumed.current_interval, self.system.index[99])
+        resumed_cost, result = resumed.run_simulation()
+        self.assertAlmostEqual(resumed_cost, cost)
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_echoed_state_is_not_checkpointed(self):
+        def echo_control(interval_time, **params):
+            action, reason, *rest = cycling_control(interval_time, **params)
+            return action, reason, dict(params, **(rest[0] if rest else {}))
+        sizes = []
+        for length in (500, 1000, 2000):
+            InverterSimulator(make_system(length + 1), echo_control, engine='numpy', checkpoint_path=self.path,
+                              checkpoint_every=length).run_simulation()
+            sizes.append(os.path.getsize(self.path))
+            with np.load(self.path, allow_pickle=True) as data:
+                self.assertNotIn('params:past_power_from_grid', data.files)
+                self.assertNotIn('params:spot_to_tariff', data.files)
+                self.assertNotIn('params:location', data.files)
+                self.assertIn('params:optimal_charging', data.files)
+        # Linear in the run length, like the core columns
+        self.assertLess(sizes[2] / sizes[1], 2.5)
+        self.assertLess(sizes[1] / sizes[0], 2.5)
+
+        cost, expected = InverterSimulator(self.system.copy(), echo_control, engine='numpy').run_simulation()
+        InverterSimulator(self.system.copy(), echo_control, engine='numpy', checkpoint_path=self.path,
+                          checkpoint_every=100).run_simulation()
+        resumed = InverterSimulator(self.system.copy(), echo_control, engine='numpy')
+        resumed.resume(self.path)
+        resumed_cost, result = resumed.run_simulation()
+        self.assertAlmostEqual(resumed_cost, cost)
+        # State that cannot be rebuilt starts at the checkpoint; everything else matches
+        lost = ['past_power_from_grid', 'buy_forecast', 'sell_forecast']
+        self.assertTrue(result['past_power_from_grid'].iloc[:100].isna().all())
+        pd.testing.assert_frame_equal(result.drop(columns=lost), expected.drop(columns=lost))
+
+    def test_resume_rejects_other_system(self):
+        InverterSimulator(self.system.copy(), cycling_control, engine='numpy', checkpoint_path=self.path,
+                          checkpoint_every=50).run_simulation()
+        other = InverterSimulator(make_system(100), cycling_control, engine='numpy')
+        with self.assertRaises(ValueError):
+            other.resume(self.path)
+
+    def test_checkpoint_needs_numpy_engine(self):
+        with self.assertRaises(ValueError):
+            InverterSimulator(self.system.copy(), cycling_control, checkpoint_path=self.path, checkpoint_every=50)
+
+    def test_checkpoint_settings_that_never_write(self):
+        for kwargs in ({'checkpoint_path': self.path}, {'checkpoint_every': 50},
+                       {'checkpoint_path': self.path, 'checkpoint_every': 0},
+                       {'checkpoint_path': self.path, 'checkpoint_every': 2.5}):
+            with self.subTest(**kwargs), self.assertRaises(ValueError):
+                InverterSimulator(self.system.copy(), cycling_control, engine='numpy', **kwargs)
+        simulator = InverterSimulator(self.system.copy(), cycling_control, engine='numpy', checkpoint_path=self.path,
+                                      checkpoint_every=50)
+        with self.assertRaises(ValueError):
+            simulator.run_bank_simulation(BatteryBank.from_configs([{'capacity': 10000, 'charge_rate': 5000}]))
+
+
+def price_control(interval_time, **params):
+    if params['buy_price'] > 50:
+        return 'export', 'peak', {'feed_in_power_limitation': 1500}
+    if params['buy_price'] < 20:
+        return 'import', 'cheap'
+    if interval_time.hour >= 18:
+        return 'discharge', 'evening'
+    return 'auto', 'default'
+
+
+@vector_policy
+def price_policy(interval_times, buy_price, hour, **columns):
+    actions = np.where(buy_price > 50, 'export', np.where(buy_price < 20, 'import', np.where(hour >= 18, 'discharge', 'auto')))
+    reasons = np.where(buy_price > 50, 'peak', np.where(buy_price < 20, 'cheap', np.where(hour >= 18, 'evening', 'default')))
+    return actions, reasons, {'feed_in_power_limitation': np.where(buy_price > 50, 1500, np.nan)}
+
+
+class TestVectorPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.system = make_system(288 * 2)
+
+    def test_matches_per_interval_control(self):
+        expected_cost, expected = InverterSimulator(self.system.copy(), price_control, engine='numpy').run_simulation()
+        for engine in InverterSimulator.ENGINES:
+            cost, result = InverterSimulator(self.system.copy(), price_policy, engine=engine).run_simulation()
+            self.assertAlmostEqual(cost, expected_cost)
+            pd.testing.assert_frame_equal(result, expected)
+
+    def test_called_once_with_columns(self):
+        calls = []
+
+        @vector_policy
+        def policy(interval_times, **columns):
+            calls.append((interval_times, columns))
+            return np.full(len(interval_times), 'charge')
+        _, result = InverterSimulator(self.system.copy(), policy).run_simulation()
+        self.assertEqual(len(calls), 1)
+        interval_times, columns = calls[0]
+        self.assertTrue(interval_times.equals(self.system.index))
+        self.assertEqual(columns['hour'][13], 1 + 5 / 60)
+        self.assertEqual(columns['interval'], 5)
+        self.assertNotIn('forecast', columns)
+        self.assertEqual(set(result['action']), {'charge'})
+        self.assertEqual(set(result['reason']), {'vector policy'})
+
+    def test_rejects_wrong_length(self):
+        policy = vector_policy(lambda interval_times, **columns: ['auto'])
+        with self.assertRaises(ValueError):
+            InverterSimulator(self.system.copy(), policy).run_simulation()
+
+    def test_bank(self):
+        bank = BatteryBank.from_configs([{'capacity': 5000, 'charge_rate': 2500}, {'capacity': 10000, 'charge_rate': 4600}])
+        totals, costs = InverterSimulator(self.system.copy(), price_control, grid_limit=8000).run_bank_simulation(bank)
+        bank.reset()
+        vector_totals, vector_costs = InverterSimulator(self.system.copy(), price_policy, grid_limit=8000).run_bank_simulation(bank)
+        np.testing.assert_allclose(vector_totals, totals)
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_disabled_by_default(self):
+        simulator = InverterSimulator(make_system(10), cycling_control)
+        simulator.run_simulation()
+        self.assertIsNone(simulator.report)
+        self.assertNotIn('instrumentation', simulator.system.attrs)
+
+    def test_report(self):
+        def control(interval_time, **params):
+            if interval_time.minute == 0:
+                return 'dump', 'typo'
+            return cycling_control(interval_time, **params)
+        for engine in InverterSimulator.ENGINES:
+            simulator = InverterSimulator(make_system(36), control, engine=engine, instrument=True)
+            _, result = simulator.run_simulation()
+            report = simulator.report
+            self.assertIs(result.attrs['instrumentation'], report)
+            self.assertEqual(report['intervals'], 36)
+            self.assertEqual(set(report['phases']), {'state', 'control', 'step', 'final_metrics'})
+            for phase in report['phases'].values():
+                self.assertGreaterEqual(phase['total'], phase['max'])
+                self.assertGreater(phase['total'], 0)
+            self.assertEqual(sum(report['actions'].values()), 36)
+            self.assertEqual(report['actions']['dump'], 3)
+            self.assertEqual(report['fallbacks'], {'dump': 3})
+            timings = simulator.instrumentation.to_frame(result.index)
+            self.assertEqual(list(timings.columns), ['state', 'control', 'step'])
+            self.assertFalse(timings.isna().any().any())
+
+    def test_fallbacks_counted_without_instrumentation(self):
+        simulator = InverterSimulator(make_system(5), lambda interval_time, **params: ('Bogus', 'typo'))
+        with self.assertLogs('inverter_simulator.simulator', level='WARNING') as logs:
+            simulator.run_simulation()
+        self.assertEqual(simulator.fallbacks, {'bogus': 5})
+        self.assertEqual(len(logs.output), 1)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
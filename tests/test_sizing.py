@@ -0,0 +1,60 @@
+import unittest
+import numpy as np
+from inverter_simulator.benchmark import synthetic_system
+from inverter_simulator.simulator import sim_inverter
+from inverter_simulator.sizing import optimize_sizing, representative_days
+from inverter_simulator.sweep import sweep
+from tests.test_calibration import daily_control
+
+GRID = {'battery_capacity': [5000, 10000, 20000], 'charge_rate': [2500, 5000]}
+
+
+class TestRepresentativeDays(unittest.TestCase):
+
+    def test_whole_days(self):
+        system = synthetic_system(10)
+        sample = representative_days(system, 3)
+        self.assertEqual(len(sample), 3 * 288)
+        self.assertEqual(sample.index.normalize().nunique(), 3)
+        self.assertTrue(sample.index.is_monotonic_increasing)
+        self.assertIs(representative_days(system, 20), system)
+
+
+class TestOptimizeSizing(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.system = synthetic_system(4)
+        cls.full = sweep(cls.system, daily_control, GRID, max_workers=1, engine='numpy')
+
+    def test_best_cost(self):
+        result = optimize_sizing(self.system, daily_control, GRID, top_k=2, max_workers=1, engine='numpy')
+        self.assertEqual(result['runs'], {'coarse': 6, 'fine': 2})
+        self.assertEqual(list(result['coarse']['cost']), sorted(result['coarse']['cost']))
+        best = self.full.loc[self.full['cost'].idxmin()]
+        self.assertEqual(result['params'], {'battery_capacity': best['battery_capacity'], 'charge_rate': best['charge_rate']})
+        self.assertAlmostEqual(result['cost'], best['cost'])
+        self.assertNotIn('payback_years', result)
+
+    def test_payback(self):
+        baseline, _ = sim_inverter(self.system, daily_control, charge_rate=0, engine='numpy')
+        result = optimize_sizing(self.system, daily_control, GRID, top_k=6, battery_price=lambda config: 1000,
+                                 max_workers=1, engine='numpy')
+        savings = (baseline - self.full['cost']) / 100 * 365 / 4
+        payback = (1000 / savings.where(savings > 0)).fillna(np.inf)
+        best = self.full.loc[payback.idxmin()]
+        self.assertEqual(result['params'], {'battery_capacity': best['battery_capacity'], 'charge_rate': best['charge_rate']})
+        self.assertAlmostEqual(result['payback_years'], payback.min())
+        self.assertAlmostEqual(result['annual_savings'], savings[payback.idxmin()])
+        self.assertEqual(list(result['fine'].columns[:2]), list(GRID))
+
+    def test_known_baseline_and_sample(self):
+        result = optimize_sizing(self.system, daily_control, {'battery_capacity': [5000, 20000]}, sample_days=2,
+                                 battery_price=500, baseline_cost=0, max_workers=1, engine='numpy')
+        self.assertEqual(result['runs'], {'coarse': 2, 'fine': 2})
+        self.assertNotIn('charge_rate', result['fine'].columns)
+        self.assertEqual(sorted(result['fine']['battery_price']), [2500, 10000])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+from datetime import date
+from zoneinfo import ZoneInfo
+import pandas as pd
+from astral import LocationInfo
+from astral.sun import sun
+from inverter_simulator.solar import SunTable, sun_times
+
+
+class TestSolar(unittest.TestCase):
+
+    def test_sun_times_matches_astral(self):
+        location = LocationInfo(timezone='Australia/Brisbane', latitude=-27.4698, longitude=153.0251)
+        s = sun(location.observer, date=date(2024, 6, 21))
+        sunrise, sunset = sun_times(-27.4698, 153.0251, 'Australia/Brisbane', date(2024, 6, 21))
+        self.assertEqual(sunrise, s['sunrise'].astimezone(ZoneInfo('Australia/Brisbane')))
+        self.assertEqual(sunset, s['sunset'].astimezone(ZoneInfo('Australia/Brisbane')))
+        self.assertEqual(str(sunrise.tzinfo), 'Australia/Brisbane')
+
+    def test_sun_times_cached(self):
+        sun_times.cache_clear()
+        for _ in range(288):
+            sun_times(-33.86, 151.21, 'Australia/Sydney', date(2024, 1, 1))
+        info = sun_times.cache_info()
+        self.assertEqual(info.misses, 1)
+        self.assertEqual(info.hits, 287)
+
+    def test_table_for_index(self):
+        index = pd.date_range('2024-01-01', '2024-01-03 23:55', freq='5min', tz='Australia/Brisbane')
+        table = SunTable.for_index(-27.4698, 153.0251, 'Australia/Brisbane', index)
+        self.assertEqual(sorted(table.times), [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3)])
+        frame = table.to_frame()
+        self.assertEqual(list(frame.columns), ['sunrise', 'sunset'])
+        self.assertEqual(frame.loc[date(2024, 1, 2), 'sunrise'], table.get(date(2024, 1, 2))[0])
+
+    def test_table_falls_back_outside_range(self):
+        table = SunTable.for_range(-27.4698, 153.0251, 'Australia/Brisbane', date(2024, 1, 1), date(2024, 1, 2))
+        self.assertEqual(len(table.times), 2)
+        self.assertEqual(table.get(date(2024, 2, 1)), sun_times(-27.4698, 153.0251, 'Australia/Brisbane', date(2024, 2, 1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
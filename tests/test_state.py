@@ -0,0 +1,52 @@
+import unittest
+from inverter_simulator.simulator import InverterSimulator
+from inverter_simulator.state import IntervalState
+from tests.test_simulator import cycling_control, make_system
+
+
+class TestIntervalState(unittest.TestCase):
+
+    def setUp(self):
+        self.columns = {'house_power': [1, 2, 3], 'tariff': ['a', 'b', 'c']}
+        self.static = {'tariff': '6900', 'grid_limit': 8000}
+        self.state = IntervalState(self.columns, 1, self.static, {'battery_charge': 5000})
+
+    def test_lookup_precedence(self):
+        self.assertEqual(self.state['house_power'], 2)
+        self.assertEqual(self.state['tariff'], '6900')
+        self.assertEqual(self.state['battery_charge'], 5000)
+        with self.assertRaises(KeyError):
+            self.state['missing']
+
+    def test_overlay_writes(self):
+        self.state['house_power'] = 10
+        self.state['extra'] = 'x'
+        del self.state['grid_limit']
+        self.assertEqual(self.state['house_power'], 10)
+        self.assertNotIn('grid_limit', self.state)
+        self.assertEqual(self.columns['house_power'], [1, 2, 3])
+        self.assertEqual(self.static, {'tariff': '6900', 'grid_limit': 8000})
+        self.assertEqual(sorted(self.state), ['battery_charge', 'extra', 'house_power', 'tariff'])
+        with self.assertRaises(KeyError):
+            del self.state['grid_limit']
+
+    def test_kwargs_unpacking(self):
+        def control(**params):
+            return params
+        self.assertEqual(control(**self.state), {'house_power': 2, 'tariff': '6900', 'grid_limit': 8000, 'battery_charge': 5000})
+        self.assertEqual(len(self.state), 4)
+
+    def test_matches_create_state_dict(self):
+        system = make_system(10)
+        system['threshold_2'] = 7
+        simulator = InverterSimulator(system, cycling_control)
+        columns = {col: simulator.system[col].tolist() for col in simulator.system.columns}
+        static, containers = simulator._static_state()
+        for position, (index, row) in enumerate(simulator.system.iterrows()):
+            simulator.current_interval = index
+            state = simulator._interval_state(columns, position, static, containers)
+            self.assertEqual(dict(state), simulator._create_state_dict(row))
+
+
+if __name__ == '__main__':
+    unittest.main()
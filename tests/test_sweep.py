@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from inverter_simulator.simulator import sim_inverter
+from inverter_simulator.sweep import _attach_frame, expand_grid, share_frame, sweep
+from tests.test_calibration import FailingControl
+from tests.test_simulator import cycling_control, make_system
+
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.system = make_system(96)
+        self.grid = {'battery_capacity': [5000, 10000], 'charge_rate': [2500, 5000], 'battery_loss': [5]}
+
+    def test_expand_grid(self):
+        configs = expand_grid(self.grid)
+        self.assertEqual(len(configs), 4)
+        self.assertEqual(configs[1], {'battery_capacity': 5000, 'charge_rate': 5000, 'battery_loss': 5})
+
+    def test_expand_grid_rejects_unknown(self):
+        with self.assertRaises(ValueError):
+            expand_grid({'battery_size': [1]})
+
+    def test_shared_frame_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            spec = share_frame(self.system, directory)
+            self.assertEqual(len(spec['blocks']), 1)
+            self.assertNotIn('forecast', spec['numeric'])
+            pd.testing.assert_frame_equal(_attach_frame(spec), self.system)
+
+    def test_shared_frame_keeps_dtypes(self):
+        system = self.system.copy()
+        system['count'] = np.arange(len(system), dtype=np.int64)
+        system['small'] = np.arange(len(system), dtype=np.float32)
+        system['nullable'] = pd.array([1, None] * (len(system) // 2), dtype='Int64')
+        system['flag'] = system['count'] % 2 == 0
+        with tempfile.TemporaryDirectory() as directory:
+            spec = share_frame(system, directory)
+            self.assertTrue(all(os.path.exists(block['path']) for block in spec['blocks']))
+            self.assertNotIn('nullable', spec['numeric'])
+            pd.testing.assert_frame_equal(_attach_frame(spec), system)
+
+    def test_sweep_matches_direct_runs(self):
+        summary = sweep(self.system, cycling_control, self.grid, max_workers=1)
+        self.assertEqual(list(summary.columns[:3]), ['battery_capacity', 'charge_rate', 'battery_loss'])
+        self.assertEqual(len(summary), 4)
+        for _, row in summary.iterrows():
+            cost, _ = sim_inverter(self.system.copy(), cycling_control, battery_capacity=row['battery_capacity'],
+                                   charge_rate=row['charge_rate'], battery_loss=row['battery_loss'])
+            self.assertAlmostEqual(row['cost'], cost)
+
+    def test_sweep_process_pool(self):
+        serial = sweep(self.system, cycling_control, self.grid, max_workers=1, engine='numpy')
+        parallel = sweep(self.system, cycling_control, self.grid, max_workers=2, engine='numpy')
+        pd.testing.assert_frame_equal(serial, parallel)
+
+    def test_script_errors_of_workers(self):
+        for max_workers in (1, 2):
+            with self.subTest(max_workers=max_workers), tempfile.TemporaryDirectory() as directory:
+                control = FailingControl(directory)
+                summary = sweep(self.system, control, self.grid, max_workers=max_workers)
+                self.assertNotIn('script_errors', summary.columns)
+                self.assertEqual([entry['count'] for entry in control.errors.close()], [len(self.system) * 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+import numpy as np
+import pandas as pd
+from inverter_simulator.tariffs import ForecastTariffs, buy_tariff_array, feed_in_tariff_array, vectorized
+
+
+def scalar_tariff(interval_time, network, tariff, price):
+    peak = 16 <= interval_time.hour < 21
+    return price / 10 + (30 if peak else 15)
+
+
+@vectorized
+def array_tariff(interval_times, network, tariff, prices):
+    hours = pd.DatetimeIndex(interval_times).hour
+    return prices / 10 + np.where((hours >= 16) & (hours < 21), 30, 15)
+
+
+class TestTariffs(unittest.TestCase):
+
+    def setUp(self):
+        self.index = pd.date_range('2024-01-01 15:00', periods=4, freq='h')
+        self.forecasts = [[100.0, 200.0], [300.0], [], [50.0, 60.0, 70.0]]
+
+    def test_vectorized_matches_scalar(self):
+        times = self.index.repeat(3)
+        prices = np.arange(12, dtype=float) * 25
+        np.testing.assert_array_equal(buy_tariff_array(array_tariff, times, 'energex', '6900', prices),
+                                      buy_tariff_array(scalar_tariff, times, 'energex', '6900', prices))
+        np.testing.assert_array_equal(feed_in_tariff_array(lambda x: x / 10, prices), prices / 10)
+
+    def test_forecast_tariffs(self):
+        for tariff in (scalar_tariff, array_tariff):
+            tariffs = ForecastTariffs(self.index, self.forecasts, tariff, lambda x: x / 10 - 1, 'energex', '6900')
+            for position, forecast in enumerate(self.forecasts):
+                self.assertEqual(tariffs.buy_forecast(position),
+                                 [scalar_tariff(self.index[position], 'energex', '6900', f) for f in forecast])
+                self.assertEqual(tariffs.sell_forecast(position), [f / 10 - 1 for f in forecast])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,212 @@
+import os
+import sys
+import tempfile
+import threading
+import types
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from tests.test_simulator import make_system
+
+try:
+    from inverter_simulator import utils
+    from inverter_simulator.tariffs import default_spot_to_tariff
+except ImportError:
+    utils = None
+
+
+def run_script(script, system=None, **kwargs):
+    with tempfile.TemporaryDirectory() as directory:
+        return utils.run_scripted_simulation(make_system(60) if system is None else system, script, 'script.py', 5,
+                                             10000, 'EA116', 'Energex', 5000, 5000, 1, default_spot_to_tariff, 'QLD',
+                                             -27.5, 153.0, 'Australia/Brisbane', error_directory=directory, **kwargs)
+
+
+@unittest.skipIf(utils is None, 'utils dependencies are not installed')
+class TestScriptedSimulation(unittest.TestCase):
+
+    def test_mean_past_power_from_grid(self):
+        script = "if mean(past_power_from_grid) > 0:\n    action = 'import'\n    reason = 'grid'\n"
+        for mode in ('list', 'view'):
+            cost, result = run_script(script, engine='numpy', past_power_from_grid=mode)
+            self.assertEqual(result.attrs['script_errors'], [], mode)
+            self.assertIn('grid', set(result['reason']))
+
+    def find_battery_loss(self, directory, **kwargs):
+        system = make_system(48)
+        system['billed_costs'] = 1.0
+        system['billed_earnings'] = 0.0
+        # No billed_action column, so every interval of every replay fails the same way
+        return utils.find_battery_loss(system, 'billed.py', 5, 10000, 'EA116', 'EA116', 'Energex', 5000, 5000, 1,
+                                       default_spot_to_tariff, 'QLD', 8000, -27.5, 153.0, 'Australia/Brisbane',
+                                       5000, max_rounds=2, return_result=True, error_directory=directory, **kwargs)
+
+    def test_find_battery_loss_closes_errors(self):
+        with tempfile.TemporaryDirectory() as directory:
+            result = self.find_battery_loss(directory, max_workers=1)
+        self.assertEqual(len(result['script_errors']), 1)
+        self.assertEqual(result['script_errors'][0]['type'], 'NameError')
+        self.assertEqual(result['script_errors'][0]['count'], 48 * result['runs'])
+        self.assertFalse([thread for thread in threading.enumerate() if thread.name.startswith('script-errors')])
+
+    def test_find_battery_loss_collects_worker_errors(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # The default process pool, whose workers each fail in their own copy of the control
+            result = self.find_battery_loss(directory)
+            self.assertEqual(len(result['script_errors']), 1)
+            self.assertEqual(result['script_errors'][0]['count'], 48 * result['runs'])
+            self.assertTrue(any(os.path.exists(os.path.join(path, 'errors.json'))
+                                for path, _, _ in os.walk(directory)))
+
+
+def retrieve_forecasted_prices(interval_time, battery, is_historic=False):
+    return [float(interval_time.minute)] * 12, [25.0] * 5
+
+
+def find_best_five_minute_trades(five_min_options, half_hour_options, five_min_prices, half_hour_prices,
+                                 five_min_window, half_hour_window, charge):
+    cash = five_min_prices[0] - half_hour_prices[0]
+    return {'five_minute_permutation': [cash]}, abs(cash) + len(five_min_options) + charge
+
+
+class PermutationModel:
+
+    def get_options(self, window, capacity, in_discharge_efficiency, in_charge_efficiency):
+        return np.ones((window, capacity))
+
+    def get_five_minute_options(self, capacity, in_discharge_efficiency, in_charge_efficiency, window):
+        return np.ones((window, 3))
+
+
+class BatteryActivity:
+    HOLD, DISCHARGE, CHARGE = 'hold', 'discharge', 'charge'
+
+    @classmethod
+    def get_action_by_cash(cls, cash):
+        return cls.DISCHARGE if cash > 0 else cls.CHARGE if cash < 0 else cls.HOLD
+
+
+def fake_pytrader():
+    """The pytrader modules get_battery_activity imports, deciding from the first five minute and half hour prices."""
+    names = ('pytrader', 'pytrader.aemo_retrieval', 'pytrader.battery', 'pytrader.battery.battery_activity',
+             'pytrader.permutation_model')
+    modules = {name: types.ModuleType(name) for name in names}
+    modules['pytrader.aemo_retrieval'].retrieve_forecasted_prices = retrieve_forecasted_prices
+    modules['pytrader.permutation_model'].find_best_five_minute_trades = find_best_five_minute_trades
+    modules['pytrader.permutation_model'].PermutationModel = PermutationModel
+    modules['pytrader.battery.battery_activity'].BatteryActivity = BatteryActivity
+    return mock.patch.dict(sys.modules, modules)
+
+
+@unittest.skipIf(utils is None, 'utils dependencies are not installed')
+class TestBatteryActivities(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for patch in (fake_pytrader(), mock.patch.object(utils, '_OPTIONS_CACHE', None),
+                      mock.patch.dict(os.environ, {'INVERTER_SIMULATOR_CACHE_DIR': directory.name})):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.interval_times = pd.date_range('2024-01-01', periods=10, freq='5min', tz='Australia/Sydney')
+        # Some intervals come with their forecasts, the others are retrieved
+        self.five_min_forecasts = [[20.0 + i] * 12 if i % 3 else None for i in range(10)]
+        self.forecasts = [[25.0] * 5 if i % 3 else None for i in range(10)]
+
+    def test_matches_get_battery_activity(self):
+        actions, confidences = utils.get_battery_activities(self.interval_times, self.five_min_forecasts, self.forecasts,
+                                                            max_workers=1)
+        self.assertEqual(len(actions), 10)
+        for i, interval_time in enumerate(self.interval_times):
+            action, confidence = utils.get_battery_activity(interval_time, five_min_forecast=self.five_min_forecasts[i],
+                                                            forecast=self.forecasts[i])
+            self.assertEqual(actions[i], action)
+            self.assertEqual(confidences[i], confidence)
+        self.assertEqual(set(actions), {'import', 'stopped', 'export'})
+
+    def test_batches(self):
+        batch = mock.Mock(wraps=utils._battery_activity_batch)
+        with mock.patch.object(utils, '_battery_activity_batch', batch):
+            actions, _ = utils.get_battery_activities(self.interval_times, self.five_min_forecasts, self.forecasts,
+                                                      max_workers=1, batch_size=4)
+        self.assertEqual([len(call.args[0]) for call in batch.call_args_list], [4, 4, 2])
+        self.assertEqual(len(actions), 10)
+        # The worker state is cleared after an in-process run
+        self.assertEqual(utils._ACTIVITY_WORKER, {})
+
+    def test_options_cache_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.dict(os.environ):
+                os.environ.pop('INVERTER_SIMULATOR_CACHE_DIR')
+                utils.set_options_cache_directory(None)
+                utils.build_options()
+                self.assertIsNone(utils._options_cache().directory)
+            utils.set_options_cache_directory(directory)
+            utils.build_options()
+            self.assertEqual(utils._options_cache().disk_hits + utils._options_cache().misses, 1)
+            self.assertTrue(os.listdir(directory))
+
+    def test_process_pool_matches_in_process(self):
+        serial = utils.get_battery_activities(self.interval_times, self.five_min_forecasts, self.forecasts, max_workers=1)
+        parallel = utils.get_battery_activities(self.interval_times, self.five_min_forecasts, self.forecasts,
+                                                max_workers=2, batch_size=3)
+        np.testing.assert_array_equal(serial[0], parallel[0])
+        np.testing.assert_array_equal(serial[1], parallel[1])
+
+
+@unittest.skipIf(utils is None, 'utils dependencies are not installed')
+class TestMemoizedScript(unittest.TestCase):
+
+    def control(self, script):
+        index = pd.date_range('2024-01-01', periods=3, freq='5min', tz='Australia/Brisbane')
+        return utils.ScriptedControl(script, 'pure.py', index, 10000, 5000, 5000, 'EA116', 'EA116', -27.5, 153.0,
+                                     'Australia/Brisbane')
+
+    def test_header_only_read_when_memoized(self):
+        script = "# pure: buy_price; soc=5\naction = 'import'\nreason = 'always'\n"
+        cost, result = run_script(script)
+        self.assertEqual(set(result['action']), {'import'})
+        with self.assertRaises(ValueError):
+            utils.MemoizedControl(self.control(script))
+
+    def test_assigned_outputs_are_reused(self):
+        control = utils.MemoizedControl(self.control("# pure: buy_price\naction = 'auto'\nbattery_soc = 50\n"))
+        interval_time = pd.Timestamp('2024-01-01 00:00', tz='Australia/Brisbane')
+        self.assertEqual(control(interval_time, buy_price=10.0, battery_soc=50)[2]['battery_soc'], 50)
+        action, reason, params = control(interval_time + pd.Timedelta(minutes=5), buy_price=10.0, battery_soc=62)
+        self.assertEqual(control.stats()['hits'], 1)
+        self.assertEqual(params['battery_soc'], 50)
+        # Inputs the script only reads are refreshed
+        self.assertEqual(params['interval_time'], interval_time + pd.Timedelta(minutes=5))
+
+
+@unittest.skipIf(utils is None, 'utils dependencies are not installed')
+class TestCompileScript(unittest.TestCase):
+
+    def test_compile_error_is_not_chained(self):
+        script = "action = (\n"
+        compiled = utils.compile_script(script)
+        self.assertIsNotNone(compiled['error'])
+        with tempfile.TemporaryDirectory() as directory:
+            errors = utils.ScriptErrors(directory)
+            for interval_time in pd.date_range('2024-01-01', periods=5, freq='5min'):
+                params = utils.restricted_run_code(script, {'interval_time': interval_time, 'action': 'auto'}, 'bad.py',
+                                                   compiled=compiled, errors=errors)
+                self.assertEqual(params['action'], 'auto')
+            self.assertEqual(errors.close()[0]['count'], 5)
+        self.assertIsNone(compiled['error'].__traceback__)
+
+    def test_cache_is_bounded(self):
+        with mock.patch.object(utils, 'SCRIPT_CACHE_SIZE', 3), mock.patch.object(utils, '_SCRIPT_CACHE', utils.OrderedDict()):
+            first = utils.compile_script("action = 'auto'\n")
+            for n in range(3):
+                utils.compile_script(f"action = 'auto'\nx = {n}\n")
+                utils.compile_script("action = 'auto'\n")
+            self.assertEqual(len(utils._SCRIPT_CACHE), 3)
+            # Recently used scripts stay cached
+            self.assertIs(utils.compile_script("action = 'auto'\n"), first)
+
+
+if __name__ == '__main__':
+    unittest.main()